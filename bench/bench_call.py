@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Measures the per-call overhead of the generated wrappers for a few tiny
+# kernels, with the default call ABI and with the lean one (the 'lean'
+# configuration option: intent(in) scalars passed by value, no error
+# arguments for wrappers that check nothing), e.g.
+#
+#   python bench/bench_call.py --number=1000000
+#
+# Both variants are built with fwrapc, so a Fortran compiler, Cython and
+# numpy are needed.  Each is timed in a fresh interpreter.
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fwrap.profiling import json
+
+KERNELS = '''\
+subroutine add(a, b, c)
+    implicit none
+    real(kind=8), intent(in) :: a, b
+    real(kind=8), intent(out) :: c
+    c = a + b
+end subroutine add
+
+function imax3(i, j, k)
+    implicit none
+    integer, intent(in) :: i, j, k
+    integer :: imax3
+    imax3 = max(i, j, k)
+end function imax3
+
+subroutine axpy(n, alpha, x, y)
+    implicit none
+    integer, intent(in) :: n
+    real(kind=8), intent(in) :: alpha
+    real(kind=8), dimension(n), intent(in) :: x
+    real(kind=8), dimension(n), intent(inout) :: y
+    y = y + alpha * x
+end subroutine axpy
+'''
+
+# name -> (setup, statement), run with the module imported as `mod`.
+CALLS = [
+    ('add', ('', 'mod.add(1.0, 2.0)')),
+    ('imax3', ('', 'mod.imax3(1, 3, 2)')),
+    ('axpy', ('import numpy as np; x = np.ones(4, order="F"); '
+              'y = np.zeros(4, order="F")',
+              'mod.axpy(4, 2.0, x, y)')),
+    ]
+
+VARIANTS = ('default', 'lean')
+
+def build(workdir, variant):
+    r"""Build the kernels' extension module for variant in workdir and
+    return the directory to import it from.
+    """
+    src = os.path.join(workdir, 'kernels.f90')
+    if not os.path.exists(src):
+        fh = open(src, 'w')
+        try:
+            fh.write(KERNELS)
+        finally:
+            fh.close()
+    name = 'kernels_%s' % variant
+    outdir = os.path.join(workdir, name)
+    cfg = os.path.join(workdir, '%s.cfg' % variant)
+    fh = open(cfg, 'w')
+    try:
+        fh.write('[fwrap]\nlean = %s\n' % (variant == 'lean'))
+    finally:
+        fh.close()
+    fwrapc = os.path.join(os.path.dirname(BENCH_DIR), 'fwrapc.py')
+    subprocess.check_call([sys.executable, fwrapc, 'configure', 'build',
+                           '--name=%s' % name, '--outdir=%s' % outdir,
+                           '--config=%s' % cfg, src, 'install'])
+    return name, outdir
+
+def time_calls(name, path, number):
+    r"""Return the time per call in seconds of each of CALLS."""
+    import timeit
+    sys.path.insert(0, path)
+    times = {}
+    for call, (setup, stmt) in CALLS:
+        timer = timeit.Timer(stmt, 'import %s as mod; %s' % (name, setup))
+        times[call] = min(timer.repeat(3, number)) / number
+    return times
+
+def report(results, stream=sys.stdout):
+    fmt = "%-8s %14s %14s %10s\n"
+    stream.write(fmt % ('call', 'default (ns)', 'lean (ns)', 'saved'))
+    for call, _ in CALLS:
+        default = results['default'][call] * 1e9
+        lean = results['lean'][call] * 1e9
+        stream.write(fmt % (call, '%.1f' % default, '%.1f' % lean,
+                            '%.0f%%' % (100.0 * (default - lean) /
+                                        max(default, 1e-9))))
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--number', type='int', default=1000000,
+                      help='calls per timing [default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='also write the results to FILE as JSON')
+    parser.add_option('--time', nargs=2, metavar='NAME PATH',
+                      help='time the module NAME in PATH and print the '
+                           'results as JSON (used internally)')
+    opts, args = parser.parse_args(argv)
+
+    if opts.time:
+        name, path = opts.time
+        sys.stdout.write('\n' + json.dumps(time_calls(name, path,
+                                                      opts.number)) + '\n')
+        return 0
+
+    workdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for variant in VARIANTS:
+            name, path = build(workdir, variant)
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                     '--number=%d' % opts.number,
+                                     '--time', name, path],
+                                    stdout=subprocess.PIPE)
+            out = proc.communicate()[0]
+            if proc.returncode:
+                raise RuntimeError("timing the %s calls failed" % variant)
+            results[variant] = json.loads(out.splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir)
+    report(results)
+    if opts.json:
+        fh = open(opts.json, 'w')
+        try:
+            json.dump(results, fh, indent=2)
+        finally:
+            fh.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
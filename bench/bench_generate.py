@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Measures how wrapper generation scales with the size and shape of the
+# Fortran sources, using the synthetic corpus from corpus.py.  Only fparser
+# is needed, no compilers.
+#
+# One parameter is swept over a list of values while the others are held
+# fixed, e.g.
+#
+#   python bench/bench_generate.py --sweep=procs --values=10,100,1000,10000
+#   python bench/bench_generate.py --sweep=rank --values=1,2,4,7 --procs=500
+#
+# Each point is run in a fresh interpreter so that its peak RSS is its own.
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import corpus
+from fwrap import fwrapper
+from fwrap.profiling import Profiler, json
+
+SWEEPS = ('procs', 'args', 'rank', 'dim_complexity')
+DEFAULT_VALUES = dict(procs='10,100,1000,10000',
+                      args='1,4,16,64',
+                      rank='1,2,4,7',
+                      dim_complexity='0,1,2,4,8')
+
+def run_one(opts):
+    r"""Generate wrappers for one corpus and return the measurements."""
+    workdir = tempfile.mkdtemp()
+    odir = os.getcwd()
+    try:
+        srcs = corpus.write_corpus(workdir, opts.procs, nfiles=opts.files,
+                                   nargs=opts.args, rank=opts.rank,
+                                   dim_complexity=opts.dim_complexity,
+                                   kind=opts.kind)
+        os.chdir(workdir)
+        prof = Profiler()
+        ast = prof.call('parse', fwrapper.parse, srcs, jobs=opts.jobs)
+        prof.call('generate', fwrapper.generate, ast, 'bench',
+                  profiler=prof)
+    finally:
+        os.chdir(odir)
+        shutil.rmtree(workdir)
+    phases = dict([(phase.name, phase) for phase in prof.phases
+                                       if phase.depth == 0])
+    return dict(procs=opts.procs, args=opts.args, rank=opts.rank,
+                dim_complexity=opts.dim_complexity,
+                parse=phases['parse'].wall,
+                generate=phases['generate'].wall,
+                peak_rss=phases['generate'].peak_rss,
+                profile=prof.as_dict())
+
+def run_point(opts, sweep, value):
+    args = [sys.executable, os.path.abspath(__file__), '--run-one',
+            '--procs=%d' % opts.procs, '--args=%d' % opts.args,
+            '--rank=%d' % opts.rank,
+            '--dim-complexity=%d' % opts.dim_complexity,
+            '--files=%d' % opts.files, '--jobs=%d' % opts.jobs,
+            '--kind=%s' % opts.kind,
+            '--%s=%d' % (sweep.replace('_', '-'), value)]
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise RuntimeError("benchmark point %s=%d failed" % (sweep, value))
+    # fparser may have chattered on stdout; the results are the last line.
+    return json.loads(out.splitlines()[-1])
+
+def report(sweep, results, stream=sys.stdout):
+    cols = [sweep, 'procs']
+    if sweep == 'procs':
+        cols = cols[:1]
+    header = cols + ['parse (s)', 'generate (s)', 'procs/s', 'peak rss (MB)']
+    fmt = '  '.join(['%14s'] * len(header))
+    stream.write(fmt % tuple(header) + '\n')
+    for res in results:
+        total = res['parse'] + res['generate']
+        rss = '-'
+        if res['peak_rss'] is not None:
+            rss = '%.1f' % (res['peak_rss'] / (1024.0 * 1024.0))
+        row = [res[col] for col in cols]
+        row += ['%.3f' % res['parse'], '%.3f' % res['generate'],
+                '%.1f' % (res['procs'] / max(total, 1e-9)), rss]
+        stream.write(fmt % tuple(row) + '\n')
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--sweep', type='choice', choices=SWEEPS,
+                      default='procs',
+                      help='parameter to vary, one of %s [default: %%default]'
+                           % ', '.join(SWEEPS))
+    parser.add_option('--values',
+                      help='comma separated values of the swept parameter')
+    parser.add_option('--procs', type='int', default=1000,
+                      help='number of procedures [default: %default]')
+    parser.add_option('--args', type='int', default=8,
+                      help='arguments per procedure [default: %default]')
+    parser.add_option('--rank', type='int', default=2,
+                      help='rank of the array arguments [default: %default]')
+    parser.add_option('--dim-complexity', dest='dim_complexity', type='int',
+                      default=1,
+                      help='nesting depth of the dimension expressions '
+                           '[default: %default]')
+    parser.add_option('--kind', type='choice', choices=corpus.KINDS,
+                      default='mixed',
+                      help='procedure shapes, one of %s [default: %%default]'
+                           % ', '.join(corpus.KINDS))
+    parser.add_option('--files', type='int', default=10,
+                      help='number of source files [default: %default]')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='processes used for parsing [default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='also write the results to FILE as JSON')
+    parser.add_option('--run-one', dest='run_one', action='store_true',
+                      help='run a single point and print its results as '
+                           'JSON (used internally)')
+    opts, args = parser.parse_args(argv)
+
+    if opts.run_one:
+        results = run_one(opts)
+        sys.stdout.write('\n' + json.dumps(results) + '\n')
+        return 0
+
+    values = opts.values or DEFAULT_VALUES[opts.sweep]
+    values = [int(value) for value in values.split(',')]
+    results = []
+    for value in values:
+        results.append(run_point(opts, opts.sweep, value))
+    report(opts.sweep, results)
+    if opts.json:
+        fh = open(opts.json, 'w')
+        try:
+            json.dump(results, fh, indent=2)
+        finally:
+            fh.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
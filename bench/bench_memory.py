@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Measures the memory held by the wrapper IR -- the pyf_iface procedures and
+# the fc_wrap and cy_wrap trees built on them -- for a synthetic corpus
+# (see corpus.py), e.g.
+#
+#   python bench/bench_memory.py --procs=5000
+#
+# The corpus is parsed in one interpreter and the procedures pickled; a
+# fresh interpreter then loads them and builds the wrapper trees, so that
+# fparser's garbage doesn't blur the numbers.  Both the growth in RSS and
+# the total size of the objects reachable from each tree (not counting
+# those already reachable from the previous one) are reported.
+
+import os
+import sys
+import gc
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+from cPickle import dump, load, HIGHEST_PROTOCOL
+from types import ModuleType, FunctionType, BuiltinFunctionType
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import corpus
+from fwrap import fwrapper, fc_wrap, cy_wrap
+from fwrap.profiling import json
+
+MB = 1024.0 * 1024.0
+_SKIP_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType)
+
+def current_rss():
+    r"""Return the current resident set size in bytes, or None."""
+    try:
+        fh = open('/proc/self/status')
+    except IOError:
+        return None
+    try:
+        for line in fh:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    finally:
+        fh.close()
+    return None
+
+def deep_size(root, seen):
+    r"""Return the number and total size of the objects reachable from root
+    that aren't in seen, adding them to it.  Classes, modules and functions
+    aren't followed.
+    """
+    count = size = 0
+    todo = [root]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP_TYPES):
+            continue
+        seen.add(id(obj))
+        count += 1
+        size += sys.getsizeof(obj)
+        todo.extend(gc.get_referents(obj))
+    return count, size
+
+def parse_stage(opts):
+    srcs = corpus.write_corpus(opts.workdir, opts.procs, nfiles=opts.files,
+                               nargs=opts.args, rank=opts.rank,
+                               dim_complexity=opts.dim_complexity)
+    ast = fwrapper.parse(srcs, jobs=opts.jobs)
+    fh = open(os.path.join(opts.workdir, 'ast.pickle'), 'wb')
+    try:
+        dump(ast, fh, HIGHEST_PROTOCOL)
+    finally:
+        fh.close()
+
+def measure_stage(opts):
+    gc.collect()
+    rss0 = current_rss()
+    fh = open(os.path.join(opts.workdir, 'ast.pickle'), 'rb')
+    try:
+        ast = load(fh)
+    finally:
+        fh.close()
+    fc_ast = fc_wrap.wrap_pyf_iface(ast)
+    cy_ast = cy_wrap.wrap_fc(fc_ast)
+    gc.collect()
+    rss1 = current_rss()
+    seen = set()
+    layers = []
+    for name, tree in (('pyf_iface', ast), ('fc_wrap', fc_ast),
+                       ('cy_wrap', cy_ast)):
+        count, size = deep_size(tree, seen)
+        layers.append(dict(layer=name, objects=count, size=size))
+    rss = None
+    if rss0 is not None and rss1 is not None:
+        rss = rss1 - rss0
+    return dict(procs=opts.procs, layers=layers, rss=rss)
+
+def report(res, stream=sys.stdout):
+    stream.write("%d procedures\n" % res['procs'])
+    fmt = "%-12s %12s %12s\n"
+    stream.write(fmt % ('layer', 'objects', 'size (MB)'))
+    tot_count = tot_size = 0
+    for layer in res['layers']:
+        stream.write(fmt % (layer['layer'], layer['objects'],
+                            '%.1f' % (layer['size'] / MB)))
+        tot_count += layer['objects']
+        tot_size += layer['size']
+    stream.write(fmt % ('total', tot_count, '%.1f' % (tot_size / MB)))
+    if res['rss'] is not None:
+        stream.write("RSS growth: %.1f MB\n" % (res['rss'] / MB))
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--procs', type='int', default=5000,
+                      help='number of procedures [default: %default]')
+    parser.add_option('--args', type='int', default=8,
+                      help='arguments per procedure [default: %default]')
+    parser.add_option('--rank', type='int', default=2,
+                      help='rank of the array arguments [default: %default]')
+    parser.add_option('--dim-complexity', dest='dim_complexity', type='int',
+                      default=1,
+                      help='nesting depth of the dimension expressions '
+                           '[default: %default]')
+    parser.add_option('--files', type='int', default=10,
+                      help='number of source files [default: %default]')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='processes used for parsing [default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='also write the results to FILE as JSON')
+    parser.add_option('--stage', type='choice', choices=('parse', 'measure'),
+                      help='run a single stage in WORKDIR (used internally)')
+    parser.add_option('--workdir',
+                      help='directory for --stage (used internally)')
+    opts, args = parser.parse_args(argv)
+
+    if opts.stage == 'parse':
+        parse_stage(opts)
+        return 0
+    elif opts.stage == 'measure':
+        sys.stdout.write('\n' + json.dumps(measure_stage(opts)) + '\n')
+        return 0
+
+    workdir = tempfile.mkdtemp()
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__),
+               '--workdir=%s' % workdir, '--procs=%d' % opts.procs,
+               '--args=%d' % opts.args, '--rank=%d' % opts.rank,
+               '--dim-complexity=%d' % opts.dim_complexity,
+               '--files=%d' % opts.files, '--jobs=%d' % opts.jobs]
+        subprocess.check_call(cmd + ['--stage=parse'])
+        proc = subprocess.Popen(cmd + ['--stage=measure'],
+                                stdout=subprocess.PIPE)
+        out = proc.communicate()[0]
+        if proc.returncode:
+            raise RuntimeError("measuring the wrapper trees failed")
+    finally:
+        shutil.rmtree(workdir)
+    res = json.loads(out.splitlines()[-1])
+    report(res)
+    if opts.json:
+        fh = open(opts.json, 'w')
+        try:
+            json.dump(res, fh, indent=2)
+        finally:
+            fh.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
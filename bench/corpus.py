@@ -0,0 +1,89 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Synthesizes Fortran sources for benchmarking wrapper generation.
+#
+# Two shapes of procedure are generated, after tests/compile/many_args.f90
+# (many scalar arguments) and examples/arrays/source.f90 (arrays of each
+# intrinsic type).  The array procedures take `rank` integer extents
+# n1, n2, ... and declare explicit-shape arrays whose dimensions are
+# expressions over the extents, nested `dim_complexity` deep, with every
+# fourth array assumed-shape instead.
+
+import os
+
+SCALAR_TYPES = ('integer', 'real', 'real(kind=8)', 'complex', 'logical')
+ARRAY_TYPES = SCALAR_TYPES + ('character(len=10)',)
+INTENTS = ('in', 'inout', 'out')
+DIM_OPS = ('%s+%s', '(%s)*%s', '%s-%s+1', '(%s)/2+%s')
+KINDS = ('mixed', 'scalar', 'array')
+
+def dim_expr(idx, rank, complexity):
+    expr = 'n%d' % (idx % rank + 1)
+    for level in range(complexity):
+        other = 'n%d' % ((idx + level + 1) % rank + 1)
+        expr = DIM_OPS[level % len(DIM_OPS)] % (expr, other)
+    return expr
+
+def scalar_proc(pnum, nargs):
+    names = ['a%d' % i for i in range(nargs)]
+    lines = ['subroutine sproc%d(%s)' % (pnum, ', '.join(names)),
+             '    implicit none']
+    for i, name in enumerate(names):
+        lines.append('    %s, intent(%s) :: %s' %
+                     (SCALAR_TYPES[i % len(SCALAR_TYPES)],
+                      INTENTS[i % len(INTENTS)], name))
+    lines.append('end subroutine sproc%d' % pnum)
+    return lines
+
+def array_proc(pnum, nargs, rank, dim_complexity):
+    extents = ['n%d' % (i + 1) for i in range(rank)]
+    names = ['a%d' % i for i in range(nargs)]
+    lines = ['subroutine aproc%d(%s)' % (pnum, ', '.join(extents + names)),
+             '    implicit none',
+             '    integer, intent(in) :: %s' % ', '.join(extents)]
+    for i, name in enumerate(names):
+        if i % 4 == 3:
+            dims = [':'] * rank
+        else:
+            dims = [dim_expr(i + j, rank, dim_complexity)
+                        for j in range(rank)]
+        lines.append('    %s, dimension(%s), intent(%s) :: %s' %
+                     (ARRAY_TYPES[i % len(ARRAY_TYPES)], ', '.join(dims),
+                      INTENTS[i % len(INTENTS)], name))
+    lines.append('end subroutine aproc%d' % pnum)
+    return lines
+
+def make_source(first, nprocs, nargs=8, rank=2, dim_complexity=1,
+                kind='mixed'):
+    r"""Return the source of nprocs procedures numbered from first."""
+    lines = []
+    for pnum in range(first, first + nprocs):
+        if kind == 'scalar' or (kind == 'mixed' and pnum % 2 == 0):
+            lines.extend(scalar_proc(pnum, nargs))
+        else:
+            lines.extend(array_proc(pnum, nargs, rank, dim_complexity))
+    return '\n'.join(lines) + '\n'
+
+def write_corpus(dirname, nprocs, nfiles=1, **kwargs):
+    r"""Write nprocs procedures spread over nfiles sources in dirname and
+    return the list of paths.  Keyword arguments are passed on to
+    make_source.
+    """
+    nfiles = max(1, min(nfiles, nprocs))
+    size, extra = divmod(nprocs, nfiles)
+    paths = []
+    first = 0
+    for idx in range(nfiles):
+        count = size + int(idx < extra)
+        path = os.path.join(dirname, 'corpus%d.f90' % idx)
+        fh = open(path, 'w')
+        try:
+            fh.write(make_source(first, count, **kwargs))
+        finally:
+            fh.close()
+        paths.append(path)
+        first += count
+    return paths
@@ -0,0 +1,179 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Options that control the generated wrappers.
+#
+# An option can be set for all procedures, for one procedure or for one
+# argument of a procedure; the most specific setting wins.  Procedure and
+# argument names are the Fortran ones, and case-insensitive.  A
+# configuration can be read from a file like
+#
+#   [fwrap]
+#   strict = true
+#
+#   [proc:copy_in]
+#   strict = false
+#
+#   [arg:solve.rhs]
+#   strict = false
+
+from ConfigParser import RawConfigParser
+
+FWRAP_SECTION = 'fwrap'
+PROC_PREFIX = 'proc:'
+ARG_PREFIX = 'arg:'
+
+_BOOLEANS = {'1' : True, 'yes' : True, 'true' : True, 'on' : True,
+             '0' : False, 'no' : False, 'false' : False, 'off' : False}
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        return _BOOLEANS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError("not a boolean: %r" % value)
+
+def _choice(*choices):
+    def convert(value):
+        value = str(value).strip().lower()
+        if value not in choices:
+            raise ValueError("%r is not one of %s" %
+                             (value, ', '.join(choices)))
+        return value
+    return convert
+
+COPY_ACTIONS = ('ignore', 'warn', 'error')
+
+def _nogil(value):
+    if str(value).strip().lower() == 'auto':
+        return 'auto'
+    return _boolean(value)
+
+def _batched(value):
+    if str(value).strip().lower() == 'openmp':
+        return 'openmp'
+    return _boolean(value)
+
+# name -> (default, converter)
+OPTIONS = {
+    # Raise ValueError rather than copy an array argument that isn't an
+    # aligned, Fortran contiguous array of the exact dtype in native byte
+    # order.
+    'strict' : (False, _boolean),
+    # What to do, besides counting it, when an array argument is copied or
+    # cast on the way in; see COPY_ACTIONS.  For intent(inout) and
+    # intent(out) arrays, whose copies don't write through to the array
+    # passed in, the stricter of on_copy and on_inout_copy applies.
+    'on_copy' : ('ignore', _choice(*COPY_ACTIONS)),
+    'on_inout_copy' : ('ignore', _choice(*COPY_ACTIONS)),
+    # Release the GIL while the Fortran procedure runs, which must then be
+    # safe to call from several threads.  With 'auto', procedures that
+    # fwrap_parse found to use shared state (COMMON blocks, modules, SAVEd
+    # variables, I/O) hold a lock for each piece of it during the call.
+    # Set globally or per procedure.
+    'nogil' : (False, _nogil),
+    # Also generate a <proc>_batched wrapper for subroutines with array
+    # arguments, taking arrays with an extra trailing dimension and calling
+    # the subroutine for each index of it from a Fortran loop.  With
+    # 'openmp' the loop is an OpenMP parallel do, for procedures that don't
+    # use shared state; compile with OpenMP enabled for it to take effect.
+    # Set globally or per procedure.
+    'batched' : (False, _batched),
+    # Pass intent(in) integer and real scalars to the C wrapper by value,
+    # and leave out the error flag and message, and the Cython code that
+    # checks them, when the C wrapper checks none of the arguments.  Set
+    # globally or per procedure.
+    'lean' : (False, _boolean),
+    # Pass assumed-shape integer, real and complex arrays with their
+    # strides, so that a strided view of an array reaches the Fortran
+    # procedure without a copy when its strides fit a Fortran array section
+    # (see fc_wrap.StridedArrayArgWrapper).  Set globally, per procedure or
+    # per argument.
+    'strided' : (False, _boolean),
+    # Pass array arguments in as the transpose of the Fortran array, and
+    # return intent(out) and intent(inout) ones as their transpose, so that
+    # a C contiguous array with the extents reversed is used without a copy.
+    # Meant to be set per argument; the docstrings mark the arguments that
+    # are transposed.
+    'transpose' : (False, _boolean),
+    }
+
+
+class Configuration(object):
+
+    def __init__(self, **options):
+        self._global = {}
+        self._procs = {}
+        self._args = {}
+        for option, value in options.items():
+            self.set(option, value)
+
+    def _check(self, option, value):
+        try:
+            convert = OPTIONS[option][1]
+        except KeyError:
+            raise ValueError("unknown option %r" % option)
+        return convert(value)
+
+    def set(self, option, value, proc=None, arg=None):
+        r"""Set option to value for all procedures, for the procedure proc
+        or, if arg is given too, for its argument arg.
+        """
+        value = self._check(option, value)
+        if arg is not None:
+            if proc is None:
+                raise ValueError("an argument option needs a procedure")
+            scope = self._args.setdefault((proc.lower(), arg.lower()), {})
+        elif proc is not None:
+            scope = self._procs.setdefault(proc.lower(), {})
+        else:
+            scope = self._global
+        scope[option] = value
+
+    def get(self, option, proc=None, arg=None):
+        r"""Return the value of option for the argument arg of the
+        procedure proc, falling back to the procedure's setting, the global
+        one and finally the default.
+        """
+        if proc is not None:
+            proc = proc.lower()
+            if arg is not None:
+                scope = self._args.get((proc, arg.lower()), {})
+                if option in scope:
+                    return scope[option]
+            scope = self._procs.get(proc, {})
+            if option in scope:
+                return scope[option]
+        if option in self._global:
+            return self._global[option]
+        return OPTIONS[option][0]
+
+    def read(self, fname):
+        r"""Read the settings in the file fname; see the module comments
+        for its format.
+        """
+        parser = RawConfigParser()
+        if not parser.read(fname):
+            raise IOError("can't read configuration file %s" % fname)
+        for section in parser.sections():
+            proc = arg = None
+            if section.startswith(ARG_PREFIX):
+                try:
+                    proc, arg = section[len(ARG_PREFIX):].split('.')
+                except ValueError:
+                    raise ValueError("%s: section [%s] should be "
+                                     "[arg:procedure.argument]" %
+                                     (fname, section))
+            elif section.startswith(PROC_PREFIX):
+                proc = section[len(PROC_PREFIX):]
+            elif section != FWRAP_SECTION:
+                raise ValueError("%s: unknown section [%s]" %
+                                 (fname, section))
+            for option, value in parser.items(section):
+                try:
+                    self.set(option, value, proc=proc, arg=arg)
+                except ValueError, e:
+                    raise ValueError("%s: [%s] %s" % (fname, section, e))
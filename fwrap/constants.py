@@ -16,6 +16,9 @@ FC_F_TMPL = "%s_fc.f90"
 
 CY_PXD_TMPL = "%s.pxd"
 CY_PYX_TMPL = "%s.pyx"
+CY_SHARD_TMPL = "%s_s%d"
+CY_COMMON_TMPL = "%s_common"
+PY_MOD_TMPL = "%s.py"
 
 GENCONFIG_SRC = "genconfig.f90"
 TYPE_SPECS_SRC = "fwrap_type_specs.in"
@@ -3,18 +3,23 @@
 # All rights reserved. See LICENSE.txt.
 #------------------------------------------------------------------------------
 
+import re
+
 from fwrap import pyf_iface
 from fwrap import constants
 from fwrap.code import CodeBuffer
+from fwrap.configuration import Configuration, COPY_ACTIONS
 
 from fwrap.pyf_iface import _py_kw_mangler
 
 
 
-def wrap_fc(ast):
+def wrap_fc(ast, cfg=None):
+    if cfg is None:
+        cfg = Configuration()
     ret = []
     for proc in ast:
-        ret.append(ProcWrapper(wrapped=proc))
+        ret.append(ProcWrapper(wrapped=proc, cfg=cfg))
     return ret
 
 def generate_cy_pxd(ast, fc_pxd_name, buf):
@@ -32,14 +37,503 @@ def gen_cdef_extern_decls(buf):
     for dtype in pyf_iface.intrinsic_types:
         buf.putlines(dtype.cdef_extern_decls)
 
-def generate_cy_pyx(ast, name, buf):
+def generate_cy_pyx(ast, name, buf, common=None):
+    r"""Generate the extension module name wrapping the procedures in ast.
+
+    The shards of a module take the classes they share from the Python
+    module common (see generate_common_mod) rather than defining their own.
+    """
     put_cymod_docstring(ast, name, buf)
     buf.putln("np.import_array()")
     buf.putln("include 'fwrap_ktp.pxi'")
     gen_cimport_decls(buf)
     gen_cdef_extern_decls(buf)
+    if common is None:
+        buf.putlines(_copy_warning_code)
+        buf.putlines(_parallel_map_error_code)
+    else:
+        buf.putempty()
+        buf.putln("from %s import %s" % (common, ", ".join(COMMON_ATTRS)))
+    buf.putlines(_copy_stats_code)
+    buf.putlines(_parallel_map_code)
+    put_parallel_specs(ast, buf)
+    buf.putlines(_idiv_code)
+    if [proc for proc in ast if proc.locks]:
+        if common is None:
+            locks = "fw_locks__ = {}"
+        else:
+            locks = "from %s import fw_locks as fw_locks__" % common
+        buf.putlines(_locks_code % {'locks' : locks})
+    if [proc for proc in ast if proc.strided_args()]:
+        buf.putlines(_strides_code)
+    if [proc for proc in ast if proc.ufunc]:
+        buf.putlines(_ufunc_code)
     for proc in ast:
         proc.generate_wrapper(buf)
+        if proc.ufunc:
+            proc.ufunc.generate_wrapper(buf)
+
+# The parts of NumPy's ufunc C API that UfuncWrapper uses.
+_ufunc_code = \
+'''
+cdef extern from "numpy/ufuncobject.h":
+    ctypedef void (*PyUFuncGenericFunction)(char **, np.npy_intp *,
+                                           np.npy_intp *, void *)
+    object PyUFunc_FromFuncAndData(PyUFuncGenericFunction *, void **, char *,
+                                   int, int, int, int, char *, char *, int)
+    void import_ufunc()
+    enum:
+        PyUFunc_None
+
+import_ufunc()
+'''
+
+# Every module counts the array arguments its wrappers had to copy or cast;
+# see _CyArrayArgWrapper.pre_call_code.
+_copy_warning_code = \
+'''
+class CopyWarning(RuntimeWarning):
+    """Issued when an array argument has to be copied or cast."""
+'''
+
+_copy_stats_code = \
+'''
+import warnings
+
+_copy_stats = {}
+
+def copy_stats():
+    """copy_stats() -> {(procedure, argument) : (copies, bytes)}
+
+    How many times, and how many bytes in all, each array argument was
+    copied or cast on the way in since the module was imported or
+    reset_copy_stats() last called.
+    """
+    return dict(_copy_stats)
+
+def reset_copy_stats():
+    """Forget the copies counted so far."""
+    _copy_stats.clear()
+
+cdef fw_record_copy__(proc, arg, np.npy_intp nbytes, action):
+    copies, total = _copy_stats.get((proc, arg), (0, 0))
+    _copy_stats[proc, arg] = (copies + 1, total + nbytes)
+    if action == 'ignore':
+        return
+    msg = ("array argument '%s' of '%s' was copied (%d bytes)" %
+           (arg, proc, nbytes))
+    if action == 'error':
+        raise ValueError(msg)
+    warnings.warn(msg, CopyWarning)
+'''
+
+# parallel_map() runs a procedure on many argument tuples from a pool of
+# threads.  Only the calls to procedures that release the GIL, and are
+# thread safe or guarded by locks, are run concurrently; see
+# ProcWrapper.parallel_spec.
+_parallel_map_error_code = \
+'''
+class ParallelMapError(RuntimeError):
+    """Raised by parallel_map() when some of the calls failed.
+
+    errors lists the (index, exception) pairs of the failed calls, and
+    results the results of all the calls, None for those that failed.
+    """
+
+    def __init__(self, errors, results):
+        RuntimeError.__init__(self, "%d of %d calls failed, the first "
+                              "(call %d) with: %s" %
+                              (len(errors), len(results),
+                               errors[0][0], errors[0][1]))
+        self.errors = errors
+        self.results = results
+'''
+
+_parallel_map_code = \
+'''
+import threading
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+cdef fw_prepare_args__(proc, arrays, args):
+    cdef np.ndarray arr
+    args = list(args)
+    for pos, name, dtenum, ndim, action in arrays:
+        if pos >= len(args) or args[pos] is None:
+            continue
+        arr = np.PyArray_FROMANY(args[pos], dtenum, ndim, ndim,
+                                 np.NPY_F_CONTIGUOUS)
+        if arr is not args[pos]:
+            fw_record_copy__(proc, name, np.PyArray_NBYTES(arr), action)
+        args[pos] = arr
+    return args
+
+def _parallel_worker(proc, calls, lock, results, errors):
+    while True:
+        lock.acquire()
+        try:
+            if not calls:
+                return
+            idx, args = calls.pop()
+        finally:
+            lock.release()
+        try:
+            results[idx] = proc(*args)
+        except Exception, e:
+            errors.append((idx, e))
+
+def parallel_map(proc, argtuples, nthreads=None):
+    """parallel_map(proc, argtuples, nthreads=None) -> list
+
+    Call the procedure proc of this module with each tuple of arguments in
+    argtuples, from nthreads threads (by default, one per CPU), and return
+    the list of results.  The array arguments are all converted before the
+    first call.  Procedures that don't release the GIL, or that aren't
+    thread safe, are called one at a time.  If some calls fail, the others
+    still run, and a ParallelMapError is raised.
+    """
+    name = getattr(proc, '__name__', None)
+    if name not in _parallel_specs:
+        raise ValueError("%r is not a procedure of this module" % (proc,))
+    arrays, concurrent = _parallel_specs[name]
+    calls = [(idx, fw_prepare_args__(name, arrays, args))
+                for idx, args in enumerate(argtuples)]
+    calls.reverse()
+    results = [None] * len(calls)
+    errors = []
+    lock = threading.Lock()
+    if nthreads is None:
+        nthreads = _cpu_count()
+    if not concurrent:
+        nthreads = 1
+    nthreads = max(1, min(nthreads, len(calls)))
+    if nthreads == 1:
+        _parallel_worker(proc, calls, lock, results, errors)
+    else:
+        threads = [threading.Thread(target=_parallel_worker,
+                                    args=(proc, calls, lock, results, errors))
+                    for idx in range(nthreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if errors:
+        errors.sort()
+        raise ParallelMapError(errors, results)
+    return results
+'''
+
+def put_parallel_specs(ast, buf):
+    r"""Put the table parallel_map() looks procedures up in."""
+    buf.putln("_parallel_specs = {")
+    buf.indent()
+    for proc in ast:
+        arrays, concurrent = proc.parallel_spec()
+        buf.putln("%r : ((%s), %r)," %
+                  (proc.name, ''.join(["(%d, %r, %s, %d, %r), " % array
+                                        for array in arrays]), concurrent))
+    buf.dedent()
+    buf.putln("}")
+
+# The shapes of arrays allocated for intent(out) arguments, and checked for
+# direct calls, use Fortran's integer division; see alloc_shape.
+_idiv_code = \
+'''
+cdef inline np.npy_intp fw_idiv__(np.npy_intp a, np.npy_intp b) except? -1:
+    cdef np.npy_intp q = a // b
+    if q < 0 and q * b != a:
+        q += 1
+    return q
+'''
+
+# The locks taken around calls to procedures that use shared Fortran state
+# (see ProcWrapper.locks), by the name of the state.  The shards of a module
+# share the state, so they take the locks from its common module.
+_locks_code = \
+'''
+import threading
+
+%(locks)s
+
+cdef fw_acquire__(names):
+    for name in names:
+        fw_locks__.setdefault(name, threading.Lock()).acquire()
+
+cdef fw_release__(names):
+    for name in reversed(names):
+        fw_locks__[name].release()
+'''
+
+# Strided views of arrays are passed as they are to the assumed-shape array
+# arguments that take their strides, if the strides fit a Fortran array
+# section; see fc_wrap.StridedArrayArgWrapper and CyStridedArrayArgWrapper.
+_strides_code = \
+'''
+cdef bint fw_get_strides__(object obj, int typenum, int ndim,
+                           fwi_npy_intp_t *strides) except -1:
+    cdef np.ndarray arr
+    cdef np.npy_intp extent, stride, itemsize, span = 1
+    cdef int idx
+    if not (np.PyArray_Check(obj) and np.PyArray_TYPE(obj) == typenum and
+            np.PyArray_NDIM(obj) == ndim and
+            np.PyArray_ISNOTSWAPPED(obj) and
+            np.PyArray_CHKFLAGS(obj, np.NPY_ALIGNED)):
+        return False
+    arr = obj
+    itemsize = np.PyArray_ITEMSIZE(arr)
+    for idx in range(ndim):
+        extent = np.PyArray_DIM(arr, idx)
+        stride = np.PyArray_STRIDE(arr, idx)
+        if extent <= 1:
+            # any stride will do.
+            extent = 1
+            stride = span
+        elif stride <= 0 or stride % itemsize:
+            return False
+        else:
+            stride = stride // itemsize
+            if stride < span or (idx > 1 and stride % strides[idx-1]):
+                return False
+        strides[idx] = stride
+        if idx == 0:
+            span = (extent - 1) * stride + 1
+        else:
+            span = extent * stride
+    return True
+'''
+
+def shard_ast(ast, nshards):
+    r"""Split ast into nshards contiguous lists of procedures whose lengths
+    differ by at most one; if there are fewer procedures than shards, the
+    last shards are empty.
+    """
+    nshards = max(1, nshards)
+    size, extra = divmod(len(ast), nshards)
+    shards = []
+    start = 0
+    for idx in range(nshards):
+        stop = start + size + int(idx < extra)
+        shards.append(ast[start:stop])
+        start = stop
+    return shards
+
+def group_ast_by_size(ast, size):
+    r"""Split ast into contiguous lists of at most size procedures."""
+    size = max(1, size)
+    return [ast[start:start+size] for start in range(0, len(ast), size)]
+
+def group_ast_by_source(ast):
+    r"""Split ast into one list of procedures per Fortran source file, in
+    the order the sources were first seen.
+    """
+    groups = []
+    by_source = {}
+    for proc in ast:
+        source = proc.wrapped.wrapped.source
+        if source not in by_source:
+            by_source[source] = []
+            groups.append(by_source[source])
+        by_source[source].append(proc)
+    return groups
+
+# The classes every shard of a module uses, defined once in the module
+# generate_common_mod generates so that e.g. a warnings filter on the
+# package's CopyWarning applies to the procedures of all the shards.
+COMMON_ATTRS = ['CopyWarning', 'ParallelMapError']
+
+def generate_common_mod(name, buf):
+    r"""Generate the Python module with the classes shared by the shards of
+    the module name.
+    """
+    buf.putln('"""')
+    buf.putln("The classes shared by the extension modules of %s." % name)
+    buf.putln('"""')
+    buf.putlines(_copy_warning_code)
+    buf.putlines(_parallel_map_error_code)
+    buf.putlines(_common_locks_code)
+
+_common_locks_code = \
+'''
+# The locks the shards take around calls to procedures that use shared
+# Fortran state; see cy_wrap._locks_code.
+fw_locks = {}
+'''
+
+SHARDS_MARKER = "# fwrap shards:"
+
+def generate_shard_mod(shards, shard_names, name, buf, lazy=False):
+    r"""Generate the Python module that re-exports the procedures of the
+    sharded extension modules, so `name` can be imported as if it were a
+    single extension module.
+
+    If lazy is True, a shard is only imported the first time one of its
+    procedures (or, for the first shard, a datatype) is looked up on the
+    module.
+    """
+    from fwrap.gen_config import all_dtypes
+    # fwrapper reads the shards back from this line, to remove those that
+    # are no longer generated.
+    buf.putln("%s %s" % (SHARDS_MARKER, " ".join(shard_names)))
+    all_procs = []
+    for shard in shards:
+        all_procs.extend(shard)
+    put_cymod_docstring(all_procs, name, buf)
+    # Every shard includes fwrap_ktp.pxi, so any of them will do for the
+    # datatypes.
+    dtype_names = sorted([dt.py_type_name() for dt in all_dtypes(all_procs)])
+    _put_from_import(constants.CY_COMMON_TMPL % name, COMMON_ATTRS, buf)
+    if lazy:
+        _put_lazy_loader(shards, shard_names, dtype_names, buf)
+    else:
+        for shard, shard_name in zip(shards, shard_names):
+            names = []
+            for proc in shard:
+                names.extend(proc.exported_names())
+            _put_from_import(shard_name, names, buf)
+        _put_from_import(shard_names[0], dtype_names, buf)
+        buf.putln("import %s" % ", ".join(shard_names))
+        buf.putln("_shard_mods = [%s]" % ", ".join(shard_names))
+        buf.putlines(_shard_copy_stats_code)
+        buf.putlines(_shard_parallel_map_code)
+
+_shard_copy_stats_code = \
+'''
+def copy_stats():
+    """copy_stats() -> {(procedure, argument) : (copies, bytes)}
+
+    How many times, and how many bytes in all, each array argument was
+    copied or cast on the way in since the module was imported or
+    reset_copy_stats() last called.
+    """
+    stats = {}
+    for mod in _shard_mods:
+        stats.update(mod.copy_stats())
+    return stats
+
+def reset_copy_stats():
+    """Forget the copies counted so far."""
+    for mod in _shard_mods:
+        mod.reset_copy_stats()
+'''
+
+_shard_parallel_map_code = \
+'''
+def parallel_map(proc, argtuples, nthreads=None):
+    """parallel_map(proc, argtuples, nthreads=None) -> list
+
+    Call the procedure proc of this module with each tuple of arguments in
+    argtuples, from nthreads threads (by default, one per CPU), and return
+    the list of results.  The array arguments are all converted before the
+    first call.  Procedures that don't release the GIL, or that aren't
+    thread safe, are called one at a time.  If some calls fail, the others
+    still run, and a ParallelMapError is raised.
+    """
+    name = getattr(proc, '__name__', None)
+    for mod in _shard_mods:
+        if getattr(mod, name or '', None) is proc:
+            return mod.parallel_map(proc, argtuples, nthreads)
+    raise ValueError("%r is not a procedure of this module" % (proc,))
+'''
+
+def _put_from_import(modname, names, buf):
+    if not names:
+        # an empty shard.
+        return
+    buf.putln("from %s import (" % modname)
+    buf.indent()
+    for name in names:
+        buf.putln("%s," % name)
+    buf.putln(")")
+    buf.dedent()
+
+def _put_lazy_loader(shards, shard_names, dtype_names, buf):
+    buf.putln("import os")
+    buf.putln("import sys")
+    buf.putln("from types import ModuleType")
+    buf.putempty()
+    buf.putln("_shards = [")
+    buf.indent()
+    for idx, (shard, shard_name) in enumerate(zip(shards, shard_names)):
+        attrs = []
+        for proc in shard:
+            attrs.extend(proc.exported_names())
+        if not idx:
+            attrs += dtype_names
+        buf.putln("(%r, (" % shard_name)
+        buf.indent()
+        for attr in attrs:
+            buf.putln("%r," % attr)
+        buf.putln(")),")
+        buf.dedent()
+    buf.putln("]")
+    buf.dedent()
+    buf.putlines(_shard_copy_stats_code)
+    buf.putlines(_shard_parallel_map_code)
+    buf.putlines(_lazy_loader_code % {'EAGER_VAR' : EAGER_IMPORT_VAR,
+                                      'COMMON_ATTRS' : COMMON_ATTRS})
+
+EAGER_IMPORT_VAR = 'FWRAP_EAGER_IMPORT'
+
+_lazy_loader_code = \
+'''
+_shard_attrs = dict(_shards)
+_attr_shard = dict([(attr, shard) for shard, attrs in _shards
+                                   for attr in attrs])
+
+__all__ = sorted(_attr_shard.keys() + %(COMMON_ATTRS)r)
+
+# The shards imported so far, for copy_stats().
+_shard_mods = []
+
+def _load_shard(shard):
+    mod = __import__(shard, globals(), {}, [])
+    for attr in _shard_attrs[shard]:
+        setattr(_module, attr, getattr(mod, attr))
+    if mod not in _shard_mods:
+        _shard_mods.append(mod)
+
+def load_all():
+    """Import all the extension modules now rather than on first use."""
+    for shard, attrs in _shards:
+        _load_shard(shard)
+
+class _LazyModule(ModuleType):
+
+    def __getattr__(self, attr):
+        try:
+            shard = _attr_shard[attr]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '%%s'"
+                                 %% attr)
+        _load_shard(shard)
+        return ModuleType.__getattribute__(self, attr)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(__all__))
+
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(
+        __file__=__file__,
+        __all__=__all__,
+        load_all=load_all,
+        copy_stats=copy_stats,
+        reset_copy_stats=reset_copy_stats,
+        parallel_map=parallel_map,
+        CopyWarning=CopyWarning,
+        ParallelMapError=ParallelMapError,
+        # The functions above use this module's globals, which are cleared
+        # if it is garbage collected.
+        _lazy_globals=sys.modules[__name__])
+sys.modules[__name__] = _module
+
+if os.environ.get(%(EAGER_VAR)r):
+    load_all()
+'''
 
 def put_cymod_docstring(ast, modname, buf):
     dstring = get_cymod_docstring(ast, modname)
@@ -62,7 +556,10 @@ For usage information see the function docstrings.
     dstring += ["Functions",
                 "---------"]
     # Functions
-    names = sorted(["%s(...)" % proc.name for proc in ast])
+    names = []
+    for proc in ast:
+        names.extend(["%s(...)" % name for name in proc.exported_names()])
+    names.sort()
     dstring += names
 
     dstring += [""]
@@ -84,11 +581,15 @@ def CyArgWrapper(arg):
         return _CyCmplxArg(arg)
     elif isinstance(arg.dtype, pyf_iface.CharacterType):
         return _CyCharArg(arg)
+    elif isinstance(arg.dtype, pyf_iface.DerivedType):
+        return _CyDerivedArg(arg)
     return _CyArgWrapper(arg)
 
 
 class _CyArgWrapper(object):
 
+    __slots__ = ('arg', 'name', 'intern_name', 'cy_dtype_name')
+
     is_array = False
 
     def __init__(self, arg):
@@ -120,6 +621,10 @@ class _CyArgWrapper(object):
         return []
 
     def call_arg_list(self):
+        if self.arg.returned:
+            return []
+        if self.arg.by_value:
+            return [self.name]
         return ["&%s" % self.name]
 
     def post_call_code(self):
@@ -159,6 +664,8 @@ class _CyArgWrapper(object):
 
 class _CyCharArg(_CyArgWrapper):
 
+    __slots__ = ('intern_len_name', 'intern_buf_name')
+
     def __init__(self, arg):
         super(_CyCharArg, self).__init__(arg)
         self.intern_name = 'fw_%s' % self.name
@@ -180,11 +687,9 @@ class _CyCharArg(_CyArgWrapper):
         return []
 
     def intern_declarations(self):
-        ret = ['cdef %s %s' % (self.cy_dtype_name, self.intern_name),
-                'cdef fwi_npy_intp_t %s' % self.intern_len_name]
-        if self.arg.intent in ('out', 'inout', None):
-            ret.append('cdef char *%s' % self.intern_buf_name)
-        return ret
+        return ['cdef %s %s' % (self.cy_dtype_name, self.intern_name),
+                'cdef fwi_npy_intp_t %s' % self.intern_len_name,
+                'cdef char *%s' % self.intern_buf_name]
 
     def get_len(self):
         return self.arg.dtype.len
@@ -200,8 +705,11 @@ class _CyCharArg(_CyArgWrapper):
         return len_str
 
     def _in_pre_call_code(self):
+        # The buffer is taken here so that the call itself needs no Python
+        # objects, and can be made without the GIL.
         return ['%s = len(%s)' % (self.intern_len_name, self.name),
-                '%s = %s' % (self.intern_name, self.name)]
+                '%s = %s' % (self.intern_name, self.name),
+                '%s = <char*>%s' % (self.intern_buf_name, self.intern_name)]
 
     def _out_pre_call_code(self):
         len_str = self._len_str()
@@ -228,11 +736,7 @@ class _CyCharArg(_CyArgWrapper):
                     (self.intern_name, self.intern_len_name)
 
     def call_arg_list(self):
-        if self.arg.intent == 'in':
-            return ['&%s' % self.intern_len_name,
-                    '<char*>%s' % self.intern_name]
-        else:
-            return ['&%s' % self.intern_len_name, self.intern_buf_name]
+        return ['&%s' % self.intern_len_name, self.intern_buf_name]
 
     def return_tuple_list(self):
         if self.arg.intent in ('out', 'inout', None):
@@ -254,8 +758,21 @@ class _CyCharArg(_CyArgWrapper):
             return super(_CyCharArg, self).in_dstring()
 
 
+class _CyDerivedArg(_CyArgWrapper):
+
+    # A scalar of a bind(c) derived type, which Cython converts from and to
+    # a dict of its components.
+
+    __slots__ = ()
+
+    def _get_py_dtype_name(self):
+        return 'dict of %s fields' % self.arg.dtype.py_type_name()
+
+
 class _CyErrStrArg(object):
 
+    __slots__ = ('arg', 'name', 'intern_name')
+
     def __init__(self, arg):
         self.arg = arg
         self.name = _py_kw_mangler(self.arg.name)
@@ -298,6 +815,8 @@ class _CyErrStrArg(object):
 
 class _CyCmplxArg(_CyArgWrapper):
 
+    __slots__ = ()
+
     def __init__(self, arg):
         super(_CyCmplxArg, self).__init__(arg)
         self.intern_name = 'fw_%s' % self.arg.name
@@ -310,60 +829,279 @@ class _CyCmplxArg(_CyArgWrapper):
         return ['&%s' % self.name]
 
 
-def CyArrayArgWrapper(arg):
+def CyArrayArgWrapper(arg, proc_name=None, strict=False, on_copy='ignore',
+                      shape=None, check_shape=None, transpose=False):
     if arg.dtype.type == 'character':
         return CyCharArrayArgWrapper(arg)
-    return _CyArrayArgWrapper(arg)
+    if arg.dtype.type == 'type':
+        return CyDerivedArrayArgWrapper(arg, proc_name=proc_name,
+                                        strict=strict, on_copy=on_copy,
+                                        shape=shape, transpose=transpose)
+    if arg.module_array:
+        return CyModuleArrayArgWrapper(arg)
+    if arg.strided:
+        return CyStridedArrayArgWrapper(arg, proc_name=proc_name,
+                                        strict=strict, on_copy=on_copy,
+                                        transpose=transpose)
+    return _CyArrayArgWrapper(arg, proc_name=proc_name, strict=strict,
+                              on_copy=on_copy, shape=shape,
+                              check_shape=check_shape, transpose=transpose)
+
+_sub_names = re.compile(r'(?<![\w%])[a-z][a-z0-9_]*').sub
+
+def alloc_shape(dimension, scalar_names):
+    r"""Return Cython expressions for the extents of dimension, or None if
+    they can't all be computed from the integer scalar arguments named in
+    scalar_names (say, because they involve function calls or parameters).
+    """
+    shape = []
+    for dim in dimension:
+        if not dim.is_explicit_shape:
+            return None
+        for sie in dim.spec:
+            if sie.funcnames or not sie.names <= scalar_names:
+                return None
+        expr = _sub_names(lambda m: _py_kw_mangler(m.group()), dim.sizeexpr)
+        expr = _IntExpr(expr).convert()
+        if expr is None:
+            return None
+        shape.append(expr)
+    return shape
+
+class _IntExpr(object):
+
+    # Rewrites a Fortran integer expression of names and literals for
+    # Cython, with each division a call to fw_idiv__: Fortran's integer
+    # division truncates toward zero, where // rounds down.
+
+    _tokens = re.compile(r'\s*(\*\*|[-+*/()]|[a-z_][a-z0-9_]*|[0-9]+)', re.I)
+
+    def __init__(self, expr):
+        self.tokens = []
+        pos = 0
+        expr = expr.rstrip()
+        while pos < len(expr):
+            match = self._tokens.match(expr, pos)
+            if match is None:
+                self.tokens = None
+                return
+            self.tokens.append(match.group(1))
+            pos = match.end()
+        self.pos = 0
+
+    def convert(self):
+        r"""Return the Cython expression, or None if the expression isn't
+        one of names and integer literals.
+        """
+        if not self.tokens:
+            return None
+        try:
+            expr = self._sum()
+        except ValueError:
+            return None
+        if self.pos != len(self.tokens):
+            return None
+        return expr
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def _next(self):
+        tok = self._peek()
+        if tok is None:
+            raise ValueError("unexpected end of expression")
+        self.pos += 1
+        return tok
+
+    def _sum(self):
+        # A leading sign applies to the whole first term, as in Fortran.
+        if self._peek() in ('+', '-'):
+            op = self._next()
+            expr = '%s%s' % (op, self._product())
+        else:
+            expr = self._product()
+        while self._peek() in ('+', '-'):
+            op = self._next()
+            expr = '%s %s %s' % (expr, op, self._product())
+        return expr
+
+    def _product(self):
+        expr = self._factor()
+        while self._peek() in ('*', '/'):
+            if self._next() == '/':
+                expr = 'fw_idiv__(%s, %s)' % (expr, self._factor())
+            else:
+                expr = '%s * %s' % (expr, self._factor())
+        return expr
+
+    def _factor(self):
+        if self._peek() in ('+', '-'):
+            op = self._next()
+            return '%s%s' % (op, self._factor())
+        expr = self._primary()
+        if self._peek() == '**':
+            self._next()
+            expr = '%s ** %s' % (expr, self._factor())
+        return expr
+
+    def _primary(self):
+        tok = self._next()
+        if tok == '(':
+            expr = self._sum()
+            if self._next() != ')':
+                raise ValueError("unbalanced parentheses")
+            return '(%s)' % expr
+        if tok in ('+', '-', '*', '/', '**', ')'):
+            raise ValueError("unexpected %r" % tok)
+        return tok
 
 
 class _CyArrayArgWrapper(object):
 
+    __slots__ = ('arg', 'extern_name', 'intern_name', 'proc_name', 'strict',
+                 'on_copy', 'shape', 'shape_name', 'check_shape',
+                 'transpose', 'transposed_name')
+
     is_array = True
 
-    def __init__(self, arg):
+    def __init__(self, arg, proc_name=None, strict=False, on_copy='ignore',
+                 shape=None, check_shape=None, transpose=False):
         self.arg = arg
         self.extern_name = _py_kw_mangler(self.arg.name)
         self.intern_name = '%s_' % self.extern_name
+        self.proc_name = proc_name
+        self.strict = strict
+        self.on_copy = on_copy
+        # An intent(out) array whose extents are known from the other
+        # arguments may be passed as None, and is then allocated.
+        self.shape = None
+        if self.arg.intent == 'out':
+            self.shape = shape
+        self.shape_name = 'fw_%s_shape' % self.extern_name
+        # The extents to check the array against, leading ones first, when
+        # the Fortran procedure is called without a wrapper that does.
+        self.check_shape = check_shape
+        # Whether the array is passed in and returned as the transpose of
+        # the Fortran one, so that C ordered arrays needn't be copied.
+        self.transpose = transpose
+        self.transposed_name = 'fw_%s_t' % self.extern_name
 
     def extern_declarations(self):
         return ['object %s' % self.extern_name]
 
     def intern_declarations(self):
-        return ["cdef np.ndarray[%s, ndim=%d, mode='fortran'] %s" % \
+        ret = ["cdef np.ndarray[%s, ndim=%d, mode='fortran'] %s" % \
                 (self.arg.ktp,
                  self.arg.ndims,
                  self.intern_name,)
                 ]
+        if self.transpose:
+            ret.append("cdef np.ndarray %s" % self.transposed_name)
+        if self.shape is not None:
+            ret.append("cdef np.npy_intp %s[%d]" %
+                       (self.shape_name, self.arg.ndims))
+        return ret
 
     def _get_py_dtype_name(self):
         from fwrap.gen_config import py_type_name_from_type
         return py_type_name_from_type(self.arg.ktp)
 
     def call_arg_list(self):
+        data = ['<%s*>%s.data' % (self.arg.ktp, self.intern_name)]
+        if self.arg.direct:
+            return data
         shapes = ['<fwi_npy_intp_t*>&%s.shape[%d]' % (self.intern_name, i) \
                                 for i in range(self.arg.ndims)]
-        data = ['<%s*>%s.data' % (self.arg.ktp, self.intern_name)]
         return shapes + data
 
-    def pre_call_code(self):
-        # NOTE: we can support a STRICT macro that would disable the
-        # PyArray_ANYARRAY() call, forcing all incoming arrays to be already F
-        # contiguous.
-        tmpl = ("%(intern)s = np.PyArray_FROMANY("
-                                    "%(extern)s, %(dtenum)s, "
-                                    "%(ndim)d, %(ndim)d, "
-                                    "np.NPY_F_CONTIGUOUS)")
+    def _check_shape_code(self):
+        if not self.check_shape:
+            return []
+        test = ' or '.join(['%s.shape[%d] != %s' % (self.intern_name, idx,
+                                                     extent)
+                            for idx, extent in enumerate(self.check_shape)])
+        return ["if %s:" % test,
+                "    raise ValueError(\"%s has the wrong shape\")" %
+                    self.extern_name]
+
+    def _conversion_dict(self):
         d = {'intern' : self.intern_name,
              'extern' : self.extern_name,
              'dtenum' : self.arg.dtype.npy_enum,
-             'ndim' : self.arg.ndims}
-        return [tmpl % d]
+             'ndim' : self.arg.ndims,
+             'ktp' : self.arg.ktp,
+             'proc' : self.proc_name,
+             'action' : self.on_copy,
+             'order' : 'F',
+             'order_name' : 'Fortran',
+             'converted' : self.intern_name,
+             'T' : '',
+             'type_test' : 'np.PyArray_TYPE(%s) == %s' % (
+                                self.extern_name, self.arg.dtype.npy_enum)}
+        if self.transpose:
+            d.update(order='C', order_name='C',
+                     converted=self.transposed_name, T='.T')
+        return d
+
+    # Converts the argument to an array of the right type, rank and order.
+    _from_any_tmpl = ("%(converted)s = np.PyArray_FROMANY(%(extern)s, "
+                      "%(dtenum)s, %(ndim)d, %(ndim)d, "
+                      "np.NPY_%(order)s_CONTIGUOUS)")
+
+    # Allocates an intent(out) array passed as None.
+    _empty_tmpl = ("%(intern)s = np.PyArray_EMPTY(%(ndim)d, %(shape)s, "
+                   "%(dtenum)s, 1)")
+
+    def pre_call_code(self):
+        d = self._conversion_dict()
+        if self.strict:
+            code = (self._strict_tmpl % d).splitlines()
+        else:
+            code = (self._from_any_tmpl % d).splitlines()
+            if self.proc_name is not None:
+                # PyArray_FROMANY returns the argument itself unless it had
+                # to copy or cast it.
+                code += ["if %(converted)s is not %(extern)s:" % d,
+                         "    fw_record_copy__(%(proc)r, %(extern)r, "
+                             "np.PyArray_NBYTES(%(converted)s), "
+                             "%(action)r)" % d]
+            if self.transpose:
+                code.append("%(intern)s = %(converted)s.T" % d)
+        if self.shape is None:
+            return code + self._check_shape_code()
+        # np.empty rather than np.zeros: the Fortran procedure sets every
+        # element.
+        alloc = ["%s[%d] = %s" % (self.shape_name, idx, extent)
+                    for idx, extent in enumerate(self.shape)]
+        alloc.append(self._empty_tmpl % dict(d, shape=self.shape_name))
+        return (["if %s is None:" % self.extern_name] +
+                ["    %s" % line for line in alloc] +
+                ["else:"] +
+                ["    %s" % line for line in code] +
+                self._check_shape_code())
+
+    # In strict mode the argument is used as is; anything PyArray_FROMANY
+    # would have to copy or cast is an error.
+    _strict_tmpl = """\
+if not (np.PyArray_Check(%(extern)s) and
+        %(type_test)s and
+        np.PyArray_NDIM(%(extern)s) == %(ndim)d and
+        np.PyArray_ISNOTSWAPPED(%(extern)s) and
+        np.PyArray_CHKFLAGS(%(extern)s,
+                            np.NPY_%(order)s_CONTIGUOUS | np.NPY_ALIGNED)):
+    raise ValueError("%(extern)s must be an aligned, %(order_name)s contiguous "
+                     "%(ndim)dD array of type %(ktp)s in native byte order")
+%(intern)s = %(extern)s%(T)s"""
 
     def post_call_code(self):
         return []
 
     def return_tuple_list(self):
         if self.arg.intent in ('out', 'inout', None):
+            if self.transpose:
+                return ['%s.T' % self.intern_name]
             return [self.intern_name]
         return []
 
@@ -377,10 +1115,15 @@ class _CyArrayArgWrapper(object):
                          dims.attrspec))
         if self.arg.intent is not None:
             dstring += ", intent %s" % (self.arg.intent)
+        if self.transpose:
+            dstring += ", transposed"
         return [dstring]
 
     def in_dstring(self):
-        return self._gen_dstring()
+        dstring = self._gen_dstring()
+        if self.shape is not None:
+            dstring[-1] += ", or None to allocate"
+        return dstring
 
     def out_dstring(self):
         if self.arg.intent not in ("out", "inout", None):
@@ -396,8 +1139,160 @@ class _CyArrayArgWrapper(object):
         return []
 
 
+class CyStridedArrayArgWrapper(_CyArrayArgWrapper):
+
+    # An assumed-shape array passed with its strides in elements: an array
+    # whose strides fit (see fw_get_strides__) is used as it is, any other
+    # is copied as usual.
+
+    __slots__ = ('strides_name',)
+
+    def __init__(self, arg, proc_name=None, strict=False, on_copy='ignore',
+                 transpose=False):
+        super(CyStridedArrayArgWrapper, self).__init__(arg,
+                proc_name=proc_name, strict=strict, on_copy=on_copy,
+                transpose=transpose)
+        self.strides_name = 'fw_%s_strides' % self.extern_name
+
+    def intern_declarations(self):
+        ret = ["cdef np.ndarray[%s, ndim=%d, mode='strided'] %s" %
+                    (self.arg.ktp, self.arg.ndims, self.intern_name),
+               "cdef fwi_npy_intp_t %s[%d]" %
+                    (self.strides_name, self.arg.ndims)]
+        if self.transpose:
+            ret.append("cdef np.ndarray %s" % self.transposed_name)
+        return ret
+
+    def call_arg_list(self):
+        shapes = ['<fwi_npy_intp_t*>&%s.shape[%d]' % (self.intern_name, i)
+                                for i in range(self.arg.ndims)]
+        strides = ['&%s[%d]' % (self.strides_name, i)
+                                for i in range(self.arg.ndims)]
+        data = ['<%s*>%s.data' % (self.arg.ktp, self.intern_name)]
+        return shapes + strides + data
+
+    def pre_call_code(self):
+        d = self._conversion_dict()
+        d['strides'] = self.strides_name
+        # The array itself, or its transpose, is passed if its strides fit.
+        d['check'] = ("fw_get_strides__(%(extern)s%(T)s, %(dtenum)s, "
+                      "%(ndim)d, %(strides)s)" % d)
+        if self.transpose:
+            d['check'] = "(np.PyArray_Check(%s) and %s)" % (self.extern_name,
+                                                             d['check'])
+        if self.strict:
+            return (self._strict_strided_tmpl % d).splitlines()
+        copy = super(CyStridedArrayArgWrapper, self).pre_call_code()
+        return (["if %(check)s:" % d,
+                 "    %(intern)s = %(extern)s%(T)s" % d,
+                 "else:"] +
+                ["    %s" % line for line in copy] +
+                ["    fw_get_strides__(%(intern)s, %(dtenum)s, %(ndim)d, "
+                     "%(strides)s)" % d])
+
+    _strict_strided_tmpl = """\
+if not %(check)s:
+    raise ValueError("%(extern)s must be an aligned %(ndim)dD array of type "
+                     "%(ktp)s in native byte order whose strides fit a "
+                     "Fortran array section")
+%(intern)s = %(extern)s%(T)s"""
+
+
+class CyModuleArrayArgWrapper(_CyArrayArgWrapper):
+
+    # A module array (see fc_wrap.ModuleArrayWrapper), returned as a Fortran
+    # ordered view of the module's storage rather than passed in.  The view
+    # doesn't own the data: it is only valid while the array is allocated.
+
+    __slots__ = ('data_name',)
+
+    def __init__(self, arg):
+        super(CyModuleArrayArgWrapper, self).__init__(arg)
+        self.data_name = arg.data_name
+
+    def extern_declarations(self):
+        return []
+
+    def intern_declarations(self):
+        return ["cdef fwi_npy_intp_t %s[%d]" % (self.shape_name,
+                                                 self.arg.ndims),
+                "cdef void *%s" % self.data_name,
+                "cdef object %s" % self.intern_name]
+
+    def call_arg_list(self):
+        return ['&%s[%d]' % (self.shape_name, i)
+                    for i in range(self.arg.ndims)]
+
+    def pre_call_code(self):
+        return []
+
+    def post_call_code(self):
+        d = dict(intern=self.intern_name, data=self.data_name,
+                 shape=self.shape_name, ndim=self.arg.ndims,
+                 dtenum=self.arg.dtype.npy_enum)
+        return ["%(intern)s = None" % d,
+                "if %(data)s != NULL:" % d,
+                "    %(intern)s = np.PyArray_New(np.ndarray, %(ndim)d, "
+                    "<np.npy_intp*>%(shape)s, %(dtenum)s, NULL, %(data)s, "
+                    "0, np.NPY_FARRAY, None)" % d]
+
+    def return_tuple_list(self):
+        return [self.intern_name]
+
+    def _gen_dstring(self):
+        dstring = super(CyModuleArrayArgWrapper, self)._gen_dstring()
+        dstring[-1] += (", a view of the module array, or None if it "
+                        "isn't allocated or is empty")
+        return dstring
+
+    def in_dstring(self):
+        return []
+
+    def out_dstring(self):
+        return self._gen_dstring()
+
+    def docstring_extern_arg_list(self):
+        return []
+
+    def docstring_return_tuple_list(self):
+        return [self.extern_name]
+
+
+class CyDerivedArrayArgWrapper(_CyArrayArgWrapper):
+
+    # An array of a bind(c) derived type: a NumPy array of the type's
+    # structured dtype (see gen_config._DerivedTypeParam), whose buffer is
+    # passed to Fortran as it is when it is aligned and in order.
+
+    __slots__ = ()
+
+    def intern_declarations(self):
+        decls = super(CyDerivedArrayArgWrapper, self).intern_declarations()
+        decls[0] = "cdef np.ndarray %s" % self.intern_name
+        return decls
+
+    def _conversion_dict(self):
+        d = super(CyDerivedArrayArgWrapper, self)._conversion_dict()
+        d['py_dtype'] = self.arg.dtype.py_type_name()
+        d['type_test'] = '%s.dtype == %s' % (self.extern_name, d['py_dtype'])
+        d['shape_tuple'] = '(%s,)' % ', '.join(['%s[%d]' % (self.shape_name,
+                                                             idx)
+                                        for idx in range(self.arg.ndims)])
+        return d
+
+    _from_any_tmpl = """\
+%(converted)s = np.require(%(extern)s, %(py_dtype)s, ['%(order)s', 'A'])
+if %(converted)s.ndim != %(ndim)d:
+    raise ValueError("%(extern)s must be a %(ndim)dD array")"""
+
+    _empty_tmpl = ("%(intern)s = np.empty(%(shape_tuple)s, %(py_dtype)s, "
+                   "order='F')")
+
+
 class CyCharArrayArgWrapper(_CyArrayArgWrapper):
 
+    __slots__ = ('odtype_name', 'shape_name', 'name')
+
     def __init__(self, arg):
         super(CyCharArrayArgWrapper, self).__init__(arg)
         intern_name = _py_kw_mangler(self.arg.intern_name)
@@ -455,12 +1350,40 @@ class CyArgWrapperManager(object):
         self.args = args
 
     @classmethod
-    def from_fwrapped_proc(cls, fw_proc):
+    def from_fwrapped_proc(cls, fw_proc, cfg=None):
+        if cfg is None:
+            cfg = Configuration()
+        proc_name = fw_proc.wrapped_name()
         fw_arg_man = fw_proc.arg_man
+        # the integer scalars passed in, from which array extents can be
+        # computed.
+        scalar_names = set()
+        for fw_arg in fw_arg_man.arg_wrappers:
+            if (not fw_arg.is_array and fw_arg.dtype.type == 'integer' and
+                    fw_arg.intent in ('in', 'inout', None)):
+                scalar_names.add(fw_arg.name)
         args = []
         for fw_arg in fw_arg_man.arg_wrappers:
             if fw_arg.is_array:
-                args.append(CyArrayArgWrapper(fw_arg))
+                strict = cfg.get('strict', proc_name, fw_arg.name)
+                on_copy = cfg.get('on_copy', proc_name, fw_arg.name)
+                if fw_arg.intent != 'in':
+                    on_copy = max(on_copy,
+                            cfg.get('on_inout_copy', proc_name, fw_arg.name),
+                            key=COPY_ACTIONS.index)
+                shape = alloc_shape(fw_arg.orig_arg.dimension, scalar_names)
+                check_shape = None
+                if fw_arg.direct:
+                    dims = list(fw_arg.orig_arg.dimension)
+                    if dims[-1].is_assumed_size:
+                        dims.pop()
+                    check_shape = alloc_shape(dims, scalar_names)
+                args.append(CyArrayArgWrapper(fw_arg,
+                        proc_name=_py_kw_mangler(proc_name), strict=strict,
+                        on_copy=on_copy, shape=shape,
+                        check_shape=check_shape,
+                        transpose=cfg.get('transpose', proc_name,
+                                          fw_arg.name)))
             else:
                 args.append(CyArgWrapper(fw_arg))
         return cls(args=args)
@@ -528,14 +1451,64 @@ class CyArgWrapperManager(object):
 
 class ProcWrapper(object):
 
-    def __init__(self, wrapped):
+    def __init__(self, wrapped, cfg=None):
+        if cfg is None:
+            cfg = Configuration()
         self.wrapped = wrapped
         self.name = _py_kw_mangler(self.wrapped.wrapped_name())
-        self.arg_mgr = CyArgWrapperManager.from_fwrapped_proc(wrapped)
+        self.arg_mgr = CyArgWrapperManager.from_fwrapped_proc(wrapped, cfg)
+        nogil = cfg.get('nogil', self.wrapped.wrapped_name())
+        self.nogil = bool(nogil)
+        # The names of the locks held during the call, in the (global) order
+        # they are taken.
+        self.locks = ()
+        if nogil == 'auto':
+            self.locks = tuple(sorted(self.wrapped.wrapped.shared_state))
+        # An elemental procedure also gets a ufunc if its arguments allow.
+        self.ufunc = None
+        if UfuncWrapper.supports(self.wrapped):
+            self.ufunc = UfuncWrapper(self)
+
+    def exported_names(self):
+        r"""Return the names the procedure's wrappers are defined under."""
+        if self.ufunc is not None:
+            return [self.name, self.ufunc.name]
+        return [self.name]
 
     def all_dtypes(self):
         return self.wrapped.all_dtypes()
 
+    def strided_args(self):
+        return [arg for arg in self.arg_mgr.args
+                    if isinstance(arg, CyStridedArrayArgWrapper)]
+
+    def parallel_spec(self):
+        r"""Return what parallel_map() needs to know about the procedure: a
+        tuple of (position, name, dtype enum, ndim, on_copy action) for each
+        array argument it may convert up front, and whether several calls
+        may run at once.
+        """
+        arrays = []
+        pos = 0
+        for arg in self.arg_mgr.args:
+            if not arg.extern_declarations():
+                continue
+            # Strict arguments must be checked by the wrapper, character
+            # arrays are viewed differently, strided views aren't copied,
+            # transposed arrays are copied to C order and record arrays
+            # have no type number of their own.
+            if (isinstance(arg, _CyArrayArgWrapper) and not arg.strict and
+                    not arg.transpose and
+                    not isinstance(arg, (CyCharArrayArgWrapper,
+                                         CyStridedArrayArgWrapper,
+                                         CyDerivedArrayArgWrapper))):
+                arrays.append((pos, arg.extern_name, arg.arg.dtype.npy_enum,
+                               arg.arg.ndims, arg.on_copy))
+            pos += 1
+        concurrent = self.nogil and bool(
+                self.locks or self.wrapped.wrapped.is_thread_safe())
+        return tuple(arrays), concurrent
+
     def cy_prototype(self):
         template = "cpdef api object %(proc_name)s(%(arg_list)s)"
         arg_list = ', '.join(self.arg_mgr.arg_declarations())
@@ -550,6 +1523,9 @@ class ProcWrapper(object):
         proc_call = "%(call_name)s(%(call_arg_list)s)" % {
                 'call_name' : self.wrapped.name,
                 'call_arg_list' : ', '.join(self.arg_mgr.call_arg_list())}
+        if self.wrapped.arg_man.c_proto_return_type() != 'void':
+            proc_call = "%s = %s" % (self.wrapped.proc_result_name(),
+                                     proc_call)
         return proc_call
 
     def temp_declarations(self, buf):
@@ -575,6 +1551,25 @@ class ProcWrapper(object):
         for line in self.arg_mgr.post_call_code():
             buf.putln(line)
 
+    def put_call(self, buf):
+        if not self.nogil:
+            buf.putln(self.proc_call())
+            return
+        if self.locks:
+            buf.putln("fw_acquire__(%r)" % (self.locks,))
+            buf.putln("try:")
+            buf.indent()
+        buf.putln("with nogil:")
+        buf.indent()
+        buf.putln(self.proc_call())
+        buf.dedent()
+        if self.locks:
+            buf.dedent()
+            buf.putln("finally:")
+            buf.indent()
+            buf.putln("fw_release__(%r)" % (self.locks,))
+            buf.dedent()
+
     def check_error(self, buf):
         ck_err = ('if fw_iserr__ != FW_NO_ERR__:\n'
                   '    raise RuntimeError(\"an error was encountered '
@@ -585,6 +1580,11 @@ class ProcWrapper(object):
         post_cc = CodeBuffer()
         self.post_call_code(post_cc)
 
+        if not self.wrapped.arg_man.has_errors:
+            # Nothing to check, so nothing can fail.
+            buf.putlines(post_cc.getvalue())
+            return
+
         use_try = post_cc.getvalue()
 
         if use_try:
@@ -609,7 +1609,7 @@ class ProcWrapper(object):
         self.put_docstring(buf)
         self.temp_declarations(buf)
         self.pre_call_code(buf)
-        buf.putln(self.proc_call())
+        self.put_call(buf)
         self.post_try_finally(buf)
         rt = self.return_tuple()
         if rt: buf.putln(rt)
@@ -654,3 +1654,127 @@ class ProcWrapper(object):
             dstring.extend(descrs)
 
         return dstring
+
+
+class UfuncWrapper(object):
+
+    # The NumPy ufunc <proc>_ufunc of an elemental procedure whose arguments
+    # are integer, real or complex scalars: the intent(in) arguments are its
+    # inputs, and the intent(out) ones (or a function's result) its outputs.
+    # There is one inner loop, for the procedure's own argument types, which
+    # calls the C wrapper for each element; NumPy broadcasts the arguments,
+    # and casts or buffers any that don't have those types, or raises
+    # TypeError where its casting rule doesn't allow the cast; no loops are
+    # registered for other kinds, and the generated docstring says so.  The
+    # loop can't raise, so procedures whose C wrapper checks its arguments
+    # get no ufunc.
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.name = '%s_ufunc' % proc.name
+        self.inputs, self.outputs = self._operands(proc.wrapped)
+
+    def supports(cls, fw_proc):
+        r"""Whether fw_proc, a procedure wrapper of fc_wrap, can have a
+        ufunc.
+        """
+        import fc_wrap
+        if (not fw_proc.wrapped.elemental or
+                not isinstance(fw_proc, (fc_wrap.SubroutineWrapper,
+                                         fc_wrap.FunctionWrapper)) or
+                isinstance(fw_proc, fc_wrap.BatchedSubroutineWrapper)):
+            return False
+        inputs, outputs = cls._operands(fw_proc)
+        if not outputs or fw_proc.arg_man.has_checks():
+            return False
+        for argw in inputs + outputs:
+            if (argw.is_array or
+                    argw.dtype.type not in ('integer', 'real', 'complex')):
+                return False
+        return len(inputs) + len(outputs) == len(cls._args(fw_proc))
+    supports = classmethod(supports)
+
+    def _args(cls, fw_proc):
+        import fc_wrap
+        return [argw for argw in fw_proc.arg_man.arg_wrappers
+                    if not (isinstance(argw, fc_wrap.ErrStrArgWrapper) or
+                            argw.name == constants.ERR_NAME)]
+    _args = classmethod(_args)
+
+    def _operands(cls, fw_proc):
+        args = cls._args(fw_proc)
+        return ([argw for argw in args if argw.intent == 'in'],
+                [argw for argw in args if argw.intent == 'out'])
+    _operands = classmethod(_operands)
+
+    def _call_arg_list(self, names):
+        import fc_wrap
+        cal = []
+        for argw in self.proc.wrapped.arg_man.arg_wrappers:
+            if isinstance(argw, fc_wrap.ErrStrArgWrapper):
+                cal.append(constants.ERRSTR_NAME)
+            elif argw.name == constants.ERR_NAME:
+                cal.append('&%s' % constants.ERR_NAME)
+            elif argw.by_value:
+                cal.append('(<%s*>%s)[0]' % (argw.ktp, names[argw.name]))
+            else:
+                cal.append('<%s*>%s' % (argw.ktp, names[argw.name]))
+        return cal
+
+    def docstring(self):
+        from fwrap.gen_config import py_type_name_from_type
+        outputs = [_py_kw_mangler(argw.name) for argw in self.outputs]
+        if len(outputs) > 1:
+            ret = '(%s)' % ', '.join(outputs)
+        else:
+            ret = outputs[0]
+        types = ', '.join([py_type_name_from_type(argw.ktp)
+                            for argw in self.inputs])
+        return ("%s(%s) -> %s\\n\\nThe elemental %s applied to each element "
+                "of the broadcast arguments.\\n\\nIts only loop takes (%s); "
+                "NumPy casts arguments of other types where its casting rule "
+                "allows, and raises TypeError where it doesn't." %
+                (self.name, ', '.join([_py_kw_mangler(argw.name)
+                                        for argw in self.inputs]),
+                 ret, self.proc.name, types))
+
+    def generate_wrapper(self, buf):
+        operands = self.inputs + self.outputs
+        names = {}
+        for argw in operands:
+            names[argw.name] = _py_kw_mangler(argw.name)
+        loop = '%s_loop__' % self.name
+        buf.putln("cdef void %s(char **fw_args, np.npy_intp *fw_dims, "
+                  "np.npy_intp *fw_steps, void *fw_data) nogil:" % loop)
+        buf.indent()
+        buf.putln("cdef np.npy_intp fw_i")
+        for idx, argw in enumerate(operands):
+            buf.putln("cdef char *%s = fw_args[%d]" % (names[argw.name], idx))
+        if self.proc.wrapped.arg_man.has_errors:
+            # the wrapper checks nothing (see supports()), but takes the
+            # error arguments.
+            buf.putln("cdef fwi_integer_t %s" % constants.ERR_NAME)
+            buf.putln("cdef fw_character_t %s[fw_errstr_len]" %
+                      constants.ERRSTR_NAME)
+        buf.putln("for fw_i in range(fw_dims[0]):")
+        buf.indent()
+        buf.putln("%s(%s)" % (self.proc.wrapped.name,
+                              ', '.join(self._call_arg_list(names))))
+        for idx, argw in enumerate(operands):
+            buf.putln("%s += fw_steps[%d]" % (names[argw.name], idx))
+        buf.dedent()
+        buf.dedent()
+        d = dict(name=self.name, loop=loop, nin=len(self.inputs),
+                 nout=len(self.outputs), nargs=len(operands),
+                 doc=self.docstring())
+        buf.putln("cdef PyUFuncGenericFunction %(name)s_loops__[1]" % d)
+        buf.putln("cdef void *%(name)s_data__[1]" % d)
+        buf.putln("cdef char %(name)s_types__[%(nargs)d]" % d)
+        buf.putln("%(name)s_loops__[0] = %(loop)s" % d)
+        buf.putln("%(name)s_data__[0] = NULL" % d)
+        for idx, argw in enumerate(operands):
+            buf.putln("%s_types__[%d] = %s" % (self.name, idx,
+                                               argw.dtype.npy_enum))
+        buf.putln('%(name)s = PyUFunc_FromFuncAndData(%(name)s_loops__, '
+                  '%(name)s_data__, %(name)s_types__, 1, %(nin)d, %(nout)d, '
+                  'PyUFunc_None, "%(name)s", "%(doc)s", 0)' % d)
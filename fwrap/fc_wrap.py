@@ -5,29 +5,70 @@
 
 from fwrap import pyf_iface as pyf
 from fwrap import constants
+from fwrap.configuration import Configuration
 
 def _arg_name_mangler(name):
     return "fw_%s" % name
 
-def wrap_pyf_iface(ast):
+def wrap_pyf_iface(ast, cfg=None):
+    if cfg is None:
+        cfg = Configuration()
     fc_wrapper = []
     for proc in ast:
-        if proc.kind == 'function':
-            fc_wrapper.append(FunctionWrapper(wrapped=proc))
+        lean = cfg.get('lean', proc.name)
+        strided = [arg.name for arg in proc.args
+                        if cfg.get('strided', proc.name, arg.name)]
+        if proc.bind_c:
+            fc_wrapper.append(DirectProcWrapper(wrapped=proc))
+        elif proc.kind == 'module_array':
+            fc_wrapper.append(ModuleArrayWrapper(wrapped=proc))
+        elif proc.kind == 'function':
+            fc_wrapper.append(FunctionWrapper(wrapped=proc, lean=lean,
+                                              strided=strided))
         elif proc.kind == 'subroutine':
-            fc_wrapper.append(SubroutineWrapper(wrapped=proc))
+            fc_wrapper.append(SubroutineWrapper(wrapped=proc, lean=lean,
+                                                strided=strided))
         else:
             raise ValueError("object not function or subroutine, %s" % proc)
+        batched = cfg.get('batched', proc.name)
+        if batched and is_batchable(proc):
+            fc_wrapper.append(BatchedSubroutineWrapper(
+                                wrapped=proc,
+                                openmp=(batched == 'openmp' and
+                                        proc.is_thread_safe()),
+                                lean=lean))
     return fc_wrapper
 
-def generate_fc_pxd(ast, fc_header_name, buf):
+def is_batchable(proc):
+    r"""Return whether a batched driver can be generated for proc: a
+    subroutine with at least one non-character array argument, whose other
+    arguments are intent(in) numeric scalars shared by the whole batch.
+    """
+    if proc.kind != 'subroutine':
+        return False
+    has_array = False
+    for arg in proc.args:
+        if arg.dtype.type == 'character':
+            return False
+        if getattr(arg, 'dimension', None):
+            has_array = True
+        elif (arg.intent != 'in' or arg.dtype.type in ('logical', 'c_ptr')):
+            return False
+    return has_array
+
+def generate_fc_pxd(ast, fc_header_name, buf, cfg=None):
+    if cfg is None:
+        cfg = Configuration()
     buf.putln("from %s cimport *" %
                 constants.KTP_PXD_HEADER_SRC.split('.')[0])
     buf.putln('')
     buf.putln('cdef extern from "%s":' % fc_header_name)
     buf.indent()
     for proc in ast:
-        buf.putln(proc.cy_prototype())
+        # elemental procedures are pure, and their ufunc loops call them
+        # without the GIL.
+        nogil = cfg.get('nogil', proc.wrapped_name()) or proc.wrapped.elemental
+        buf.putln(proc.cy_prototype(nogil=bool(nogil)))
     buf.dedent()
 
 def generate_fc_h(ast, ktp_header_name, buf):
@@ -72,14 +113,17 @@ def _dim_test(dims1, dims2):
 
 class ProcWrapper(object):
 
-    def __init__(self, wrapped):
+    def __init__(self, wrapped, lean=False, strided=()):
         self.name = constants.PROC_SUFFIX_TMPL % wrapped.name
         self.wrapped = wrapped
+        self.lean = lean
+        self.strided = strided
         self.arg_man = None
         self._get_arg_man()
 
     def _get_arg_man(self):
-        self.arg_man = ArgWrapperManager(self.wrapped)
+        self.arg_man = ArgWrapperManager(self.wrapped, self.lean,
+                                         self.strided)
 
     def wrapped_name(self):
         return self.wrapped.name
@@ -89,6 +133,14 @@ class ProcWrapper(object):
 
     def proc_preamble(self, ktp_mod, buf):
         buf.putln('use %s' % ktp_mod)
+        used = self.wrapped.used_types()
+        if self.wrapped.module:
+            # only the procedure (and types), so that no name of the module
+            # clashes with the wrapper's.
+            used.setdefault(self.wrapped.module, []).insert(0,
+                                                        self.wrapped.name)
+        for use in pyf.use_statements(used):
+            buf.putln(use)
         buf.putln('implicit none')
         for declaration in (self.arg_declarations() +
                             self.param_declarations()):
@@ -98,7 +150,9 @@ class ProcWrapper(object):
         buf.putln(self.proc_declaration())
         buf.indent()
         self.proc_preamble(gmn, buf)
-        generate_interface(self.wrapped, buf, gmn)
+        if not self.wrapped.module:
+            # a module procedure's interface comes with the module.
+            generate_interface(self.wrapped, buf, gmn)
         self.temp_declarations(buf)
         self.pre_call_code(buf)
         self.proc_call(buf)
@@ -146,10 +200,13 @@ class ProcWrapper(object):
     def c_prototype(self):
         return "%s;" % self.cy_prototype()
 
-    def cy_prototype(self):
+    def cy_prototype(self, nogil=False):
         args = ", ".join(self.arg_man.c_proto_args())
-        return ('%s %s(%s)' % (self.arg_man.c_proto_return_type(),
-                                self.name, args))
+        proto = ('%s %s(%s)' % (self.arg_man.c_proto_return_type(),
+                                 self.name, args))
+        if nogil:
+            proto += ' nogil'
+        return proto
 
     def all_dtypes(self):
         return self.arg_man.all_dtypes()
@@ -159,15 +216,121 @@ class SubroutineWrapper(ProcWrapper):
     pass
 
 
+class BatchedSubroutineWrapper(SubroutineWrapper):
+
+    # Calls the wrapped subroutine once for each index of the extra trailing
+    # dimension that every array argument gets, on the sections a(:, ..., i)
+    # of the arrays and the same scalar arguments.
+
+    BATCH_INDEX = 'fw_ibatch__'
+
+    def __init__(self, wrapped, openmp=False, lean=False):
+        self.openmp = openmp
+        super(BatchedSubroutineWrapper, self).__init__(wrapped, lean)
+        self.name = constants.PROC_SUFFIX_TMPL % self.wrapped_name()
+
+    def _get_arg_man(self):
+        self.arg_man = BatchedArgWrapperManager(self.wrapped, self.lean)
+
+    def wrapped_name(self):
+        return '%s_batched' % self.wrapped.name
+
+    def temp_declarations(self, buf):
+        super(BatchedSubroutineWrapper, self).temp_declarations(buf)
+        buf.putln(pyf.Var(name=self.BATCH_INDEX,
+                          dtype=pyf.dim_dtype).declaration())
+
+    def proc_call(self, buf):
+        if self.openmp:
+            buf.putln('!$omp parallel do')
+        buf.putln('do %s = 1, %s' % (self.BATCH_INDEX,
+                                     self.arg_man.batch_size()))
+        buf.indent()
+        super(BatchedSubroutineWrapper, self).proc_call(buf)
+        buf.dedent()
+        buf.putln('end do')
+        if self.openmp:
+            buf.putln('!$omp end parallel do')
+
+
+class DirectProcWrapper(ProcWrapper):
+
+    # A bind(c) procedure that C can call as it is (see pyf.Procedure.bind_c):
+    # there is no Fortran wrapper, and the Cython wrapper calls the
+    # procedure by its binding label.
+
+    def __init__(self, wrapped, lean=False):
+        super(DirectProcWrapper, self).__init__(wrapped, lean)
+        self.name = wrapped.bind_c
+
+    def _get_arg_man(self):
+        self.arg_man = DirectArgWrapperManager(self.wrapped)
+
+    def generate_wrapper(self, buf, gmn=constants.KTP_MOD_NAME):
+        pass
+
+    def proc_result_name(self):
+        return self.arg_man.proc_result_name()
+
+
+class ModuleArrayWrapper(ProcWrapper):
+
+    # Returns the address of a module array (see pyf.ModuleArray), or a
+    # null pointer if it isn't allocated or is empty, and sets its extents.
+    # c_loc() needs a target, which the array is as the dummy argument of
+    # an internal procedure.
+
+    TARGET_NAME = 'fw_target'
+
+    def _get_arg_man(self):
+        self.arg_man = ModuleArrayArgManager(self.wrapped)
+
+    def proc_result_name(self):
+        return self.arg_man.proc_result_name()
+
+    def generate_wrapper(self, buf, gmn=constants.KTP_MOD_NAME):
+        array = self.arg_man.arg_wrappers[0]
+        buf.putln('function %s(%s) bind(c, name="%s")' %
+                  (self.name, ', '.join(self.extern_arg_list()), self.name))
+        buf.indent()
+        buf.putln('use %s' % gmn)
+        buf.putln('use %s, only: %s => %s' % (self.wrapped.module,
+                                              array.intern_name, array.name))
+        buf.putln('implicit none')
+        for declaration in self.arg_declarations():
+            buf.putln(declaration)
+        buf.putln('type(c_ptr) :: %s' % self.name)
+        buf.putln('%s = c_null_ptr' % self.name)
+        for line in array.pre_call_code():
+            buf.putln(line)
+        buf.putln('if (size(%s) .eq. 0) return' % array.intern_name)
+        buf.putln('call fw_loc(%s)' % array.intern_name)
+        buf.dedent()
+        buf.putln('contains')
+        buf.indent()
+        buf.putln('subroutine fw_loc(%s)' % self.TARGET_NAME)
+        buf.indent()
+        target = pyf.Var(name=self.TARGET_NAME, dtype=array.dtype,
+                         dimension=array.extern_arg_list())
+        buf.putln('%s, target :: %s' % (', '.join(target.var_specs()),
+                                        target.name))
+        buf.putln('%s = c_loc(%s)' % (self.name, target.name))
+        buf.dedent()
+        buf.putln('end subroutine fw_loc')
+        buf.dedent()
+        buf.putln('end function %s' % self.name)
+
+
 class FunctionWrapper(ProcWrapper):
 
     RETURN_ARG_NAME = constants.RETURN_ARG_NAME
 
-    def __init__(self, wrapped):
-        super(FunctionWrapper, self).__init__(wrapped)
+    def __init__(self, wrapped, lean=False, strided=()):
+        super(FunctionWrapper, self).__init__(wrapped, lean, strided)
 
     def _get_arg_man(self):
-        self.arg_man = ArgWrapperManager(self.wrapped)
+        self.arg_man = ArgWrapperManager(self.wrapped, self.lean,
+                                         self.strided)
 
     def return_spec_declaration(self):
         return self.arg_man.return_spec_declaration()
@@ -178,8 +341,14 @@ class FunctionWrapper(ProcWrapper):
 
 class ArgWrapperManager(object):
 
-    def __init__(self, proc):
+    # With lean set, intent(in) integer and real scalars are passed by value,
+    # and the error arguments are left out if no argument is checked.  The
+    # assumed-shape arrays named in strided are passed with their strides.
+
+    def __init__(self, proc, lean=False, strided=()):
         self.proc = proc
+        self.lean = lean
+        self.strided = strided
         self.isfunction = (proc.kind == 'function')
         self.ret_arg = None
         if self.isfunction:
@@ -194,16 +363,38 @@ class ArgWrapperManager(object):
                                 dtype=pyf.default_integer,
                                 intent='out')
         self.errstr = ErrStrArgWrapper()
+        self.has_errors = True
         self._gen_wrappers()
 
     def _gen_wrappers(self):
         wargs = []
-        for arg in self._orig_args + [self.errflag]:
-            wargs.append(ArgWrapperFactory(arg))
-        self.arg_wrappers = wargs + [self.errstr]
+        for arg in self._orig_args:
+            if self.lean and is_value_arg(arg):
+                wargs.append(ValueArgWrapper(arg))
+            elif arg.name in self.strided and is_strided_arg(arg):
+                wargs.append(StridedArrayArgWrapper(arg))
+            else:
+                wargs.append(ArgWrapperFactory(arg))
+        self.has_errors = not self.lean or self._has_checks(wargs)
+        if self.has_errors:
+            wargs += [ArgWrapperFactory(self.errflag), self.errstr]
+        self.arg_wrappers = wargs
         if self.isfunction:
             self.ret_arg = self.arg_wrappers[0]
 
+    def has_checks(self):
+        r"""Return whether the C wrapper checks any of its arguments, and so
+        can report an error.
+        """
+        return self._has_checks(self.arg_wrappers)
+
+    def _has_checks(self, wargs):
+        for argw in wargs:
+            for line in argw.pre_call_code() + argw.post_call_code():
+                if constants.ERR_NAME in line:
+                    return True
+        return False
+
     def call_arg_list(self):
         cl = [argw.intern_name for argw in self.arg_wrappers
                 if (argw.intern_name != FunctionWrapper.RETURN_ARG_NAME and
@@ -262,7 +453,9 @@ class ArgWrapperManager(object):
         return "%s = FW_NO_ERR__" % constants.ERR_NAME
 
     def pre_call_code(self):
-        all_pcc = [self.init_err()]
+        all_pcc = []
+        if self.has_errors:
+            all_pcc.append(self.init_err())
         for argw in self.arg_wrappers:
             pcc = argw.pre_call_code()
             if pcc:
@@ -276,7 +469,8 @@ class ArgWrapperManager(object):
             pcc = argw.post_call_code()
             if pcc:
                 all_pcc.extend(pcc)
-        all_pcc += [self.no_err()]
+        if self.has_errors:
+            all_pcc.append(self.no_err())
         return all_pcc
 
     def _return_var_name(self):
@@ -288,6 +482,108 @@ class ArgWrapperManager(object):
                 [self.errflag.dtype])
 
 
+class BatchedArgWrapperManager(ArgWrapperManager):
+
+    def _batched_arg(self, arg):
+        if not getattr(arg, 'dimension', None):
+            return arg
+        dims = list(arg.dimension) + [':']
+        return pyf.Argument(name=arg.name, dtype=arg.dtype,
+                            intent=arg.intent, dimension=dims)
+
+    def _gen_wrappers(self):
+        wargs = []
+        for arg in self._orig_args:
+            if getattr(arg, 'dimension', None):
+                wargs.append(BatchedArrayArgWrapper(self._batched_arg(arg)))
+            elif self.lean and is_value_arg(arg):
+                wargs.append(ValueArgWrapper(arg))
+            else:
+                wargs.append(ArgWrapperFactory(arg))
+        self.has_errors = not self.lean or self._has_checks(wargs)
+        if self.has_errors:
+            wargs += [ArgWrapperFactory(self.errflag), self.errstr]
+        self.arg_wrappers = wargs
+
+    def _has_checks(self, wargs):
+        # The batch extents of several arrays are checked against each
+        # other.
+        arrays = [argw for argw in wargs if argw.is_array]
+        return (len(arrays) > 1 or
+                super(BatchedArgWrapperManager, self)._has_checks(wargs))
+
+    def _batch_dims(self):
+        return [argw.batch_dim for argw in self.arg_wrappers if argw.is_array]
+
+    def batch_size(self):
+        return self._batch_dims()[0]
+
+    def pre_call_code(self):
+        all_pcc = super(BatchedArgWrapperManager, self).pre_call_code()
+        arrays = [argw for argw in self.arg_wrappers if argw.is_array]
+        for argw in arrays[1:]:
+            all_pcc.extend(_err_test_block(
+                                '%s .ne. %s' % (argw.batch_dim,
+                                                self.batch_size()),
+                                'FW_ARR_DIM__',
+                                argw.extern_arg.name))
+        return all_pcc
+
+
+class DirectArgWrapperManager(ArgWrapperManager):
+
+    def _gen_wrappers(self):
+        wargs = []
+        for arg in self._orig_args:
+            if arg.name == FunctionWrapper.RETURN_ARG_NAME:
+                wargs.append(DirectReturnArgWrapper(arg))
+            elif getattr(arg, 'dimension', None):
+                wargs.append(DirectArrayArgWrapper(arg))
+            elif arg.isvalue:
+                wargs.append(ValueArgWrapper(arg))
+            else:
+                wargs.append(ArgWrapper(arg))
+        self.has_errors = False
+        self.arg_wrappers = wargs
+        if self.isfunction:
+            self.ret_arg = self.arg_wrappers[0]
+
+    def c_proto_return_type(self):
+        if self.isfunction:
+            return self.ret_arg.dtype.fw_ktp
+        return 'void'
+
+
+class ModuleArrayArgManager(ArgWrapperManager):
+
+    def _gen_wrappers(self):
+        self.has_errors = False
+        self.arg_wrappers = [ModuleArrayArgWrapper(self.proc.array)]
+
+    def proc_result_name(self):
+        return self.arg_wrappers[0].data_name
+
+    def c_proto_return_type(self):
+        return pyf.c_ptr_type.c_declaration().strip()
+
+
+def is_value_arg(arg):
+    r"""Return whether arg can be passed by value in the lean ABI."""
+    return (not getattr(arg, 'dimension', None) and arg.intent == 'in' and
+            arg.dtype.type in ('integer', 'real'))
+
+def is_strided_arg(arg):
+    r"""Return whether arg is an assumed-shape numeric array, which can be
+    passed with its strides.
+    """
+    dims = getattr(arg, 'dimension', None)
+    if not dims or arg.dtype.type not in ('integer', 'real', 'complex'):
+        return False
+    for dim in dims:
+        if not dim.is_assumed_shape:
+            return False
+    return True
+
 def ArgWrapperFactory(arg):
     if getattr(arg, 'dimension', None):
         if arg.dtype.type == 'character':
@@ -307,13 +603,25 @@ def ArgWrapperFactory(arg):
         return HideArgWrapper(arg)
     elif arg.dtype.type == 'character':
         return CharArgWrapper(arg)
+    elif arg.isvalue and is_value_arg(arg):
+        return ValueArgWrapper(arg)
     else:
         return ArgWrapper(arg)
 
 
 class ArgWrapperBase(object):
 
+    __slots__ = ()
+
     is_array = False
+    by_value = False
+    returned = False
+    # Whether the array is passed without its extents.
+    direct = False
+    # Whether the array is passed with its strides.
+    strided = False
+    # Whether the array is a module's, returned rather than passed.
+    module_array = False
 
     def pre_call_code(self):
         return []
@@ -336,6 +644,9 @@ class ArgWrapperBase(object):
 
 class ArgWrapper(ArgWrapperBase):
 
+    __slots__ = ('orig_arg', 'dtype', 'name', 'ktp', 'intent', 'intern_name',
+                 'intern_var', 'extern_arg', 'extern_args')
+
     def __init__(self, arg):
         self.orig_arg = arg
         self.dtype = arg.dtype
@@ -353,7 +664,13 @@ class ArgWrapper(ArgWrapperBase):
         self.intern_var = None
 
     def _set_extern_args(self):
-        self.extern_arg = self.orig_arg
+        if self.orig_arg.isvalue and self.dtype.type != 'c_ptr':
+            # The interface passes it by value; the wrapper takes it by
+            # reference like the other arguments.
+            self.extern_arg = pyf.Argument(name=self.name, dtype=self.dtype,
+                                           intent='in')
+        else:
+            self.extern_arg = self.orig_arg
         self.extern_args = [self.extern_arg]
 
     def extern_arg_list(self):
@@ -374,8 +691,33 @@ class ArgWrapper(ArgWrapperBase):
         else:
             return []
 
+class ValueArgWrapper(ArgWrapper):
+
+    __slots__ = ()
+
+    by_value = True
+
+    def _set_extern_args(self):
+        self.extern_arg = pyf.Argument(name=self.name, dtype=self.dtype,
+                                       intent='in', isvalue=True)
+        self.extern_args = [self.extern_arg]
+
+class DirectReturnArgWrapper(ArgWrapper):
+
+    # The result of a bind(c) function, which C gets as its return value.
+
+    __slots__ = ()
+
+    returned = True
+
+    def _set_extern_args(self):
+        self.extern_arg = self.orig_arg
+        self.extern_args = []
+
 class ErrStrArgWrapper(ArgWrapperBase):
 
+    __slots__ = ('arg', 'dtype', 'name', 'intern_name', 'ktp', 'intent')
+
     def __init__(self):
         self.arg = pyf.Argument(name=constants.ERRSTR_NAME,
                                 dtype=pyf.default_character,
@@ -407,6 +749,9 @@ class ErrStrArgWrapper(ArgWrapperBase):
 
 class HideArgWrapper(ArgWrapperBase):
 
+    __slots__ = ('_orig_arg', '_extern_arg', '_intern_var', 'value',
+                 'intern_name')
+
     def __init__(self, arg):
         self._orig_arg = arg
         self._extern_arg = None
@@ -431,6 +776,8 @@ class HideArgWrapper(ArgWrapperBase):
 
 class ArrayArgWrapper(ArgWrapper):
 
+    __slots__ = ('_arr_dims', 'ndims')
+
     is_array = True
 
     def _set_extern_args(self):
@@ -459,8 +806,77 @@ class ArrayArgWrapper(ArgWrapper):
         return []
 
 
+class BatchedArrayArgWrapper(ArrayArgWrapper):
+
+    # An array argument with a trailing batch dimension, passed to the
+    # wrapped procedure a section at a time.
+
+    __slots__ = ('batch_dim',)
+
+    def _set_intern_name(self):
+        sections = [':'] * (len(self.orig_arg.dimension) - 1)
+        self.intern_name = '%s(%s)' % (self.name, ', '.join(
+                        sections + [BatchedSubroutineWrapper.BATCH_INDEX]))
+
+    def _set_extern_args(self):
+        super(BatchedArrayArgWrapper, self)._set_extern_args()
+        self.batch_dim = self._arr_dims[-1].name
+
+
+class DirectArrayArgWrapper(ArrayArgWrapper):
+
+    # An array argument of a bind(c) procedure, passed as a bare pointer;
+    # the Cython wrapper checks its extents.
+
+    __slots__ = ()
+
+    direct = True
+
+    def _set_extern_args(self):
+        self._arr_dims = []
+        self.ndims = len(self.orig_arg.dimension)
+        self.extern_arg = self.orig_arg
+        self.extern_args = [self.extern_arg]
+
+    def pre_call_code(self):
+        return []
+
+
+class ModuleArrayArgWrapper(ArrayArgWrapper):
+
+    # The extents of a module array, which the wrapper sets, and the array
+    # itself, use associated under the name fw_<name>.  The extents are
+    # intent(inout) only so that they can give the target's shape.
+
+    __slots__ = ('data_name',)
+
+    module_array = True
+
+    def _set_intern_name(self):
+        self.intern_name = _arg_name_mangler(self.name)
+        self.data_name = 'fw_%s_data' % self.name
+
+    def _set_extern_args(self):
+        super(ModuleArrayArgWrapper, self)._set_extern_args()
+        for dim in self._arr_dims:
+            dim.intent = 'inout'
+        self.extern_args = list(self._arr_dims)
+
+    def pre_call_code(self):
+        code = []
+        if self.orig_arg.dimension.dims[0].is_assumed_shape:
+            code += ['%s = 0' % dim.name for dim in self._arr_dims]
+            code.append('if (.not. allocated(%s)) return' % self.intern_name)
+        for idx, dim in enumerate(self._arr_dims):
+            code.append('%s = size(%s, %d)' % (dim.name, self.intern_name,
+                                                idx+1))
+        return code
+
+
 class ScalarPtrWrapper(ArgWrapper):
 
+    __slots__ = ()
+
     def _set_intern_name(self):
         self.intern_name = _arg_name_mangler(self.name)
 
@@ -482,10 +898,13 @@ class ScalarPtrWrapper(ArgWrapper):
 
 
 class LogicalWrapper(ScalarPtrWrapper):
-    pass
+
+    __slots__ = ()
 
 class CharArgWrapper(ScalarPtrWrapper):
 
+    __slots__ = ('len_arg', 'is_assumed_len', 'orig_len', 'intern_dtype')
+
     def _set_intern_vars(self):
         self.len_arg = pyf.Argument(name="%s_len" % self.intern_name,
                                     dtype=pyf.dim_dtype,
@@ -493,9 +912,9 @@ class CharArgWrapper(ScalarPtrWrapper):
         self.is_assumed_len = (self.dtype.len == '*')
         self.orig_len = self.dtype.len
         if self.is_assumed_len:
-            self.intern_dtype = pyf.CharacterType(self.ktp,
-                                 len=self.len_arg.name,
-                                 mangler="%s")
+            self.intern_dtype = pyf.intern_dtype(
+                    pyf.CharacterType(self.ktp, len=self.len_arg.name,
+                                      mangler="%s"))
         else:
             self.intern_dtype = self.dtype
         self._set_intern_var()
@@ -528,6 +947,8 @@ class CharArgWrapper(ScalarPtrWrapper):
 
 class ArrayPtrArg(ArrayArgWrapper):
 
+    __slots__ = ()
+
     def _set_intern_name(self):
         self.intern_name = _arg_name_mangler(self.name)
 
@@ -555,6 +976,52 @@ class ArrayPtrArg(ArrayArgWrapper):
     def pre_call_code(self):
         return self._check_code() + self._pointer_call()
 
+class StridedArrayArgWrapper(ArrayPtrArg):
+
+    # An assumed-shape array passed with its extents and its strides in
+    # elements, so that a strided view of an array needn't be copied.  The
+    # data is mapped to a pointer to the whole block the view spans, and the
+    # procedure gets the section of it that the view selects.  That takes
+    # strides that grow with the dimensions, each (past the second) a
+    # multiple of the previous one and spanning its extent; the Cython
+    # wrapper copies arrays whose strides don't fit.
+
+    __slots__ = ('_arr_strides',)
+
+    strided = True
+
+    def _set_extern_args(self):
+        super(StridedArrayArgWrapper, self)._set_extern_args()
+        self._arr_strides = []
+        for idx in range(self.ndims):
+            self._arr_strides.append(
+                    pyf.Argument(name='%s_s%d' % (self.name, idx+1),
+                                 dtype=pyf.dim_dtype, intent='in'))
+        self.extern_args = (self._arr_dims + self._arr_strides +
+                            [self.extern_arg])
+        # The section is only known once the extern arguments are.
+        dims = [dim.name for dim in self._arr_dims]
+        strides = [stride.name for stride in self._arr_strides]
+        sections = ['1:(%s - 1) * %s + 1:%s' % (dims[0], strides[0],
+                                                 strides[0])]
+        sections += ['1:%s' % dim for dim in dims[1:]]
+        self.intern_name = '%s(%s)' % (self.intern_var.name,
+                                       ', '.join(sections))
+
+    def _pointer_call(self):
+        dims = [dim.name for dim in self._arr_dims]
+        strides = [stride.name for stride in self._arr_strides]
+        if self.ndims == 1:
+            shape = ['(%s - 1) * %s + 1' % (dims[0], strides[0])]
+        else:
+            shape = [strides[1]]
+            for idx in range(1, self.ndims - 1):
+                shape.append('%s / %s' % (strides[idx+1], strides[idx]))
+            shape.append(dims[-1])
+        return ['call c_f_pointer(%s, %s, (/ %s /))' %
+                (self.extern_arg.name, self.intern_var.name,
+                 ', '.join(shape))]
+
 # FIXME: uncomment when logical arrays use c_f_pointer
 # FIXME: currently this is a workaround for 4.3.3 <= gfortran version < 4.4.
 # class LogicalArrayArgWrapper(ArrayPtrArg):
@@ -563,6 +1030,8 @@ class ArrayPtrArg(ArrayArgWrapper):
 
 class CharArrayArgWrapper(ArrayPtrArg):
 
+    __slots__ = ('len_arg', 'is_assumed_len', 'orig_len', 'intern_dtype')
+
     def _set_intern_vars(self):
         self.len_arg = pyf.Argument(name="%s_len" % self.intern_name,
                                     dtype=pyf.dim_dtype,
@@ -570,9 +1039,9 @@ class CharArrayArgWrapper(ArrayPtrArg):
         self.is_assumed_len = (self.dtype.len == '*')
         self.orig_len = self.dtype.len
         if self.is_assumed_len:
-            self.intern_dtype = pyf.CharacterType(self.ktp,
-                                 len=self.len_arg.name,
-                                 mangler="%s")
+            self.intern_dtype = pyf.intern_dtype(
+                    pyf.CharacterType(self.ktp, len=self.len_arg.name,
+                                      mangler="%s"))
         else:
             self.intern_dtype = self.dtype
 
@@ -11,7 +11,7 @@
 
 from pyparsing_py2 import (Literal, CaselessLiteral, Word, Group, Optional,
         ZeroOrMore, Forward, nums, alphas, Regex, Combine, TokenConverter,
-        QuotedString, FollowedBy, Empty)
+        QuotedString, FollowedBy, Empty, ParserElement)
 
 from visitor import TreeVisitor
 
@@ -196,6 +196,11 @@ def get_fort_expr_bnf():
     if fort_expr_bnf:
         return fort_expr_bnf
 
+    # The alternatives in primary and the operand rules backtrack over the
+    # same input a lot; memoizing cuts that down considerably.  The parse
+    # actions only build nodes, so it is safe to do.
+    ParserElement.enablePackrat()
+
     expr = Forward()
 
     lpar = Literal("(").suppress()
@@ -307,5 +312,20 @@ def get_fort_expr_bnf():
     fort_expr_bnf = expr
     return fort_expr_bnf
 
+# The same few dimension and kind expressions ('n', ':', '*', ...) come up
+# over and over, so parsed expressions are memoized.  The memo is simply
+# emptied when it reaches PARSE_MEMO_SIZE entries.  The parse trees returned
+# are shared and must not be modified.
+PARSE_MEMO_SIZE = 10000
+_parse_memo = {}
+
 def parse(s):
-    return get_fort_expr_bnf().parseString(s, parseAll=False).asList()[0]
+    try:
+        return _parse_memo[s]
+    except KeyError:
+        pass
+    result = get_fort_expr_bnf().parseString(s, parseAll=False).asList()[0]
+    if len(_parse_memo) >= PARSE_MEMO_SIZE:
+        _parse_memo.clear()
+    _parse_memo[s] = result
+    return result
@@ -3,39 +3,348 @@
 # All rights reserved. See LICENSE.txt.
 #------------------------------------------------------------------------------
 
+import os
+import re
+
 from fwrap import pyf_iface as pyf
 from fparser import api
 
-def generate_ast(fsrcs):
+def generate_ast(fsrcs, jobs=1, cache=None):
+    r"""Parse the Fortran sources in fsrcs, returning a list of
+    pyf_iface procedures.
+
+    If jobs > 1 the sources are parsed concurrently in a pool of worker
+    processes.  Only the extracted procedures are sent back from the
+    workers, and the order of the returned list is the same as for the
+    serial parse.
+
+    If cache is a parse_cache.ParseCache, sources whose contents are found in
+    it are not parsed again, and newly parsed sources are added to it.
+
+    Each procedure's `source` is set to the path of the file it was parsed
+    from, or to '<string N>' for the Nth source if it was given as a string.
+    """
+    per_src = [None] * len(fsrcs)
+    keys = [None] * len(fsrcs)
+    if cache is not None:
+        for idx, src in enumerate(fsrcs):
+            keys[idx] = cache.key(src)
+            per_src[idx] = cache.load(keys[idx])
+
+    todo = [idx for idx, procs in enumerate(per_src) if procs is None]
+    todo_srcs = [fsrcs[idx] for idx in todo]
+    jobs = min(jobs, len(todo_srcs))
+    if jobs > 1:
+        parsed = _parallel_parse(todo_srcs, jobs)
+    else:
+        parsed = [_parse_src(src) for src in todo_srcs]
+
+    for idx, procs in zip(todo, parsed):
+        per_src[idx] = procs
+        if cache is not None:
+            cache.store(keys[idx], procs)
+    if cache is not None and todo:
+        cache.prune()
+
     ast = []
-    for src in fsrcs:
-        block = api.parse(src, analyze=True)
-        tree = block.content
-        for proc in tree:
-
-            if not is_proc(proc):
-                # we ignore non-top-level procedures until modules are supported.
-                continue
-
-            args = _get_args(proc)
-            params = _get_params(proc)
-
-            if proc.blocktype == 'subroutine':
-                ast.append(pyf.Subroutine(
-                                name=proc.name,
-                                args=args,
-                                params=params))
-            elif proc.blocktype == 'function':
-                ast.append(pyf.Function(
-                                name=proc.name,
-                                args=args,
-                                params=params,
-                                return_arg=_get_ret_arg(proc)))
+    for idx, procs in enumerate(per_src):
+        source = _source_name(fsrcs[idx], idx)
+        for proc in procs:
+            proc.source = source
+        ast.extend(procs)
+    _propagate_shared_state(ast)
     return ast
 
+def _source_name(src, idx):
+    if os.path.isfile(src):
+        return src
+    return '<string %d>' % idx
+
+def _parallel_parse(fsrcs, jobs):
+    from multiprocessing import Pool
+    pool = Pool(processes=jobs)
+    try:
+        per_src = pool.map(_parse_src, fsrcs, chunksize=1)
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return per_src
+
+# fparser fails on the type statement of a bind(c) derived type, so the
+# attribute is blanked out before parsing (which keeps the columns of fixed
+# form source) and the names of the types that had it are kept here.
+_bind_c_types = set()
+
+_type_stmt = re.compile(r'^([ \t]*type[ \t]*,[^:\n]*)::[ \t]*([a-z]\w*)',
+                        re.I | re.M)
+_bind_c_attr = re.compile(r',\s*bind\s*\(\s*c\s*\)', re.I)
+
+def _blank_bind_c(match):
+    attrs = _bind_c_attr.sub(lambda m: ' ' * len(m.group()), match.group(1))
+    if attrs != match.group(1):
+        _bind_c_types.add(match.group(2).lower())
+    return match.group(0).replace(match.group(1), attrs, 1)
+
+# Nor does it know the impure prefix (Fortran 2008), which is blanked out
+# the same way; the procedures that had it are kept here.
+_impure_procs = set()
+
+_impure_stmt = re.compile(r'^([^!\n]*?)\bimpure\b([^!\n]*?\b(?:subroutine|'
+                          r'function)[ \t]+([a-z]\w*))', re.I | re.M)
+
+def _blank_impure(match):
+    _impure_procs.add(match.group(3).lower())
+    return '%s%s%s' % (match.group(1), ' ' * len('impure'), match.group(2))
+
+def _parse_fortran(src):
+    _bind_c_types.clear()
+    _impure_procs.clear()
+    if os.path.isfile(src):
+        fh = open(src)
+        try:
+            text = fh.read()
+        finally:
+            fh.close()
+    else:
+        text = src
+    text = _type_stmt.sub(_blank_bind_c, text)
+    text = _impure_stmt.sub(_blank_impure, text)
+    if not (_bind_c_types or _impure_procs):
+        return api.parse(src, analyze=True)
+    # parse the text in the format fparser would have read src in.
+    fmt = api.get_reader(src).format
+    return api.parse(text, isfree=fmt.is_free, isstrict=fmt.is_strict,
+                     analyze=True)
+
+def _parse_src(src):
+    ast = []
+    block = _parse_fortran(src)
+    tree = block.content
+    for unit in tree:
+        if unit.blocktype == 'module':
+            ast.extend(_parse_module(unit))
+        elif is_proc(unit):
+            ast.append(_get_proc(unit))
+    return ast
+
+def _get_proc(proc, module=None, module_params=()):
+    args = _get_args(proc)
+    params = _get_params(proc)
+    if module_params:
+        # the procedure's own parameters hide the module's.
+        names = set([param.name for param in params])
+        params += [param for param in module_params
+                        if param.name not in names]
+
+    if proc.blocktype == 'subroutine':
+        pyf_proc = pyf.Subroutine(
+                        name=proc.name,
+                        args=args,
+                        params=params)
+    elif proc.blocktype == 'function':
+        pyf_proc = pyf.Function(
+                        name=proc.name,
+                        args=args,
+                        params=params,
+                        return_arg=_get_ret_arg(proc))
+    pyf_proc.shared_state, pyf_proc.calls = _get_shared_state(proc)
+    pyf_proc.bind_c = _get_bind_c(proc, pyf_proc)
+    # An impure elemental procedure is wrapped like any other: its ufunc
+    # would call it without the GIL.
+    pyf_proc.elemental = (bool(proc.is_elemental()) and
+                          proc.name.lower() not in _impure_procs)
+    if module is not None:
+        pyf_proc.module = module.name.lower()
+        if _has_state(module):
+            pyf_proc.shared_state = pyf._intern_names(
+                    pyf_proc.shared_state |
+                    frozenset(['module:%s' % pyf_proc.module]))
+    return pyf_proc
+
+def _parse_module(module):
+    r"""Return the public procedures of module, and a pyf.ModuleArray for
+    each of its public arrays that can be viewed from Python.
+
+    Modules were skipped altogether before, so anything in them that can't
+    be wrapped yet (e.g. arguments with kinds given by module parameters) is
+    skipped rather than an error.
+    """
+    ast = []
+    params = []
+    for name in module.a.variable_names:
+        var = module.a.variables[name]
+        if var.is_parameter():
+            try:
+                params.append(_get_param(var))
+            except (RuntimeError, ValueError):
+                # array parameters, which no declaration needs.
+                pass
+    for name in module.a.variable_names:
+        var = module.a.variables[name]
+        if not (_is_public(module, name) and _is_viewable(var)):
+            continue
+        try:
+            array = pyf.Argument(name=var.name, dtype=_get_dtype(
+                                        var.get_typedecl()),
+                                 dimension=var.get_array_spec())
+            ast.append(pyf.ModuleArray(array, module.name.lower(), params))
+        except RuntimeError:
+            pass
+    for stmt in module.content:
+        if not (is_proc(stmt) and _is_public(module, stmt.name)):
+            continue
+        try:
+            ast.append(_get_proc(stmt, module, params))
+        except RuntimeError:
+            pass
+    return ast
+
+def _is_public(module, name):
+    name = name.lower()
+    private = [nm.lower() for nm in module.a.private_id_list]
+    public = [nm.lower() for nm in module.a.public_id_list]
+    if 'PRIVATE' in [attr.upper() for attr in module.a.attributes]:
+        return name in public
+    return name not in private
+
+def _is_viewable(var):
+    # numeric arrays, explicit-shape or allocatable, that are module
+    # variables in their own right.
+    if (not var.is_array() or var.is_parameter() or var.is_pointer() or
+            var.get_typedecl().name not in ('integer', 'real',
+                                            'doubleprecision', 'complex',
+                                            'doublecomplex')):
+        return False
+    if var.is_allocatable():
+        return True
+    for dim in pyf.Dimension(var.get_array_spec()):
+        if not dim.is_explicit_shape:
+            return False
+    return True
+
+def _has_state(module):
+    for name in module.a.variable_names:
+        if not module.a.variables[name].is_parameter():
+            return True
+    return False
+
 
 def is_proc(proc):
-    return proc.blocktype in ('subroutine', 'function')
+    return getattr(proc, 'blocktype', None) in ('subroutine', 'function')
+
+# Modules supplied by the compiler, which hold no state of their own.
+INTRINSIC_MODULES = frozenset(['iso_c_binding', 'iso_fortran_env',
+                               'ieee_arithmetic', 'ieee_exceptions',
+                               'ieee_features'])
+
+IO_STATEMENTS = frozenset(['Read', 'Write', 'Print', 'Open', 'Close',
+                           'Inquire', 'Rewind', 'Backspace', 'Endfile',
+                           'Flush', 'Wait'])
+
+def _walk(block):
+    for stmt in block.content:
+        yield stmt
+        if hasattr(stmt, 'content'):
+            for sub in _walk(stmt):
+                yield sub
+
+def _get_shared_state(proc):
+    r"""Return the state shared between calls that proc's body uses (see
+    pyf.Procedure.shared_state), and the names of the procedures it calls.
+
+    Functions referenced in expressions aren't found, nor is what is done
+    by procedures outside the parsed sources.
+    """
+    shared = set()
+    calls = set()
+    saves = False
+    for stmt in _walk(proc):
+        # fparser has e.g. Read0 and Read1 for the two forms of READ.
+        kind = type(stmt).__name__.rstrip('0123456789')
+        if kind == 'Common':
+            for blkname, names in stmt.items:
+                shared.add('common:%s' % (blkname.lower() or '_blank'))
+        elif kind == 'Use':
+            if stmt.name.lower() not in INTRINSIC_MODULES:
+                shared.add('module:%s' % stmt.name.lower())
+        elif kind in ('Save', 'Data'):
+            saves = True
+        elif kind in IO_STATEMENTS:
+            shared.add('io')
+        elif kind == 'Call':
+            calls.add(stmt.designator.lower())
+    for var in proc.a.variables.values():
+        if var.is_parameter():
+            continue
+        # initialized variables are implicitly SAVEd.
+        if var.init is not None or 'SAVE' in [attr.upper() for attr
+                                                 in var.attributes]:
+            saves = True
+    if saves:
+        shared.add('save:%s' % proc.name.lower())
+    return pyf._intern_names(shared), pyf._intern_names(calls)
+
+def _propagate_shared_state(ast):
+    # A procedure shares whatever the procedures it calls do.
+    by_name = dict([(proc.name.lower(), proc) for proc in ast])
+    changed = True
+    while changed:
+        changed = False
+        for proc in ast:
+            shared = proc.shared_state
+            for callee in proc.calls:
+                if callee in by_name:
+                    shared = shared | by_name[callee].shared_state
+            if shared != proc.shared_state:
+                proc.shared_state = pyf._intern_names(shared)
+                changed = True
+
+def _get_bind_c(proc, pyf_proc):
+    r"""Return the binding label of proc if it is bind(c) and C can call it
+    directly, else None.
+
+    That takes integer and real arguments of iso_c_binding kinds, scalars or
+    arrays whose extents (but for an assumed size) are expressions of the
+    integer scalar arguments, so that the Cython wrapper can check them.
+    """
+    if not getattr(proc, 'bind', None):
+        return None
+    args = list(pyf_proc.args)
+    if pyf_proc.kind == 'function':
+        if pyf_proc.return_arg.dimension:
+            return None
+        args.append(pyf_proc.return_arg)
+    scalar_names = set([arg.name for arg in pyf_proc.args
+                            if not arg.dimension and
+                               arg.dtype.type == 'integer' and
+                               arg.intent in ('in', 'inout', None)])
+    for arg in args:
+        if (arg.dtype.type not in ('integer', 'real') or
+                arg.dtype.kind not in pyf.iso_c_kinds):
+            return None
+        if not arg.dimension:
+            continue
+        if arg.isvalue:
+            return None
+        dims = list(arg.dimension)
+        if dims[-1].is_assumed_size:
+            dims.pop()
+        for dim in dims:
+            if not dim.is_explicit_shape:
+                return None
+            for sie in dim.spec:
+                if sie.funcnames or not sie.names <= scalar_names:
+                    return None
+    label = proc.name.lower()
+    for spec in proc.bind[1:]:
+        key, _, value = spec.partition('=')
+        if key.strip().lower() == 'name':
+            label = value.strip().strip('"\'')
+    return label
 
 def _get_ret_arg(proc):
     ret_var = proc.get_variable(proc.result)
@@ -62,9 +371,15 @@ def _get_arg(p_arg):
     p_typedecl = p_arg.get_typedecl()
     dtype = _get_dtype(p_typedecl)
     name = p_arg.name
-    intent = _get_intent(p_arg)
+    isvalue = 'VALUE' in [attr.upper() for attr in p_arg.attributes] or None
+    if isvalue and not p_arg.intent:
+        # changes to a VALUE argument aren't seen by the caller.
+        intent = 'in'
+    else:
+        intent = _get_intent(p_arg)
     if p_arg.is_scalar():
-        return pyf.Argument(name=name, dtype=dtype, intent=intent)
+        return pyf.Argument(name=name, dtype=dtype, intent=intent,
+                            isvalue=isvalue)
     elif p_arg.is_array():
         p_dims = p_arg.get_array_spec()
         dimspec = pyf.Dimension(p_dims)
@@ -127,7 +442,47 @@ name2type = {
         'logical' : pyf.LogicalType,
         }
 
+def _get_derived_type(typedecl):
+    name = typedecl.name.lower()
+    decl = typedecl.get_type_decl(name)
+    if decl is None or name not in _bind_c_types:
+        raise RuntimeError(
+                "only bind(c) derived types supported ATM... [%s]" % name)
+    module = decl.parent
+    if getattr(module, 'blocktype', None) != 'module':
+        raise RuntimeError(
+                "derived type '%s' isn't defined in a module" % name)
+    components = []
+    for comp_name in decl.a.component_names:
+        var = decl.a.components[comp_name]
+        dtype = _get_dtype(var.get_typedecl())
+        if dtype.type not in ('integer', 'real', 'complex', 'type'):
+            raise RuntimeError(
+                    "unsupported type for component '%s' of derived type "
+                    "'%s'" % (comp_name, name))
+        extents = ()
+        if var.is_array():
+            extents = _const_extents(var.get_array_spec())
+        components.append((comp_name.lower(), dtype, extents))
+    return pyf.intern_dtype(pyf.DerivedType(fw_ktp=name, name=name,
+                                            module=module.name.lower(),
+                                            components=components))
+
+_const_expr = re.compile(r'[\d\s()+*-]+$').match
+
+def _const_extents(array_spec):
+    extents = []
+    for dim in pyf.Dimension(array_spec):
+        if not (dim.is_explicit_shape and _const_expr(dim.sizeexpr)):
+            raise RuntimeError(
+                    "only constant extents supported for derived type "
+                    "components ATM, given '%s'" % dim.sizeexpr)
+        extents.append(int(eval(dim.sizeexpr)))
+    return tuple(extents)
+
 def _get_dtype(typedecl):
+    if typedecl.is_derived():
+        return _get_derived_type(typedecl)
     if not typedecl.is_intrinsic():
         raise RuntimeError(
                 "only intrinsic types supported ATM... [%s]" % str(typedecl))
@@ -143,19 +498,23 @@ def _get_dtype(typedecl):
             fw_ktp = '%s_xX' % (typedecl.name)
         else:
             fw_ktp = '%s_x%s' % (typedecl.name, length)
-        return pyf.CharacterType(fw_ktp=fw_ktp,
-                        len=length, kind=kind)
+        return pyf.intern_dtype(pyf.CharacterType(fw_ktp=fw_ktp,
+                        len=length, kind=kind))
     if length and not kind:
-        return name2type[typedecl.name](fw_ktp="%s_x%s" %
+        return pyf.intern_dtype(name2type[typedecl.name](fw_ktp="%s_x%s" %
                 (typedecl.name, length),
-                length=length)
+                length=length))
+    if kind.lower() in pyf.iso_c_kinds:
+        kind = kind.lower()
+        return pyf.intern_dtype(name2type[typedecl.name](fw_ktp="%s_%s" %
+                (typedecl.name, kind), kind=kind))
     try:
         int(kind)
     except ValueError:
         raise RuntimeError(
-                "only integer constant kind "
+                "only integer constant and iso_c_binding kind "
                     "parameters supported ATM, given '%s'" % kind)
     if typedecl.name == 'doubleprecision':
         return pyf.default_dbl
-    return name2type[typedecl.name](fw_ktp="%s_%s" %
-            (typedecl.name, kind), kind=kind)
+    return pyf.intern_dtype(name2type[typedecl.name](fw_ktp="%s_%s" %
+            (typedecl.name, kind), kind=kind))
@@ -11,6 +11,8 @@ from optparse import OptionParser, OptionGroup
 
 PROJECT_OUTDIR = 'fwproj'
 PROJECT_NAME = PROJECT_OUTDIR
+# The copy of the --config file in the project directory.
+CONFIG_NAME = 'fwrap.cfg'
 
 def setup_dirs(dirname):
     p = os.path
@@ -53,6 +55,9 @@ def proj_dir(name):
 def configure_cb(opts, args, orig_args):
     wipe_out(proj_dir(opts.outdir))
     setup_dirs(proj_dir(opts.outdir))
+    if opts.config:
+        shutil.copy(opts.config,
+                    os.path.join(proj_dir(opts.outdir), CONFIG_NAME))
 
 def build_cb(opts, args, argv):
     srcs = []
@@ -116,9 +121,19 @@ def fwrapc(argv):
             help='name for the extension module [default %default]')
     configure_opts.add_option("--outdir",
             help='directory for the intermediate files [default %default]')
+    configure_opts.add_option("--shards", type="int",
+            help='number of extension modules to split the wrappers '
+                 'into [default %default]')
+    configure_opts.add_option("--lazy", action="store_true",
+            help='import each extension module on first use of one of '
+                 'its procedures')
+    configure_opts.add_option("--config",
+            help='options for the generated wrappers, see '
+                 'fwrap/configuration.py')
     parser.add_option_group(configure_opts)
 
-    conf_defaults = dict(name=PROJECT_NAME, outdir=PROJECT_OUTDIR)
+    conf_defaults = dict(name=PROJECT_NAME, outdir=PROJECT_OUTDIR, shards=1,
+                         lazy=False, config=None)
     parser.set_defaults(**conf_defaults)
 
     opts, args = parser.parse_args(args=argv)
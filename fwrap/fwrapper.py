@@ -6,6 +6,10 @@
 # encoding: utf-8
 
 import os
+import re
+import errno
+import random
+import shutil
 from optparse import OptionParser
 
 from fwrap import constants
@@ -13,10 +17,14 @@ from fwrap import gen_config as gc
 from fwrap import fc_wrap
 from fwrap import cy_wrap
 from fwrap.code import CodeBuffer, reflow_fort
+from fwrap.profiling import Profiler, NullProfiler
+from fwrap.configuration import Configuration
 
 PROJNAME = 'fwproj'
+SHARD_BY = ('count', 'size', 'file')
 
-def wrap(sources, name=PROJNAME):
+def wrap(sources, name=PROJNAME, jobs=1, parse_cache=False, shards=1,
+         shard_by='count', lazy=False, cfg=None, profiler=None):
     r"""Generate wrappers for sources.
 
     The core wrapping routine for fwrap.  Generates wrappers for the sources
@@ -28,6 +36,18 @@ def wrap(sources, name=PROJNAME):
        wrapped.
      - *name* - (string) Name of the project and the name of the resulting
        python module
+     - *jobs* - (int) Number of processes used to parse the sources.
+     - *parse_cache* - (bool or `parse_cache.ParseCache`) Reuse the parse
+       results cached on disk for sources that haven't changed; see
+       `parse`.
+     - *shards*, *shard_by*, *lazy* - How to split the wrappers into
+       several Cython extension modules; see `generate`.
+     - *cfg* - (`configuration.Configuration`) Options for the generated
+       wrappers.
+     - *profiler* - (`profiling.Profiler`) If given, the time and memory
+       used by each phase of the wrapping is recorded in it.
+
+     Returns the same as `generate`.
     """
 
     # validate name
@@ -48,88 +68,268 @@ def wrap(sources, name=PROJNAME):
     if not source_files:
         raise ValueError("Invalid source list. %r" % (sources))
 
-    # Parse fortran using fparser, get fortran ast.
-    f_ast = parse(source_files)
+    if profiler is None:
+        profiler = NullProfiler()
+    profiler.start('wrap')
+    try:
+        # Parse fortran using fparser, get fortran ast.
+        f_ast = profiler.call('parse', parse, source_files, jobs=jobs,
+                              parse_cache=parse_cache)
 
-    # Generate wrapper files
-    generate(f_ast, name)
+        # Generate wrapper files
+        return generate(f_ast, name, shards=shards, shard_by=shard_by,
+                        lazy=lazy, cfg=cfg, profiler=profiler)
+    finally:
+        profiler.stop()
 
-def parse(source_files):
+def parse(source_files, jobs=1, parse_cache=False):
     r"""Parse fortran code returning parse tree
 
     :Input:
      - *source_files* - (list) List of valid source files
+     - *jobs* - (int) Number of processes to parse the source files with; the
+       files are parsed serially if jobs <= 1.
+     - *parse_cache* - (bool or `parse_cache.ParseCache`) Cache of parsed
+       sources; if True the default on-disk cache is used, in
+       $FWRAP_CACHE_DIR or else $XDG_CACHE_HOME/fwrap (~/.cache/fwrap).
     """
     from fwrap import fwrap_parse
-    ast = fwrap_parse.generate_ast(source_files)
+    from fwrap.parse_cache import ParseCache
+    if parse_cache is True:
+        parse_cache = ParseCache()
+    elif not parse_cache:
+        parse_cache = None
+    ast = fwrap_parse.generate_ast(source_files, jobs=jobs,
+                                   cache=parse_cache)
 
     return ast
 
-def generate(fort_ast, name):
+def generate(fort_ast, name, shards=1, shard_by='count', lazy=False,
+             cfg=None, profiler=None):
     r"""Given a fortran abstract syntax tree ast, generate wrapper files
 
     :Input:
      - *fort_ast* - (`fparser.ProgramBlock`) Abstract syntax tree from parser
      - *name* - (string) Name of the library module
+     - *shards* - (int) If greater than one, the Cython wrappers are split
+       into that many .pyx/.pxd pairs (name_s0, name_s1, ...) that can be
+       cythonized and compiled in parallel, and a python module `name` is
+       generated that re-exports them.
+     - *shard_by* - (string) How the procedures are grouped into shards:
+       'count' splits them into *shards* groups, 'size' into groups of
+       *shards* procedures, and 'file' puts the procedures of each Fortran
+       source file in their own shard.  Any but 'count' always shards.
+     - *lazy* - (bool) Generate a `name` module that imports a shard only
+       when one of its procedures is first used, rather than all of them
+       on import.  Calling `name.load_all()`, or importing `name` with
+       FWRAP_EAGER_IMPORT set in the environment, imports every shard.
+     - *cfg* - (`configuration.Configuration`) Options for the generated
+       wrappers, globally or per procedure or argument; the defaults if
+       None.
+     - *profiler* - (`profiling.Profiler`) Records the time and memory used
+       to build the wrapper trees and by each generator.
+
+     Returns a tuple of the list of output files that were (re)written and
+     the total number of output files; outputs whose contents are unchanged
+     are not rewritten.
 
      Raises `Exception.IOError` if writing the generated code fails.
     """
 
+    if profiler is None:
+        profiler = NullProfiler()
+
     # Generate wrapping abstract syntax trees
     # logger.info("Generating abstract syntax tress for c and cython.")
-    c_ast = fc_wrap.wrap_pyf_iface(fort_ast)
-    cython_ast = cy_wrap.wrap_fc(c_ast)
+    c_ast = profiler.call('wrap_pyf_iface', fc_wrap.wrap_pyf_iface, fort_ast,
+                          cfg)
+    cython_ast = profiler.call('wrap_fc', cy_wrap.wrap_fc, c_ast, cfg)
 
     # Generate files and write them out
     generators = ( (generate_type_specs,(c_ast,name)),
-                   (generate_fc_f,(c_ast,name)),
+                   (generate_fc_f,(c_ast,name,profiler)),
                    (generate_fc_h,(c_ast,name)),
-                   (generate_fc_pxd,(c_ast,name)),
-                   (generate_cy_pxd,(cython_ast,name)),
-                   (generate_cy_pyx,(cython_ast,name)) )
+                   (generate_fc_pxd,(c_ast,name,cfg)) )
+    if shards > 1 or shard_by != 'count' or lazy:
+        generators += generate_cy_shards(cython_ast, name, shards,
+                                         shard_by, lazy)
+    else:
+        generators += ( (generate_cy_pxd,(cython_ast,name)),
+                        (generate_cy_pyx,(cython_ast,name)) )
 
+    old_shards = read_shard_names(os.getcwd(), name)
+    written_files = []
+    updated = []
     for (generator,args) in generators:
-        file_name, buf = generator(*args)
-        write_to_dir(os.getcwd(), file_name, buf)
+        profiler.start(generator.__name__)
+        file_name = None
+        try:
+            file_name, buf = generator(*args)
+            written = profiler.call('write_to_dir', write_to_dir,
+                                    os.getcwd(), file_name, buf)
+        finally:
+            profiler.stop(file_name)
+        written_files.append(file_name)
+        if written:
+            updated.append(file_name)
+    if old_shards:
+        remove_stale_shards(os.getcwd(), name, old_shards, written_files)
+    return updated, len(generators)
 
-def write_to_dir(dir, file_name, buf):
-    fh = open(os.path.join(dir, file_name), 'w')
+def read_shard_names(dir, name):
+    r"""Return the names of the shards of the module name that the package
+    module fwrap last wrote to dir lists, or [] if there is none.
+    """
+    path = os.path.join(dir, constants.PY_MOD_TMPL % name)
+    if not os.path.isfile(path):
+        return []
+    fh = open(path)
     try:
-        if isinstance(buf, basestring):
-            fh.write(buf)
-        else:
-            fh.write(buf.getvalue())
+        line = fh.readline()
     finally:
         fh.close()
+    if not line.startswith(cy_wrap.SHARDS_MARKER):
+        return []
+    return line[len(cy_wrap.SHARDS_MARKER):].split()
+
+def remove_stale_shards(dir, name, old_shards, written):
+    r"""Remove the files of the shards old_shards of the module name in dir
+    (their sources, and the C files cythonized from them) that weren't
+    rewritten, e.g. those of an earlier run with more shards, so that they
+    aren't compiled or imported.  If the module is no longer sharded, its
+    package and common modules are removed too.
+    """
+    written = dict([(file_name, True) for file_name in written])
+    stale = []
+    for shard in old_shards:
+        if constants.CY_PYX_TMPL % shard not in written:
+            stale += [constants.CY_PYX_TMPL % shard,
+                      constants.CY_PXD_TMPL % shard, '%s.c' % shard]
+    if constants.PY_MOD_TMPL % name not in written:
+        stale += [constants.PY_MOD_TMPL % name,
+                  constants.PY_MOD_TMPL % (constants.CY_COMMON_TMPL % name)]
+    for file_name in stale:
+        path = os.path.join(dir, file_name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+def write_to_dir(dir, file_name, buf):
+    r"""Write buf to dir/file_name if its contents differ from the file's.
+
+    The file is written to a temporary file that is renamed into place,
+    which replaces it atomically on POSIX systems; Windows can't rename over
+    an existing file, so there the old file is removed first.  A replaced
+    file keeps its mode.  The file is left untouched if it is already up to
+    date so that its mtime doesn't trigger rebuilds.  Returns True if the
+    file was written.
+    """
+    if not isinstance(buf, basestring):
+        buf = buf.getvalue()
+    path = os.path.join(dir, file_name)
+    if os.path.isfile(path):
+        fh = open(path, 'rb')
+        try:
+            if fh.read() == buf:
+                return False
+        finally:
+            fh.close()
+    fd, tmp_path = _mkstemp(dir, file_name)
+    try:
+        fh = os.fdopen(fd, 'wb')
+        try:
+            fh.write(buf)
+        finally:
+            fh.close()
+        if os.path.isfile(path):
+            shutil.copymode(path, tmp_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Windows won't rename over an existing file.
+            os.remove(path)
+            os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+def _mkstemp(dir, prefix):
+    # Like tempfile.mkstemp, but the file is created with the mode of any
+    # new file (0666 less the umask) rather than readable by the owner only.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        path = os.path.join(dir, '%s.%06x.tmp' %
+                                 (prefix, random.getrandbits(24)))
+        try:
+            return os.open(path, flags, 0666), path
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
 
 def generate_type_specs(f_ast, name):
     buf = CodeBuffer()
     gc.generate_type_specs(f_ast, buf)
     return constants.TYPE_SPECS_SRC, buf
 
-def generate_cy_pxd(cy_ast, name):
+def generate_cy_shards(cy_ast, name, nshards, shard_by='count', lazy=False):
+    if shard_by == 'count':
+        shards = cy_wrap.shard_ast(cy_ast, nshards)
+    elif shard_by == 'size':
+        shards = cy_wrap.group_ast_by_size(cy_ast, nshards)
+    elif shard_by == 'file':
+        shards = cy_wrap.group_ast_by_source(cy_ast)
+    else:
+        raise ValueError("unknown shard_by %r, expected one of %s" %
+                         (shard_by, ', '.join(SHARD_BY)))
+    shard_names = [constants.CY_SHARD_TMPL % (name, idx)
+                        for idx in range(len(shards))]
+    common = constants.CY_COMMON_TMPL % name
+    generators = [(generate_common_mod,(name,))]
+    for shard, shard_name in zip(shards, shard_names):
+        generators += [(generate_cy_pxd,(shard,shard_name,name)),
+                       (generate_cy_pyx,(shard,shard_name,common))]
+    generators.append((generate_shard_mod,(shards,shard_names,name,lazy)))
+    return tuple(generators)
+
+def generate_common_mod(name):
+    buf = CodeBuffer()
+    cy_wrap.generate_common_mod(name, buf)
+    return constants.PY_MOD_TMPL % (constants.CY_COMMON_TMPL % name), buf
+
+def generate_shard_mod(shards, shard_names, name, lazy=False):
+    buf = CodeBuffer()
+    cy_wrap.generate_shard_mod(shards, shard_names, name, buf, lazy=lazy)
+    return constants.PY_MOD_TMPL % name, buf
+
+def generate_cy_pxd(cy_ast, name, fc_name=None):
     buf = CodeBuffer()
-    fc_pxd_name = (constants.FC_PXD_TMPL % name).split('.')[0]
+    if fc_name is None:
+        fc_name = name
+    fc_pxd_name = (constants.FC_PXD_TMPL % fc_name).split('.')[0]
     cy_wrap.generate_cy_pxd(cy_ast, fc_pxd_name, buf)
     return constants.CY_PXD_TMPL % name, buf
 
-def generate_cy_pyx(cy_ast, name):
+def generate_cy_pyx(cy_ast, name, common=None):
     buf = CodeBuffer()
-    cy_wrap.generate_cy_pyx(cy_ast, name, buf)
+    cy_wrap.generate_cy_pyx(cy_ast, name, buf, common)
     return constants.CY_PYX_TMPL % name, buf
 
-def generate_fc_pxd(fc_ast, name):
+def generate_fc_pxd(fc_ast, name, cfg=None):
     buf = CodeBuffer()
     fc_header_name = constants.FC_HDR_TMPL % name
-    fc_wrap.generate_fc_pxd(fc_ast, fc_header_name, buf)
+    fc_wrap.generate_fc_pxd(fc_ast, fc_header_name, buf, cfg)
     return constants.FC_PXD_TMPL % name, buf
 
-def generate_fc_f(fc_ast, name):
+def generate_fc_f(fc_ast, name, profiler=None):
+    if profiler is None:
+        profiler = NullProfiler()
     buf = CodeBuffer()
     for proc in fc_ast:
         proc.generate_wrapper(buf)
     ret_buf = CodeBuffer()
-    ret_buf.putlines(reflow_fort(buf.getvalue()))
+    ret_buf.putlines(profiler.call('reflow_fort', reflow_fort,
+                                   buf.getvalue()))
     return constants.FC_F_TMPL % name, ret_buf
 
 def generate_fc_h(fc_ast, name):
@@ -144,7 +344,10 @@ def fwrapper(use_cmdline, sources=None, **options):
 
     if sources is None:
         sources = []
-    defaults = dict(name=PROJNAME)
+    defaults = dict(name=PROJNAME, jobs=1, parse_cache=False, shards=1,
+                    shard_by='count', lazy=False, config=None, strict=False,
+                    nogil=False, batched=False, lean=False, profile=False,
+                    profile_json=None)
     if options:
         defaults.update(options)
     usage ='''\
@@ -160,11 +363,101 @@ Cython, & Python.
         parser.add_option('-n', '--name', dest='name',
                           help='name for the project directory and extension module '
                           '[default: %default]')
+        parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                          help='number of processes used to parse the '
+                          'fortran sources [default: %default]')
+        parser.add_option('--parse-cache', dest='parse_cache',
+                          action='store_true',
+                          help='reuse the parse results of unchanged sources '
+                          'from an on-disk cache, kept in $FWRAP_CACHE_DIR '
+                          'or else $XDG_CACHE_HOME/fwrap (~/.cache/fwrap)')
+        parser.add_option('--no-parse-cache', dest='parse_cache',
+                          action='store_false',
+                          help='do not read or update the on-disk cache of '
+                          'parsed sources [the default]')
+        parser.add_option('--shards', dest='shards', type='int',
+                          help='split the Cython wrappers into this many '
+                          'extension modules [default: %default]')
+        parser.add_option('--shard-by', dest='shard_by', type='choice',
+                          choices=SHARD_BY,
+                          help="group the procedures into extension modules "
+                          "by 'count' (SHARDS modules), 'size' (SHARDS "
+                          "procedures per module) or 'file' (one module per "
+                          "source file) [default: %default]")
+        parser.add_option('--lazy', dest='lazy', action='store_true',
+                          help='import each extension module on first use '
+                          'of one of its procedures')
+        parser.add_option('--config', dest='config', metavar='FILE',
+                          help='read the options for the generated wrappers, '
+                          'globally or per procedure or argument, from FILE')
+        parser.add_option('--strict', dest='strict', action='store_true',
+                          help='raise an error instead of copying array '
+                          'arguments that are not aligned, Fortran '
+                          'contiguous arrays of the right type (overridden '
+                          'per procedure or argument by --config)')
+        parser.add_option('--nogil', dest='nogil', action='store_true',
+                          help='release the GIL while the Fortran '
+                          'procedures run; they must be thread safe '
+                          '(overridden per procedure by --config)')
+        parser.add_option('--auto-nogil', dest='nogil', action='store_const',
+                          const='auto',
+                          help='release the GIL while the Fortran '
+                          'procedures run, holding a lock for each COMMON '
+                          'block, module, set of SAVEd variables or I/O '
+                          'that a procedure uses')
+        parser.add_option('--batched', dest='batched', action='store_true',
+                          help='also generate a <proc>_batched wrapper that '
+                          'loops over a trailing batch dimension of the '
+                          'array arguments in Fortran')
+        parser.add_option('--batched-openmp', dest='batched',
+                          action='store_const', const='openmp',
+                          help='like --batched, with the loop run as an '
+                          'OpenMP parallel do for procedures that use no '
+                          'shared state')
+        parser.add_option('--lean', dest='lean', action='store_true',
+                          help='pass intent(in) numeric scalars by value and '
+                          'drop the error arguments of wrappers that check '
+                          'nothing (overridden per procedure by --config)')
+        parser.add_option('--profile', dest='profile', action='store_true',
+                          help='print the time and memory used by each '
+                          'phase of the wrapping')
+        parser.add_option('--profile-json', dest='profile_json',
+                          metavar='FILE',
+                          help='write the time and memory used by each '
+                          'phase of the wrapping to FILE as JSON')
         args = None
     else:
         args = sources
     parsed_options, source_files = parser.parse_args(args=args)
     if not source_files:
         parser.error("no source files")
-    wrap(source_files, parsed_options.name)
+    cfg = Configuration()
+    # The command line flags win over the [fwrap] section of the --config
+    # file; its per procedure and argument settings still apply.
+    if parsed_options.config:
+        cfg.read(parsed_options.config)
+    if parsed_options.strict:
+        cfg.set('strict', True)
+    if parsed_options.nogil:
+        cfg.set('nogil', parsed_options.nogil)
+    if parsed_options.batched:
+        cfg.set('batched', parsed_options.batched)
+    if parsed_options.lean:
+        cfg.set('lean', True)
+    profiler = None
+    if parsed_options.profile or parsed_options.profile_json:
+        profiler = Profiler()
+    updated, total = wrap(source_files, parsed_options.name,
+                          jobs=parsed_options.jobs,
+                          parse_cache=parsed_options.parse_cache,
+                          shards=parsed_options.shards,
+                          shard_by=parsed_options.shard_by,
+                          lazy=parsed_options.lazy,
+                          cfg=cfg,
+                          profiler=profiler)
+    print "fwrapper: %d of %d output files updated" % (len(updated), total)
+    if parsed_options.profile:
+        profiler.report()
+    if parsed_options.profile_json:
+        profiler.dump_json(parsed_options.profile_json)
     return 0
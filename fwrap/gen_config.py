@@ -13,10 +13,21 @@ INDENT = "    "
 # -- Collect, store and load type specifications to / from a file ---
 
 def all_dtypes(ast):
-    dtypes = set()
+    # Most dtypes are interned (pyf_iface.intern_dtype), so checking identity
+    # first leaves only the distinct objects to be hashed.  The result is in
+    # order of first use, which keeps the generated files stable.
+    seen = set()
+    distinct = set()
+    dtypes = []
     for proc in ast:
-        dtypes.update(proc.all_dtypes())
-    return list(dtypes)
+        for dtype in proc.all_dtypes():
+            if id(dtype) in seen:
+                continue
+            seen.add(id(dtype))
+            if dtype not in distinct:
+                distinct.add(dtype)
+                dtypes.append(dtype)
+    return dtypes
 
 def extract_ctps(ast):
     return ctps_from_dtypes(all_dtypes(ast))
@@ -26,11 +37,16 @@ def ctps_from_dtypes(dtypes):
     for dtype in dtypes:
         if dtype.odecl is None:
             continue
+        fields = None
+        if dtype.type == 'type':
+            fields = [(name, comp_dtype.fw_ktp, extents)
+                        for name, comp_dtype, extents in dtype.components]
         ret.append(ConfigTypeParam(basetype=dtype.type,
                        fwrap_name=dtype.fw_ktp,
                        odecl=dtype.odecl,
                        npy_enum=dtype.npy_enum,
-                       lang=dtype.lang))
+                       lang=dtype.lang,
+                       fields=fields))
     return ret
 
 def generate_type_specs(ast, buf):
@@ -40,11 +56,14 @@ def generate_type_specs(ast, buf):
 def _generate_type_specs(ctps, buf):
     out_lst = []
     for ctp in ctps:
-        out_lst.append(dict(basetype=ctp.basetype,
-                            odecl=ctp.odecl,
-                            fwrap_name=ctp.fwrap_name,
-                            npy_enum=ctp.npy_enum,
-                            lang=ctp.lang))
+        spec = dict(basetype=ctp.basetype,
+                    odecl=ctp.odecl,
+                    fwrap_name=ctp.fwrap_name,
+                    npy_enum=ctp.npy_enum,
+                    lang=ctp.lang)
+        if ctp.fields is not None:
+            spec['fields'] = ctp.fields
+        out_lst.append(spec)
     buf.write(dumps(out_lst))
 
 def read_type_spec(fname):
@@ -159,10 +178,14 @@ def write_pxd(ctps, fbuf, h_name):
 #------------------------------------------------------------------------------
 # -- Factory function; creates _ConfigTypeParam instances. --
 
-def ConfigTypeParam(basetype, odecl, fwrap_name, npy_enum, lang='fortran'):
+def ConfigTypeParam(basetype, odecl, fwrap_name, npy_enum, lang='fortran',
+                    fields=None):
     if lang == 'c':
         return _CConfigTypeParam(basetype, odecl, fwrap_name, npy_enum)
     elif lang == 'fortran':
+        if basetype == 'type':
+            return _DerivedTypeParam(basetype, odecl, fwrap_name, npy_enum,
+                                     fields)
         if basetype == 'complex':
             return _CmplxTypeParam(basetype, odecl, fwrap_name, npy_enum)
         if basetype == 'character':
@@ -191,6 +214,8 @@ class _ConfigTypeParam(object):
 
     pxd_cimports = ''
 
+    fields = None
+
     def __init__(self, basetype, odecl, fwrap_name, npy_enum):
         self.basetype = basetype
         self.odecl = odecl
@@ -308,6 +333,54 @@ class _CmplxTypeParam(_ConfigTypeParam):
         return []
 
 
+class _DerivedTypeParam(_ConfigTypeParam):
+
+    # A bind(c) derived type: a C struct of the types of its fields, and an
+    # aligned NumPy structured dtype with the same layout.  fields is a list
+    # of (name, fwrap_name, extents); as in C, the extents of a component
+    # array are in reverse order, so its NumPy subarray is the transpose of
+    # the Fortran array.  The Fortran type itself comes from its module.
+
+    def __init__(self, basetype, odecl, fwrap_name, npy_enum, fields):
+        super(_DerivedTypeParam, self).__init__(basetype, odecl, fwrap_name,
+                                                npy_enum)
+        self.fields = fields
+
+    def check_init(self):
+        # the fields' types are found, not the struct's.
+        pass
+
+    def _c_fields(self):
+        return ['%s %s%s' % (fwrap_name, name,
+                             ''.join(['[%d]' % extent
+                                        for extent in reversed(extents)]))
+                    for name, fwrap_name, extents in self.fields]
+
+    def gen_f_mod(self):
+        return []
+
+    def gen_c_typedef(self):
+        return (['typedef struct {'] +
+                [INDENT + '%s;' % field for field in self._c_fields()] +
+                ['} %s;' % self.fwrap_name])
+
+    def gen_pxd_extern_typedef(self):
+        return (['ctypedef struct %s:' % self.fwrap_name] +
+                [INDENT + field for field in self._c_fields()])
+
+    def gen_pyx_type_obj(self):
+        fields = []
+        for name, fwrap_name, extents in self.fields:
+            field = [repr(name), py_type_name_from_type(fwrap_name)]
+            if extents:
+                field.append(repr(tuple(reversed(extents))))
+            fields.append('(%s)' % ', '.join(field))
+        return ['%s = np.NPY_VOID' % self.npy_enum,
+                '%s = np.dtype([%s], align=True)' %
+                    (py_type_name_from_type(self.fwrap_name),
+                     ', '.join(fields))]
+
+
 class _CConfigTypeParam(_ConfigTypeParam):
 
     lang = 'c'
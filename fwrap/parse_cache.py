@@ -0,0 +1,171 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# On-disk cache of the pyf_iface procedures parsed from a Fortran source.
+#
+# Entries are keyed on the source's contents and format (fparser may read
+# the same text in different formats depending on a file's extension)
+# together with the fwrap and fparser versions, so a new version of either
+# invalidates the cache.  Each entry is a pickled list of
+# pyf.Subroutine/pyf.Function objects.  The cache directory is kept under a
+# size cap by evicting the least recently used entries.
+
+import os
+import sys
+import tempfile
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # bytes
+ENTRY_EXT = '.pickle'
+
+def default_cache_dir():
+    cache_dir = os.environ.get('FWRAP_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+    xdg_cache = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join('~', '.cache'))
+    return os.path.join(os.path.expanduser(xdg_cache), 'fwrap')
+
+def _fwrap_version():
+    from fwrap.version import get_version
+    return get_version()
+
+def _fparser_version():
+    import fparser
+    version = getattr(fparser, '__version__', None)
+    if version is None:
+        try:
+            import pkg_resources
+            version = pkg_resources.get_distribution('fparser').version
+        except Exception:
+            version = 'unknown'
+    return version
+
+def _read_source(src):
+    # fparser accepts either a filename or the source itself.
+    if os.path.isfile(src):
+        fh = open(src, 'rb')
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+    return src
+
+def _source_format(src):
+    # The format fparser will read src in, e.g. 'Non-strict free format'.
+    from fparser import api
+    return str(api.get_reader(src).format)
+
+
+class ParseCache(object):
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._versions = "fwrap %s, fparser %s, python %d.%d" % (
+                (_fwrap_version(), _fparser_version()) +
+                tuple(sys.version_info[:2]))
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, src):
+        hsh = sha1(self._versions)
+        hsh.update('\0')
+        hsh.update(_source_format(src))
+        hsh.update('\0')
+        hsh.update(_read_source(src))
+        return hsh.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_EXT)
+
+    def load(self, key):
+        r"""Return the cached procedures for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            try:
+                procs = loads(fh.read())
+            finally:
+                fh.close()
+        except Exception:
+            # A truncated or stale entry; drop it and reparse.
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Bump the mtime, which is what the LRU eviction is based on.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return procs
+
+    def store(self, key, procs):
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                if not os.path.isdir(self.cache_dir):
+                    raise
+        data = dumps(procs, HIGHEST_PROTOCOL)
+        # Write to a temporary file and rename it into place so that a
+        # concurrent fwrapper run never sees a partial entry.
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        path = self._path(key)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Windows won't rename over an existing file.
+            self._remove(path)
+            os.rename(tmp_path, path)
+
+    def prune(self):
+        r"""Evict the least recently used entries until the cache is no
+        larger than max_size.
+        """
+        entries = []
+        total = 0
+        try:
+            fnames = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for fname in fnames:
+            if not fname.endswith(ENTRY_EXT):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,183 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Per-phase timing and memory accounting for the fwrapper pipeline.
+#
+# A Profiler records, for each (possibly nested) phase, the wall time, the
+# CPU time (including that of child processes, e.g. the parse workers), the
+# process' peak resident set size once the phase is done and, when the
+# tracemalloc module is available and tracing (e.g. PYTHONTRACEMALLOC is set),
+# the peak traced allocation size during the phase (its nested phases
+# included).
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+MB = 1024.0 * 1024.0
+
+
+def _cpu_time():
+    times = os.times()
+    # user + system, for this process and its waited-for children.
+    return times[0] + times[1] + times[2] + times[3]
+
+def _peak_rss():
+    r"""Return the peak resident set size of the process in bytes, or None
+    if it can't be determined.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    # Linux and the BSDs report kilobytes.
+    return maxrss * 1024
+
+def _tracing():
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+class Phase(object):
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.wall = None
+        self.cpu = None
+        self.peak_rss = None
+        self.traced_peak = None
+
+    def as_dict(self):
+        return dict(name=self.name, depth=self.depth, wall=self.wall,
+                    cpu=self.cpu, peak_rss=self.peak_rss,
+                    traced_peak=self.traced_peak)
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.phases = []
+        self._stack = []
+
+    def start(self, name):
+        r"""Start a phase nested in the current one.  Every start must be
+        matched by a stop, in a finally clause if the phase can raise.
+        """
+        phase = Phase(name, len(self._stack))
+        self.phases.append(phase)
+        if _tracing() and hasattr(tracemalloc, 'reset_peak'):
+            # The peak is reset for the new phase, so keep the enclosing
+            # phase's peak so far on its stack entry.
+            self._fold_peak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        # [phase, start wall time, start cpu time, traced peak so far]
+        self._stack.append([phase, time.time(), _cpu_time(), 0])
+
+    def stop(self, detail=None):
+        r"""End the innermost phase.  If detail is given it is appended to
+        the phase's name, for phases whose subject is only known at the
+        end (e.g. the file a generator wrote).
+        """
+        phase, wall0, cpu0, peak = self._stack.pop()
+        phase.wall = time.time() - wall0
+        phase.cpu = _cpu_time() - cpu0
+        phase.peak_rss = _peak_rss()
+        if _tracing():
+            phase.traced_peak = max(peak, tracemalloc.get_traced_memory()[1])
+            self._fold_peak(phase.traced_peak)
+        if detail is not None:
+            phase.name = "%s (%s)" % (phase.name, detail)
+
+    def _fold_peak(self, peak):
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], peak)
+
+    def call(self, name, func, *args, **kwargs):
+        r"""Call func(*args, **kwargs) as the phase name and return its
+        result.
+        """
+        self.start(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop()
+
+    def report(self, stream=None):
+        r"""Write a table of the recorded phases to stream (default
+        sys.stdout).
+        """
+        if stream is None:
+            stream = sys.stdout
+        rows = []
+        for phase in self.phases:
+            rows.append(("  " * phase.depth + phase.name,
+                         "%.3f" % phase.wall,
+                         "%.3f" % phase.cpu,
+                         _fmt_mb(phase.peak_rss),
+                         _fmt_mb(phase.traced_peak)))
+        header = ("phase", "wall (s)", "cpu (s)", "peak rss (MB)",
+                  "traced peak (MB)")
+        widths = [len(col) for col in header]
+        for row in rows:
+            widths = [max(width, len(col)) for width, col in zip(widths, row)]
+        fmt = "  ".join(["%%-%ds" % widths[0]] +
+                        ["%%%ds" % width for width in widths[1:]])
+        stream.write(fmt % header + "\n")
+        stream.write("-" * (sum(widths) + 2 * (len(widths) - 1)) + "\n")
+        for row in rows:
+            stream.write(fmt % row + "\n")
+
+    def as_dict(self):
+        from fwrap.version import get_version
+        return dict(fwrap_version=get_version(),
+                    python_version="%d.%d.%d" % tuple(sys.version_info[:3]),
+                    platform=sys.platform,
+                    tracemalloc=_tracing(),
+                    phases=[phase.as_dict() for phase in self.phases])
+
+    def dump_json(self, fname):
+        fh = open(fname, 'w')
+        try:
+            json.dump(self.as_dict(), fh, indent=2)
+            fh.write("\n")
+        finally:
+            fh.close()
+
+
+class NullProfiler(object):
+    r"""Stands in for a Profiler when profiling is off."""
+
+    phases = ()
+
+    def start(self, name):
+        pass
+
+    def stop(self, detail=None):
+        pass
+
+    def call(self, name, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+def _fmt_mb(nbytes):
+    if nbytes is None:
+        return "-"
+    return "%.1f" % (nbytes / MB)
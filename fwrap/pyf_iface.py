@@ -4,9 +4,14 @@
 #------------------------------------------------------------------------------
 
 from fwrap import fort_expr
+from fwrap.gen_config import f2c
 from intrinsics import intrinsics
 import re
 
+# The kind parameters of iso_c_binding; every generated Fortran unit uses
+# the module.
+iso_c_kinds = frozenset(f2c)
+
 def _py_kw_mangler(name):
     # mangles name if it's a Python or Cython keyword.
     kwds = (
@@ -30,17 +35,37 @@ def valid_fort_name(name):
 class InvalidNameException(Exception):
     pass
 
+def _intern(s):
+    # A large library has many thousands of IR nodes, most of whose names and
+    # expressions are repeats, so they are interned.  intern() only takes
+    # plain strings.
+    if type(s) is str:
+        return intern(s)
+    return s
+
+_name_sets = {}
+def _intern_names(names):
+    names = frozenset(names)
+    return _name_sets.setdefault(names, names)
+
+# The IR classes below (and the wrappers built on them in fc_wrap and
+# cy_wrap) define __slots__ to keep the per-instance overhead down; a
+# subclass must list any attributes it adds.  The sets of names they hold are
+# interned frozensets.
+
 class ScalarIntExpr(object):
 
+    __slots__ = ('expr_str', '_expr', 'funcnames', 'names')
+
     _find_names = re.compile(r'(?<![_\d])[a-z][a-z0-9_%]*', re.IGNORECASE).findall
 
     def __init__(self, expr_str):
-        self.expr_str = expr_str.lower()
+        self.expr_str = _intern(expr_str.lower())
         self._expr = fort_expr.parse(self.expr_str)
         xtor = fort_expr.ExtractNames()
         xtor.visit(self._expr)
-        self.funcnames = set(xtor.funcnames)
-        self.names = set(xtor.names).union(self.funcnames)
+        self.funcnames = _intern_names(xtor.funcnames)
+        self.names = _intern_names(self.funcnames.union(xtor.names))
 
 
 class Dtype(object):
@@ -96,6 +121,15 @@ class Dtype(object):
             return None
     odecl = property(_get_odecl)
 
+    def _key(self):
+        return (type(self), self.fw_ktp, self.type, self.length, self.kind,
+                self.lang, self.cname)
+
+    def __reduce__(self):
+        # so that unpickled dtypes (e.g. from the parse cache) rejoin the
+        # registry.
+        return (_unpickle_dtype, (type(self), self.__dict__))
+
     def __hash__(self):
         return hash(self.fw_ktp + (self.odecl or '') + self.type)
 
@@ -122,15 +156,28 @@ class Dtype(object):
 
     def depends(self):
         if not self.odecl:
-            return set()
+            return frozenset()
         else:
-            return ScalarIntExpr(self.odecl).names - intrinsics
+            return ScalarIntExpr(self.odecl).names - intrinsics - iso_c_kinds
 
     def py_type_name(self):
         from fwrap.gen_config import py_type_name_from_type
         return py_type_name_from_type(self.fw_ktp)
 
 
+# Identical dtypes are shared: a library with thousands of declarations has
+# only a handful of distinct kinds.  intern_dtype() returns the registered
+# instance equal to its argument, registering it if there is none.
+_dtypes = {}
+def intern_dtype(dtype):
+    return _dtypes.setdefault(dtype._key(), dtype)
+
+def _unpickle_dtype(cls, state):
+    dtype = cls.__new__(cls)
+    dtype.__dict__.update(state)
+    return intern_dtype(dtype)
+
+
 class CharacterType(Dtype):
 
     cdef_extern_decls = '''\
@@ -252,6 +299,51 @@ default_complex = ComplexType(
 default_double_complex = ComplexType(
         fw_ktp='dbl_complex', kind="kind((0.0D0,0.0D0))")
 
+class DerivedType(Dtype):
+
+    # A bind(c) derived type defined in a module.  It is passed as the C
+    # struct of its components, a list of (name, dtype, extents) with the
+    # extents of a component array as a tuple of ints (empty for a scalar),
+    # which Python sees as a NumPy structured dtype; see
+    # gen_config._DerivedTypeParam.
+
+    mangler = "fwt_%s"
+
+    def __init__(self, fw_ktp, name, module, components, mangler=None,
+                 **kwargs):
+        super(DerivedType, self).__init__(fw_ktp, mangler=mangler, **kwargs)
+        self.type = 'type'
+        self.name = name
+        self.module = module
+        self.components = components
+
+    def _get_odecl(self):
+        return 'type(%s)' % self.name
+    odecl = property(_get_odecl)
+
+    def _key(self):
+        # The components are part of the key: a type of the same name and
+        # module may be defined differently elsewhere, or since the last
+        # parse.
+        components = tuple([(name, dtype._key(), extents)
+                                for name, dtype, extents in self.components])
+        return (super(DerivedType, self)._key() +
+                (self.name, self.module, components))
+
+    def type_spec(self):
+        return self.odecl
+
+    def depends(self):
+        # the type comes from its module, not the procedure's scope.
+        return frozenset()
+
+    def all_dtypes(self):
+        dts = []
+        for name, dtype, extents in self.components:
+            dts.extend(dtype.all_dtypes())
+        return dts + [self]
+
+
 intrinsic_types = [RealType,
                    IntegerType,
                    ComplexType,
@@ -275,22 +367,33 @@ class _InternCPtrType(Dtype):
     def c_declaration(self):
         return "void *"
 
+    def __reduce__(self):
+        return 'c_ptr_type'
+
 c_ptr_type = _InternCPtrType()
 
 # we delete it from the module so others aren't tempted to instantiate the class.
 del _InternCPtrType
 
+for _dtype in (default_character, default_integer, dim_dtype,
+               default_logical, default_real, default_dbl, default_complex,
+               default_double_complex):
+    intern_dtype(_dtype)
+del _dtype
+
 class _NamedType(object):
     '''
     Abstractish base class for something with a name & a type,
     including Parameters, Vars and Arguments.
     '''
 
+    __slots__ = ('name', 'dtype', 'dimension', 'is_array')
+
     def __init__(self, name, dtype, dimension=None):
         if not valid_fort_name(name):
             raise InvalidNameException(
                     "%s is not a valid fortran variable name.")
-        self.name = name.lower()
+        self.name = _intern(name.lower())
         self.dtype = dtype
         if dimension:
             self.dimension = Dimension(dimension)
@@ -324,6 +427,8 @@ class _NamedType(object):
 
 class Parameter(_NamedType):
 
+    __slots__ = ('expr', 'depnames')
+
     def __init__(self, name, dtype, expr, dimension=None):
         super(Parameter, self).__init__(name, dtype, dimension)
         self.expr = ScalarIntExpr(expr)
@@ -344,6 +449,9 @@ class Parameter(_NamedType):
 
 class Dim(object):
 
+    __slots__ = ('spec', 'is_assumed_shape', 'is_assumed_size',
+                 'is_explicit_shape', 'sizeexpr', 'depnames')
+
     def __init__(self, spec):
         if isinstance(spec, basestring):
             spec = tuple(spec.split(':'))
@@ -383,23 +491,26 @@ class Dim(object):
         elif self.is_assumed_shape:
             self.sizeexpr = None
         elif len(self.spec) == 2:
-            self.sizeexpr = ("((%s) - (%s) + 1)" %
+            self.sizeexpr = _intern("((%s) - (%s) + 1)" %
                     tuple(reversed([sp.expr_str for sp in self.spec])))
         elif len(self.spec) == 1:
-            self.sizeexpr = "(%s)" % self.spec[0].expr_str
+            self.sizeexpr = _intern("(%s)" % self.spec[0].expr_str)
 
         self._set_depnames()
 
     def _set_depnames(self):
-        self.depnames = set()
+        depnames = set()
         for sie in self.spec:
-            self.depnames.update(sie.names)
+            depnames.update(sie.names)
+        self.depnames = _intern_names(depnames)
 
     def dim_spec_str(self):
         return ":".join([sp.expr_str for sp in self.spec])
 
 class Dimension(object):
 
+    __slots__ = ('dims', 'depnames', 'attrspec')
+
     def __init__(self, dims):
         self.dims = []
         for dim in dims:
@@ -407,16 +518,17 @@ class Dimension(object):
                 self.dims.append(Dim(dim))
             else:
                 self.dims.append(dim)
-        self.depnames = set()
+        depnames = set()
         for dim in self.dims:
-            self.depnames.update(dim.depnames)
+            depnames.update(dim.depnames)
+        self.depnames = _intern_names(depnames)
         self._set_attrspec()
 
     def _set_attrspec(self):
         dimlist = []
         for dim in self.dims:
             dimlist.append(dim.dim_spec_str())
-        self.attrspec = "dimension(%s)" % (", ".join(dimlist))
+        self.attrspec = _intern("dimension(%s)" % (", ".join(dimlist)))
 
     def __len__(self):
         return len(self.dims)
@@ -427,9 +539,10 @@ class Dimension(object):
 
 class Var(_NamedType):
 
+    __slots__ = ('isptr',)
+
     def __init__(self, name, dtype, dimension=None, isptr=False):
         super(Var, self).__init__(name, dtype, dimension)
-        self._base = _NamedType(name, dtype, dimension)
         self.isptr = isptr
 
     def var_specs(self, orig=False):
@@ -440,13 +553,15 @@ class Var(_NamedType):
 
 class Argument(object):
 
+    __slots__ = ('_var', 'intent', 'isvalue', 'is_return_arg')
+
     def __init__(self, name, dtype,
                  intent=None,
                  dimension=None,
                  isvalue=None,
                  is_return_arg=False):
         self._var = Var(name=name, dtype=dtype, dimension=dimension)
-        self.intent = intent
+        self.intent = _intern(intent)
         self.isvalue = isvalue
         self.is_return_arg = is_return_arg
 
@@ -490,10 +605,18 @@ class Argument(object):
             return ['intent(%s)' % self.intent]
         return []
 
+    def _by_value(self):
+        # A type(c_ptr) passed by value is still a (void) pointer in C.
+        return self.isvalue and self.dtype.type != 'c_ptr'
+
     def c_type(self):
+        if self._by_value():
+            return self.dtype.fw_ktp
         return self._var.c_type()
 
     def c_declaration(self):
+        if self._by_value():
+            return "%s %s" % (self.dtype.fw_ktp, self.name)
         return self._var.c_declaration()
 
     def all_dtypes(self):
@@ -507,6 +630,8 @@ class Argument(object):
 
 class HiddenArgument(Argument):
 
+    __slots__ = ('value',)
+
     def __init__(self, name, dtype,
                  value,
                  intent=None,
@@ -532,6 +657,11 @@ class ArgManager(object):
         self._args = list(args)
         self._return_arg = return_arg
         self._params = list(params)
+        # The dependency graph of the declarations: maps the name of each
+        # argument and parameter to the names its declaration depends on.
+        self._depends = {}
+        for o in (self._args + self._params):
+            self._depends[o.name] = o.depends()
         self._trim_params()
         self._check_namespace()
 
@@ -539,25 +669,19 @@ class ArgManager(object):
         # remove params that aren't necessary as part of an argument
         # declaration.
 
-        pnames = set([p.name for p in self._params])
-        name2o = dict([(o.name, o) for o in (self._args + self._params)])
-        queue = set(self._args[:])
-        while queue:
-            o = queue.pop()
-            for depname in o.depends():
-                dep = name2o[depname]
-                if depname in name2o:
-                    # Make sure we get all dependencies in the tree.
-                    queue.add(dep)
-                if depname in pnames:
-                    # The parameter is required as part of an argument
-                    # declaration, so remove it from pnames.
-                    pnames.remove(depname)
-
-        # Whatever is left in pnames is not required for an argument
+        # Walk the graph from the arguments to find everything their
+        # declarations need.
+        needed = set([arg.name for arg in self._args])
+        stack = list(needed)
+        while stack:
+            for depname in self._depends[stack.pop()]:
+                if depname in self._depends and depname not in needed:
+                    needed.add(depname)
+                    stack.append(depname)
+
+        # Whatever parameter isn't needed is not required for an argument
         # declaration; remove it from self._params
-        for pname in pnames:
-            self._params.remove(name2o[pname])
+        self._params = [p for p in self._params if p.name in needed]
 
     def extern_arg_list(self):
         ret = []
@@ -574,7 +698,7 @@ class ArgManager(object):
     def _required_names(self):
         req_names = set()
         for o in (self._args + self._params):
-            req_names.update(o.depends())
+            req_names.update(self._depends[o.name])
         return req_names
 
     def _check_namespace(self):
@@ -588,22 +712,68 @@ class ArgManager(object):
                     "Required names not provided by scope %r" % list(left_out))
 
     def order_declarations(self):
+        r"""Return the arguments and parameters ordered so that each comes
+        after everything its declaration depends on.
+
+        Declarations are placed in passes over the arguments followed by the
+        parameters: a pass declares, in order, every remaining declaration
+        whose dependencies are declared by then, including earlier in the
+        same pass.  Rather than looping over the passes, the pass of each
+        declaration is computed in a topological sort of the dependency
+        graph.
+        """
+        decls = self._args + self._params
+        index = dict([(o.name, idx) for idx, o in enumerate(decls)])
+        dependents = [[] for o in decls]
+        ndeps = [0] * len(decls)
+        for idx, o in enumerate(decls):
+            for depname in self._depends[o.name]:
+                # _check_namespace ensures anything else is an intrinsic.
+                if depname in index:
+                    dependents[index[depname]].append(idx)
+                    ndeps[idx] += 1
+
+        passes = [0] * len(decls)
+        ready = [idx for idx in range(len(decls)) if not ndeps[idx]]
+        ordered = 0
+        while ready:
+            idx = ready.pop()
+            ordered += 1
+            for dependent in dependents[idx]:
+                # A dependency declared after the dependent in a pass only
+                # frees the dependent for the next pass.
+                pss = passes[idx] + (idx > dependent)
+                if pss > passes[dependent]:
+                    passes[dependent] = pss
+                ndeps[dependent] -= 1
+                if not ndeps[dependent]:
+                    ready.append(dependent)
+        if ordered < len(decls):
+            raise RuntimeError("Circular dependency between the "
+                    "declarations of %s" %
+                    ' -> '.join(self._find_cycle(decls, ndeps)))
+
+        by_pass = [[] for o in decls]
+        for idx, o in enumerate(decls):
+            by_pass[passes[idx]].append(o)
         decl_list = []
-        decl_set = set()
-        undeclared = list(self._args) + list(self._params)
-        while undeclared:
-            undecl_cpy = undeclared[:]
-            for arg in undecl_cpy:
-                deps = arg.depends()
-                if not deps or deps <= decl_set.union(intrinsics):
-                    decl_list.append(arg)
-                    decl_set.add(arg.name)
-                    undeclared.remove(arg)
-            assert len(undecl_cpy) > len(undeclared)
-        assert not undeclared
-        assert len(decl_list) == len(self._args) + len(self._params)
+        for pass_decls in by_pass:
+            decl_list.extend(pass_decls)
         return decl_list
 
+    def _find_cycle(self, decls, ndeps):
+        # Every declaration left with unordered dependencies depends on
+        # another such declaration, so following those must end in a cycle.
+        blocked = set([o.name for idx, o in enumerate(decls) if ndeps[idx]])
+        path = []
+        seen = {}
+        name = min(blocked)
+        while name not in seen:
+            seen[name] = len(path)
+            path.append(name)
+            name = min(self._depends[name] & blocked)
+        return path[seen[name]:] + [name]
+
     def arg_declarations(self):
         decls = []
         od = self.order_declarations()
@@ -625,6 +795,14 @@ class ArgManager(object):
         return dts
 
 
+def use_statements(used):
+    r"""Return the use statements for used, a dict mapping module names to
+    the names to use from them.
+    """
+    return ['use %s, only: %s' % (module, ', '.join(used[module]))
+                for module in sorted(used)]
+
+
 class Procedure(object):
 
     def __init__(self, name, args, params=()):
@@ -636,6 +814,28 @@ class Procedure(object):
         self.args = args
         self.arg_man = None
         self.params = params
+        # The Fortran source the procedure was parsed from, if known.
+        self.source = None
+        # The state the procedure shares between calls, as found by
+        # fwrap_parse: 'common:NAME' for a COMMON block, 'module:NAME' for a
+        # module it uses, 'save:NAME' for its (or a procedure it calls)
+        # SAVEd variables and 'io' for Fortran I/O.
+        self.shared_state = frozenset()
+        # The names of the procedures it calls.
+        self.calls = frozenset()
+        # The binding label of a bind(c) procedure that C can call as it
+        # is, without a Fortran wrapper; see fwrap_parse._get_bind_c.
+        self.bind_c = None
+        # The name of the module the procedure is contained in, if any.
+        self.module = None
+        # Whether the procedure is elemental; see cy_wrap.UfuncWrapper.
+        self.elemental = False
+
+    def is_thread_safe(self):
+        r"""Whether the procedure may be called from several threads at
+        once, as far as the parser can tell.
+        """
+        return not self.shared_state
 
     def extern_arg_list(self):
         return self.arg_man.extern_arg_list()
@@ -649,6 +849,8 @@ class Procedure(object):
 
     def proc_preamble(self, ktp_mod, buf):
         buf.putln('use %s' % ktp_mod)
+        for use in use_statements(self.used_types()):
+            buf.putln(use)
         buf.putln('implicit none')
         for decl in self.arg_declarations():
             buf.putln(decl)
@@ -656,6 +858,18 @@ class Procedure(object):
     def proc_end(self):
         return "end %s %s" % (self.kind, self.name)
 
+    def used_types(self):
+        r"""Return a dict mapping the modules of the derived types of the
+        arguments to the names of the types.
+        """
+        types = {}
+        for dtype in self.all_dtypes():
+            if dtype.type == 'type':
+                names = types.setdefault(dtype.module, [])
+                if dtype.name not in names:
+                    names.append(dtype.name)
+        return types
+
     def all_dtypes(self):
         return self.arg_man.all_dtypes()
 
@@ -680,6 +894,25 @@ class Subroutine(Procedure):
         self.arg_man = ArgManager(self.args, params=self.params)
 
 
+class ModuleArray(Procedure):
+
+    # A public array of a module, which the wrappers return as a view of the
+    # module's storage from a getter named <module>_<array> that takes no
+    # arguments.  The array is an allocatable one if its dimensions are
+    # deferred (':').
+
+    def __init__(self, array, module, params=()):
+        super(ModuleArray, self).__init__('%s_%s' % (module, array.name),
+                                          [array], params)
+        self.kind = 'module_array'
+        self.module = module
+        self.array = array
+        self.allocatable = array.dimension.dims[0].is_assumed_shape
+        # Anything the module's procedures do may change the array.
+        self.shared_state = _intern_names(['module:%s' % module])
+        self.arg_man = ArgManager(self.args, params=self.params)
+
+
 class Module(object):
 
     def __init__(self, name, mod_objects=None, uses=None):
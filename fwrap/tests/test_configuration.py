@@ -0,0 +1,65 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+import os
+import tempfile
+
+from fwrap.configuration import Configuration
+
+from nose.tools import ok_, eq_, assert_raises
+
+class test_configuration(object):
+
+    def setup(self):
+        self.cfg = Configuration()
+
+    def test_scopes(self):
+        cfg = self.cfg
+        eq_(cfg.get('strict', 'foo', 'a'), False)
+        cfg.set('strict', True)
+        cfg.set('strict', False, proc='Foo')
+        cfg.set('strict', True, proc='foo', arg='A')
+        eq_(cfg.get('strict'), True)
+        eq_(cfg.get('strict', 'bar', 'a'), True)
+        eq_(cfg.get('strict', 'FOO', 'b'), False)
+        eq_(cfg.get('strict', 'foo', 'a'), True)
+
+    def test_errors(self):
+        assert_raises(ValueError, self.cfg.set, 'no_such_option', True)
+        assert_raises(ValueError, self.cfg.set, 'strict', 'maybe')
+        assert_raises(ValueError, self.cfg.set, 'strict', True, arg='a')
+        assert_raises(ValueError, self.cfg.set, 'strict', 'auto')
+
+    def test_nogil(self):
+        self.cfg.set('nogil', 'Auto')
+        self.cfg.set('nogil', 'no', proc='foo')
+        eq_(self.cfg.get('nogil', 'bar'), 'auto')
+        eq_(self.cfg.get('nogil', 'foo'), False)
+
+    def test_read(self):
+        fd, fname = tempfile.mkstemp(suffix='.cfg')
+        os.write(fd, '[fwrap]\n'
+                     'strict = yes\n'
+                     '[proc:foo]\n'
+                     'strict = no\n'
+                     '[arg:foo.a]\n'
+                     'strict = 1\n')
+        os.close(fd)
+        try:
+            self.cfg.read(fname)
+        finally:
+            os.remove(fname)
+        eq_(self.cfg.get('strict', 'bar'), True)
+        eq_(self.cfg.get('strict', 'foo', 'b'), False)
+        eq_(self.cfg.get('strict', 'foo', 'a'), True)
+
+    def test_read_bad_section(self):
+        fd, fname = tempfile.mkstemp(suffix='.cfg')
+        os.write(fd, '[arg:foo]\nstrict = yes\n')
+        os.close(fd)
+        try:
+            assert_raises(ValueError, self.cfg.read, fname)
+        finally:
+            os.remove(fname)
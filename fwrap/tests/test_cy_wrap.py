@@ -210,6 +210,31 @@ class test_cy_array_arg_wrapper(object):
                 ['int_array_ = np.PyArray_FROMANY(int_array, '
                  'fwi_integer_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)'])
 
+    def test_copy_pre_call_code(self):
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_int_arg.arg,
+                                           proc_name='subr', on_copy='warn')
+        eq_(cy_arg.pre_call_code(),
+                ['int_array_ = np.PyArray_FROMANY(int_array, '
+                 'fwi_integer_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)',
+                 'if int_array_ is not int_array:',
+                 "    fw_record_copy__('subr', 'int_array', "
+                        "np.PyArray_NBYTES(int_array_), 'warn')"])
+
+    def test_strict_pre_call_code(self):
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_int_arg.arg, strict=True)
+        eq_(cy_arg.pre_call_code(),
+                ['if not (np.PyArray_Check(int_array) and',
+                 '        np.PyArray_TYPE(int_array) == fwi_integer_t_enum and',
+                 '        np.PyArray_NDIM(int_array) == 1 and',
+                 '        np.PyArray_ISNOTSWAPPED(int_array) and',
+                 '        np.PyArray_CHKFLAGS(int_array,',
+                 '                            np.NPY_F_CONTIGUOUS | np.NPY_ALIGNED)):',
+                 '    raise ValueError("int_array must be an aligned, '
+                            'Fortran contiguous "',
+                 '                     "1D array of type fwi_integer_t in native '
+                            'byte order")',
+                 'int_array_ = int_array'])
+
     def test_post_call_code(self):
         eq_(self.cy_arg.post_call_code(), [])
         eq_(self.cy_int_arg.post_call_code(), [])
@@ -275,7 +300,8 @@ class test_char_args(object):
                  'cdef char *fw_name_buf'])
         eq_(self.intent_in.intern_declarations(),
                 ['cdef fw_bytes fw_name',
-                 'cdef fwi_npy_intp_t fw_name_len'])
+                 'cdef fwi_npy_intp_t fw_name_len',
+                 'cdef char *fw_name_buf'])
         eq_(self.intent_inout.intern_declarations(),
                 ['cdef fw_bytes fw_name',
                  'cdef fwi_npy_intp_t fw_name_len',
@@ -292,7 +318,8 @@ class test_char_args(object):
                  'fw_name_buf = <char*>fw_name'])
         eq_(self.intent_in.pre_call_code(),
                 ['fw_name_len = len(name)',
-                 'fw_name = name',])
+                 'fw_name = name',
+                 'fw_name_buf = <char*>fw_name'])
         eq_(self.intent_inout.pre_call_code(),
                 ['fw_name_len = 30',
                  'fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
@@ -307,7 +334,7 @@ class test_char_args(object):
     def test_call_arg_list(self):
         eq_(self.intent_out.call_arg_list(), ['&fw_name_len', 'fw_name_buf'])
         eq_(self.intent_in.call_arg_list(),
-                ['&fw_name_len', '<char*>fw_name'])
+                ['&fw_name_len', 'fw_name_buf'])
         eq_(self.intent_inout.call_arg_list(),
                 ['&fw_name_len', 'fw_name_buf'])
 
@@ -499,6 +526,62 @@ cpdef api object fort_subr(fwi_integer_t int_arg_in, fwi_integer_t int_arg_inout
 '''
         compare(cy_wrapper, buf.getvalue())
 
+    def test_nogil_generate_wrapper(self):
+        from fwrap.configuration import Configuration
+        cy_wrapper = cy_wrap.ProcWrapper(wrapped=self.cy_subr_wrapper.wrapped,
+                                         cfg=Configuration(nogil=True))
+        buf = CodeBuffer()
+        cy_wrapper.generate_wrapper(buf)
+        call = '''\
+    with nogil:
+        fort_subr_c(&int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
+    if fw_iserr__ != FW_NO_ERR__:
+'''
+        ok_(call in buf.getvalue())
+
+    def test_auto_nogil(self):
+        from fwrap.configuration import Configuration
+        fc_subr = self.cy_subr_wrapper.wrapped
+        fc_subr.wrapped.shared_state = frozenset(['io', 'common:blk'])
+        cy_wrapper = cy_wrap.ProcWrapper(wrapped=fc_subr,
+                                         cfg=Configuration(nogil='auto'))
+        eq_(cy_wrapper.locks, ('common:blk', 'io'))
+        buf = CodeBuffer()
+        cy_wrapper.generate_wrapper(buf)
+        call = '''\
+    fw_acquire__(('common:blk', 'io'))
+    try:
+        with nogil:
+            fort_subr_c(&int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
+    finally:
+        fw_release__(('common:blk', 'io'))
+    if fw_iserr__ != FW_NO_ERR__:
+'''
+        ok_(call in buf.getvalue())
+        buf = CodeBuffer()
+        cy_wrap.generate_cy_pyx([cy_wrapper], 'test', buf)
+        ok_('\nfw_locks__ = {}\n\ncdef fw_acquire__(names):' in buf.getvalue())
+        # the shards of a module share its locks, and only its locks.
+        buf = CodeBuffer()
+        cy_wrap.generate_cy_pyx([cy_wrapper], 'test_s0', buf, 'test_common')
+        ok_('\nfrom test_common import fw_locks as fw_locks__\n'
+            in buf.getvalue())
+        ok_('sys.' not in buf.getvalue())
+
+    def test_lean_generate_wrapper(self):
+        fc_subr = fc_wrap.SubroutineWrapper(
+                        wrapped=self.cy_subr_wrapper.wrapped.wrapped,
+                        lean=True)
+        cy_wrapper = cy_wrap.ProcWrapper(wrapped=fc_subr)
+        buf = CodeBuffer()
+        cy_wrapper.generate_wrapper(buf)
+        code = buf.getvalue()
+        ok_('    cdef fwi_integer_t int_arg_out\n'
+            '    fort_subr_c(int_arg_in, &int_arg_inout, &int_arg_out, '
+            '&real_arg)\n'
+            '    return (int_arg_inout, int_arg_out, real_arg,)\n' in code)
+        ok_('fw_iserr__' not in code)
+
     def test_func_generate_wrapper(self):
         buf = CodeBuffer()
         self.cy_func_wrapper.generate_wrapper(buf)
@@ -662,3 +745,316 @@ class test_docstring_gen(object):
         None
         '''
         compare("\n".join(cs.docstring()), dstring)
+
+def test_strict_config():
+    from fwrap.configuration import Configuration
+    args = [pyf.Argument(name, dtype=pyf.default_real, dimension=[':'],
+                         intent='inout') for name in ('a', 'b')]
+    subr = pyf.Subroutine('Strict_Subr', args=args)
+    other = pyf.Subroutine('other', args=args)
+    cfg = Configuration(strict=True)
+    cfg.set('strict', False, proc='strict_subr', arg='B')
+    cfg.set('strict', False, proc='other')
+    cy_ast = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr, other]), cfg)
+    eq_([[arg.strict for arg in proc.arg_mgr.args
+                if isinstance(arg, cy_wrap._CyArrayArgWrapper)]
+            for proc in cy_ast],
+        [[True, False], [False, False]])
+
+def test_on_copy_config():
+    from fwrap.configuration import Configuration
+    args = [pyf.Argument(name, dtype=pyf.default_real, dimension=[':'],
+                         intent=intent)
+                for name, intent in (('a', 'in'), ('b', 'inout'),
+                                     ('c', 'out'))]
+    subr = pyf.Subroutine('subr', args=args)
+    cfg = Configuration(on_copy='warn', on_inout_copy='error')
+    cfg.set('on_inout_copy', 'ignore', proc='subr', arg='c')
+    cy_proc, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]), cfg)
+    eq_([(arg.proc_name, arg.on_copy) for arg in cy_proc.arg_mgr.args
+                if isinstance(arg, cy_wrap._CyArrayArgWrapper)],
+        [('subr', 'warn'), ('subr', 'error'), ('subr', 'warn')])
+
+def test_parallel_spec():
+    from fwrap.configuration import Configuration
+    args = [pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('a', pyf.default_real, 'in', dimension=['n']),
+            pyf.Argument('b', pyf.default_integer, 'inout',
+                         dimension=['n', ':']),
+            pyf.Argument('c', pyf.default_real, 'in', dimension=['n'])]
+    subr = pyf.Subroutine('subr', args=args)
+    saved = pyf.Subroutine('saved', args=args)
+    saved.shared_state = frozenset(['save:saved'])
+    cfg = Configuration(nogil=True)
+    cfg.set('strict', True, proc='subr', arg='c')
+    cfg.set('on_copy', 'warn', proc='subr', arg='a')
+    cy_subr, cy_saved = cy_wrap.wrap_fc(
+                            fc_wrap.wrap_pyf_iface([subr, saved]), cfg)
+    eq_(cy_subr.parallel_spec(),
+        (((1, 'a', 'fwr_real_t_enum', 1, 'warn'),
+          (2, 'b', 'fwi_integer_t_enum', 2, 'ignore')), True))
+    # Not thread safe, unless guarded by locks.
+    eq_(cy_saved.parallel_spec()[1], False)
+    cfg.set('nogil', 'auto')
+    cy_saved, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([saved]), cfg)
+    eq_(cy_saved.parallel_spec()[1], True)
+    cfg.set('nogil', False)
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]), cfg)
+    eq_(cy_subr.parallel_spec()[1], False)
+
+def test_direct_call():
+    c_double = pyf.RealType(fw_ktp='real_c_double', kind='c_double')
+    args = [pyf.Argument('a', c_double, 'in', isvalue=True),
+            pyf.Argument('m', pyf.default_integer, 'in'),
+            pyf.Argument('x', c_double, 'inout', dimension=['m', '*'])]
+    subr = pyf.Subroutine('cscale', args=args)
+    subr.bind_c = 'c_scale'
+    ret = pyf.Argument('cf', c_double)
+    func = pyf.Function('cf', args=args[:1], return_arg=ret)
+    func.bind_c = 'cf'
+    cy_subr, cy_func = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr, func]))
+    buf = CodeBuffer()
+    cy_subr.generate_wrapper(buf)
+    code = buf.getvalue()
+    ok_('    if x_.shape[0] != (m):\n'
+        '        raise ValueError("x has the wrong shape")\n'
+        '    c_scale(a, &m, <fwr_real_c_double_t*>x_.data)\n'
+        '    return x_\n' in code)
+    ok_('fw_iserr__' not in code)
+    buf = CodeBuffer()
+    cy_func.generate_wrapper(buf)
+    ok_('    fw_ret_arg = cf(a)\n    return fw_ret_arg\n' in buf.getvalue())
+
+def test_strided_array():
+    from fwrap.configuration import Configuration
+    args = [pyf.Argument('x', pyf.default_real, 'inout', dimension=[':'])]
+    subr = pyf.Subroutine('strd', args=args)
+    cfg = Configuration(strided=True)
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr], cfg), cfg)
+    eq_(len(cy_subr.strided_args()), 1)
+    eq_(cy_subr.parallel_spec(), ((), False))
+    buf = CodeBuffer()
+    cy_subr.generate_wrapper(buf)
+    code = buf.getvalue()
+    ok_("    cdef np.ndarray[fwr_real_t, ndim=1, mode='strided'] x_\n"
+        "    cdef fwi_npy_intp_t fw_x_strides[1]\n" in code)
+    ok_('''\
+    if fw_get_strides__(x, fwr_real_t_enum, 1, fw_x_strides):
+        x_ = x
+    else:
+        x_ = np.PyArray_FROMANY(x, fwr_real_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)
+        if x_ is not x:
+            fw_record_copy__('strd', 'x', np.PyArray_NBYTES(x_), 'ignore')
+        fw_get_strides__(x_, fwr_real_t_enum, 1, fw_x_strides)
+    strd_c(<fwi_npy_intp_t*>&x_.shape[0], &fw_x_strides[0], <fwr_real_t*>x_.data, &fw_iserr__, fw_errstr__)
+''' in code)
+    cfg.set('strict', True)
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr], cfg), cfg)
+    eq_(cy_subr.arg_mgr.args[0].pre_call_code()[0],
+        'if not fw_get_strides__(x, fwr_real_t_enum, 1, fw_x_strides):')
+    # a byte-swapped view is copied like any other that doesn't fit.
+    ok_('np.PyArray_ISNOTSWAPPED(obj) and' in cy_wrap._strides_code)
+
+def test_transposed_array():
+    from fwrap.configuration import Configuration
+    args = [pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('a', pyf.default_real, 'in', dimension=['n', '3']),
+            pyf.Argument('b', pyf.default_real, 'out', dimension=['n', '3'])]
+    subr = pyf.Subroutine('trans', args=args)
+    cfg = Configuration()
+    cfg.set('transpose', True, proc='trans', arg='a')
+    cfg.set('transpose', True, proc='trans', arg='b')
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]), cfg)
+    eq_(cy_subr.parallel_spec(), ((), False))
+    buf = CodeBuffer()
+    cy_subr.generate_wrapper(buf)
+    code = buf.getvalue()
+    ok_('    a : fwr_real, 2D array, dimension(n, 3), intent in, '
+        'transposed\n' in code)
+    ok_('    cdef np.ndarray fw_a_t\n' in code)
+    ok_('''\
+    fw_a_t = np.PyArray_FROMANY(a, fwr_real_t_enum, 2, 2, np.NPY_C_CONTIGUOUS)
+    if fw_a_t is not a:
+        fw_record_copy__('trans', 'a', np.PyArray_NBYTES(fw_a_t), 'ignore')
+    a_ = fw_a_t.T
+''' in code)
+    ok_('''\
+        fw_b_shape[1] = (3)
+        b_ = np.PyArray_EMPTY(2, fw_b_shape, fwr_real_t_enum, 1)
+    else:
+        fw_b_t = np.PyArray_FROMANY(b, fwr_real_t_enum, 2, 2, np.NPY_C_CONTIGUOUS)
+''' in code)
+    ok_('    return b_.T\n' in code)
+    cfg.set('strict', True)
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]), cfg)
+    code = cy_subr.arg_mgr.args[1].pre_call_code()
+    ok_('                            np.NPY_C_CONTIGUOUS | np.NPY_ALIGNED)):'
+        in code)
+    eq_(code[-1], 'a_ = a.T')
+
+class test_out_alloc(object):
+
+    def setup(self):
+        self.scalars = set(['n', 'm', 'in'])
+
+    def test_alloc_shape(self):
+        shape = cy_wrap.alloc_shape(pyf.Dimension(['n/2', '0:m', 'in']),
+                                    self.scalars)
+        eq_(shape, ['(fw_idiv__(n, 2))', '((m) - (0) + 1)', '(in__)'])
+        # divisions are grouped as in Fortran, and truncate toward zero.
+        eq_(cy_wrap.alloc_shape(pyf.Dimension(['(n-m)/2*m', '-n/m**2']),
+                                self.scalars),
+            ['(fw_idiv__((n - m), 2) * m)', '(-fw_idiv__(n, m ** 2))'])
+        for dims in ([':'], ['*'], ['size(b)'], ['k'], ['n', 'n*k']):
+            eq_(cy_wrap.alloc_shape(pyf.Dimension(dims), self.scalars), None)
+
+    def test_pre_call_code(self):
+        arg = pyf.Argument('b', dtype=pyf.default_real, dimension=['n'],
+                           intent='out')
+        cy_arg = cy_wrap.CyArrayArgWrapper(fc_wrap.ArrayArgWrapper(arg),
+                                           shape=['(n)'])
+        eq_(cy_arg.intern_declarations()[-1], 'cdef np.npy_intp fw_b_shape[1]')
+        eq_(cy_arg.pre_call_code(),
+            ['if b is None:',
+             '    fw_b_shape[0] = (n)',
+             '    b_ = np.PyArray_EMPTY(1, fw_b_shape, fwr_real_t_enum, 1)',
+             'else:',
+             '    b_ = np.PyArray_FROMANY(b, fwr_real_t_enum, 1, 1, '
+                    'np.NPY_F_CONTIGUOUS)'])
+
+    def test_only_out(self):
+        arg = pyf.Argument('b', dtype=pyf.default_real, dimension=['n'],
+                           intent='inout')
+        cy_arg = cy_wrap.CyArrayArgWrapper(fc_wrap.ArrayArgWrapper(arg),
+                                           shape=['(n)'])
+        eq_(cy_arg.shape, None)
+
+def test_no_instance_dicts():
+    # The IR nodes and argument wrappers use __slots__; a subclass that
+    # forgets to declare them silently brings back a __dict__.
+    args = [pyf.Argument('i', pyf.default_integer, 'in'),
+            pyf.Argument('l', pyf.default_logical, 'inout'),
+            pyf.Argument('z', pyf.default_complex, 'out'),
+            pyf.Argument('c', pyf.CharacterType('fw_char', len='*'), 'in'),
+            pyf.Argument('ca', pyf.CharacterType('fw_char10', len='10'),
+                         'inout', dimension=('n',)),
+            pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('arr', pyf.default_real, 'out',
+                         dimension=('n', '0:n-1')),
+            pyf.HiddenArgument('h', pyf.default_integer, value='n')]
+    param = pyf.Parameter('p', pyf.default_integer, expr='n+1')
+    objs = list(args) + [param, param.expr]
+    for arg in args:
+        objs.append(arg._var)
+        if arg.dimension:
+            objs.append(arg.dimension)
+            for dim in arg.dimension:
+                objs.append(dim)
+                objs.extend(dim.spec)
+    subr = pyf.Subroutine('subr', args=args[:-1])
+    fc_proc = fc_wrap.wrap_pyf_iface([subr])[0]
+    cy_proc = cy_wrap.wrap_fc([fc_proc])[0]
+    objs.extend(fc_proc.arg_man.arg_wrappers)
+    objs.append(fc_wrap.HideArgWrapper(args[-1]))
+    objs.extend(cy_proc.arg_mgr.args)
+    for obj in objs:
+        ok_(not hasattr(obj, '__dict__'), type(obj).__name__)
+
+def test_module_array():
+    array = pyf.Argument('state', pyf.default_real, dimension=['3', 'nmax'])
+    nmax = pyf.Parameter('nmax', pyf.default_integer, expr='10')
+    getter = pyf.ModuleArray(array, 'solver', params=[nmax])
+    cy_getter, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([getter]))
+    eq_(cy_getter.cy_prototype(), 'cpdef api object solver_state()')
+    eq_(cy_getter.parallel_spec(), ((), False))
+    buf = CodeBuffer()
+    cy_getter.generate_wrapper(buf)
+    ok_('''\
+    cdef fwi_npy_intp_t fw_state_shape[2]
+    cdef void *fw_state_data
+    cdef object state_
+    fw_state_data = solver_state_c(&fw_state_shape[0], &fw_state_shape[1])
+    state_ = None
+    if fw_state_data != NULL:
+        state_ = np.PyArray_New(np.ndarray, 2, <np.npy_intp*>fw_state_shape, fwr_real_t_enum, NULL, fw_state_data, 0, np.NPY_FARRAY, None)
+    return state_
+''' in buf.getvalue())
+
+def test_derived_type():
+    point = pyf.DerivedType('point', name='point', module='geom',
+                            components=[('x', pyf.default_real, ())])
+    args = [pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('pts', point, 'out', dimension=['n']),
+            pyf.Argument('c', point, 'inout')]
+    subr = pyf.Subroutine('place', args=args)
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]))
+    eq_(cy_subr.cy_prototype(),
+        'cpdef api object place(fwi_integer_t n, object pts, fwt_point_t c)')
+    eq_(cy_subr.parallel_spec(), ((), False))
+    buf = CodeBuffer()
+    cy_subr.generate_wrapper(buf)
+    code = buf.getvalue()
+    ok_('    c : dict of fwt_point fields, intent inout\n' in code)
+    ok_('''\
+    cdef np.ndarray pts_
+    cdef np.npy_intp fw_pts_shape[1]
+''' in code)
+    ok_('''\
+    if pts is None:
+        fw_pts_shape[0] = (n)
+        pts_ = np.empty((fw_pts_shape[0],), fwt_point, order='F')
+    else:
+        pts_ = np.require(pts, fwt_point, ['F', 'A'])
+        if pts_.ndim != 1:
+            raise ValueError("pts must be a 1D array")
+''' in code)
+    ok_('<fwt_point_t*>pts_.data, &c, ' in code)
+
+def test_ufunc():
+    args = [pyf.Argument('x', pyf.default_real, 'in'),
+            pyf.Argument('y', pyf.default_real, 'in'),
+            pyf.Argument('r', pyf.default_real, 'out')]
+    subr = pyf.Subroutine('polar', args=args)
+    subr.elemental = True
+    cy_subr, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]))
+    eq_(cy_subr.exported_names(), ['polar', 'polar_ufunc'])
+    buf = CodeBuffer()
+    cy_subr.ufunc.generate_wrapper(buf)
+    code = buf.getvalue()
+    ok_('''\
+    cdef char *x = fw_args[0]
+    cdef char *y = fw_args[1]
+    cdef char *r = fw_args[2]
+    cdef fwi_integer_t fw_iserr__
+    cdef fw_character_t fw_errstr__[fw_errstr_len]
+    for fw_i in range(fw_dims[0]):
+        polar_c(<fwr_real_t*>x, <fwr_real_t*>y, <fwr_real_t*>r, &fw_iserr__, fw_errstr__)
+        x += fw_steps[0]
+''' in code)
+    ok_('polar_ufunc_types__[2] = fwr_real_t_enum\n' in code)
+    ok_('polar_ufunc = PyUFunc_FromFuncAndData(polar_ufunc_loops__, '
+        'polar_ufunc_data__, polar_ufunc_types__, 1, 2, 1, PyUFunc_None, '
+        '"polar_ufunc", "polar_ufunc(x, y) -> r' in code)
+    ok_('Its only loop takes (fwr_real, fwr_real); NumPy casts' in code)
+
+    ret = pyf.Argument('hyp', pyf.default_real)
+    func = pyf.Function('hyp', args=args[:2], return_arg=ret)
+    func.elemental = True
+    cy_func, = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([func]))
+    buf = CodeBuffer()
+    cy_func.ufunc.generate_wrapper(buf)
+    ok_('hyp_c(<fwr_real_t*>fw_ret_arg, <fwr_real_t*>x, <fwr_real_t*>y, '
+        in buf.getvalue())
+
+    # no ufunc for procedures that aren't elemental, or with arguments a
+    # ufunc can't take.
+    subr.elemental = False
+    eq_(cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr]))[0].ufunc, None)
+    inout = pyf.Subroutine('acc', args=[args[0],
+                pyf.Argument('s', pyf.default_real, 'inout')])
+    inout.elemental = True
+    eq_(cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([inout]))[0].ufunc, None)
+    logical = pyf.Subroutine('test', args=[args[0],
+                pyf.Argument('t', pyf.default_logical, 'out')])
+    logical.elemental = True
+    eq_(cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([logical]))[0].ufunc, None)
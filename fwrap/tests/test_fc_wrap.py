@@ -6,6 +6,7 @@
 from fwrap import pyf_iface as pyf
 from fwrap import fc_wrap
 from fwrap.code import CodeBuffer
+from fwrap.configuration import Configuration
 
 from tutils import compare
 
@@ -59,6 +60,19 @@ def test_generate_fc_pxd():
     '''
     compare(buf.getvalue(), code)
 
+    from fwrap.configuration import Configuration
+    cfg = Configuration()
+    cfg.set('nogil', True, proc='two_arg')
+    buf = CodeBuffer()
+    fc_wrap.generate_fc_pxd(ast, header_name, buf, cfg)
+    ok_(buf.getvalue().rstrip().endswith('fw_character_t *) nogil'))
+
+    # elemental procedures are always declared nogil, for their ufuncs.
+    two_arg_func.elemental = True
+    buf = CodeBuffer()
+    fc_wrap.generate_fc_pxd(ast, header_name, buf)
+    ok_(buf.getvalue().rstrip().endswith('fw_character_t *) nogil'))
+
 
 def test_gen_fortran_one_arg_func():
     one_arg = pyf.Subroutine(
@@ -382,6 +396,318 @@ def test_many_arrays():
     arr_args_wrapped.generate_wrapper(buf)
     compare(many_arrays_text, buf.getvalue())
 
+def _axpy():
+    return pyf.Subroutine(name='axpy',
+            args=[pyf.Argument('n', pyf.default_integer, 'in'),
+                  pyf.Argument('alpha', pyf.default_real, 'in'),
+                  pyf.Argument('x', pyf.default_real, 'in', ('n',)),
+                  pyf.Argument('y', pyf.default_real, 'inout', ('n',))])
+
+def test_batched_wrapper():
+    wrapper = fc_wrap.BatchedSubroutineWrapper(wrapped=_axpy(), openmp=True)
+    eq_(wrapper.name, 'axpy_batched_c')
+    eq_(wrapper.wrapped_name(), 'axpy_batched')
+    buf = CodeBuffer()
+    wrapper.generate_wrapper(buf)
+    fort_file = '''\
+subroutine axpy_batched_c(n, alpha, x_d1, x_d2, x, y_d1, y_d2, y, fw_iserr__, fw_errstr__) bind(c, name="axpy_batched_c")
+    use fwrap_ktp_mod
+    implicit none
+    integer(kind=fwi_integer_t), intent(in) :: n
+    real(kind=fwr_real_t), intent(in) :: alpha
+    integer(kind=fwi_npy_intp_t), intent(in) :: x_d1
+    integer(kind=fwi_npy_intp_t), intent(in) :: x_d2
+    real(kind=fwr_real_t), dimension(x_d1, x_d2), intent(in) :: x
+    integer(kind=fwi_npy_intp_t), intent(in) :: y_d1
+    integer(kind=fwi_npy_intp_t), intent(in) :: y_d2
+    real(kind=fwr_real_t), dimension(y_d1, y_d2), intent(inout) :: y
+    integer(kind=fwi_integer_t), intent(out) :: fw_iserr__
+    character(kind=fw_character_t, len=1), dimension(fw_errstr_len) :: fw_errstr__
+    interface
+        subroutine axpy(n, alpha, x, y)
+            use fwrap_ktp_mod
+            implicit none
+            integer(kind=fwi_integer_t), intent(in) :: n
+            real(kind=fwr_real_t), intent(in) :: alpha
+            real(kind=fwr_real_t), dimension(n), intent(in) :: x
+            real(kind=fwr_real_t), dimension(n), intent(inout) :: y
+        end subroutine axpy
+    end interface
+    integer(kind=fwi_npy_intp_t) :: fw_ibatch__
+    fw_iserr__ = FW_INIT_ERR__
+    if ((n) .ne. (x_d1)) then
+        fw_iserr__ = FW_ARR_DIM__
+        fw_errstr__ = transfer("x                                                              ", fw_errstr__)
+        fw_errstr__(fw_errstr_len) = C_NULL_CHAR
+        return
+    endif
+    if ((n) .ne. (y_d1)) then
+        fw_iserr__ = FW_ARR_DIM__
+        fw_errstr__ = transfer("y                                                              ", fw_errstr__)
+        fw_errstr__(fw_errstr_len) = C_NULL_CHAR
+        return
+    endif
+    if (y_d2 .ne. x_d2) then
+        fw_iserr__ = FW_ARR_DIM__
+        fw_errstr__ = transfer("y                                                              ", fw_errstr__)
+        fw_errstr__(fw_errstr_len) = C_NULL_CHAR
+        return
+    endif
+    !$omp parallel do
+    do fw_ibatch__ = 1, x_d2
+        call axpy(n, alpha, x(:, fw_ibatch__), y(:, fw_ibatch__))
+    end do
+    !$omp end parallel do
+    fw_iserr__ = FW_NO_ERR__
+end subroutine axpy_batched_c
+'''
+    compare(fort_file, buf.getvalue())
+
+def test_is_batchable():
+    ok_(fc_wrap.is_batchable(_axpy()))
+    scalars = pyf.Subroutine(name='scalars',
+            args=[pyf.Argument('n', pyf.default_integer, 'in')])
+    ok_(not fc_wrap.is_batchable(scalars))
+    inout = pyf.Subroutine(name='inout',
+            args=[pyf.Argument('n', pyf.default_integer, 'inout'),
+                  pyf.Argument('x', pyf.default_real, 'in', ('n',))])
+    ok_(not fc_wrap.is_batchable(inout))
+    chars = pyf.Subroutine(name='chars',
+            args=[pyf.Argument('x', pyf.default_character, 'in', (':',))])
+    ok_(not fc_wrap.is_batchable(chars))
+
+def test_wrap_batched():
+    cfg = Configuration()
+    eq_([proc.name for proc in fc_wrap.wrap_pyf_iface([_axpy()], cfg)],
+        ['axpy_c'])
+    cfg.set('batched', 'openmp', proc='axpy')
+    proc, batched = fc_wrap.wrap_pyf_iface([_axpy()], cfg)
+    eq_(batched.name, 'axpy_batched_c')
+    ok_(batched.openmp)
+    # No parallel loop around a procedure with shared state.
+    axpy = _axpy()
+    axpy.shared_state = frozenset(['save:axpy'])
+    proc, batched = fc_wrap.wrap_pyf_iface([axpy], cfg)
+    ok_(not batched.openmp)
+
+def test_lean_wrapper():
+    args = [pyf.Argument('a', pyf.default_real, 'in'),
+            pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('l', pyf.default_logical, 'in'),
+            pyf.Argument('b', pyf.default_real, 'out')]
+    subr = pyf.Subroutine(name='lean', args=args)
+    wrapper = fc_wrap.SubroutineWrapper(wrapped=subr, lean=True)
+    ok_(not wrapper.arg_man.has_errors)
+    eq_(wrapper.c_prototype(),
+        'void lean_c(fwr_real_t, fwi_integer_t, void *, fwr_real_t *);')
+    buf = CodeBuffer()
+    wrapper.generate_wrapper(buf)
+    fort_file = '''\
+subroutine lean_c(a, n, l, b) bind(c, name="lean_c")
+    use fwrap_ktp_mod
+    implicit none
+    real(kind=fwr_real_t), value, intent(in) :: a
+    integer(kind=fwi_integer_t), value, intent(in) :: n
+    type(c_ptr), value :: l
+    real(kind=fwr_real_t), intent(out) :: b
+    interface
+        subroutine lean(a, n, l, b)
+            use fwrap_ktp_mod
+            implicit none
+            real(kind=fwr_real_t), intent(in) :: a
+            integer(kind=fwi_integer_t), intent(in) :: n
+            logical(kind=fwl_logical_t), intent(in) :: l
+            real(kind=fwr_real_t), intent(out) :: b
+        end subroutine lean
+    end interface
+    logical(kind=fwl_logical_t), pointer :: fw_l
+    call c_f_pointer(l, fw_l)
+    call lean(a, n, fw_l, b)
+end subroutine lean_c
+'''
+    compare(fort_file, buf.getvalue())
+
+def test_lean_keeps_checks():
+    args = [pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('x', pyf.default_real, 'in', ('n',))]
+    subr = pyf.Subroutine(name='checked', args=args)
+    wrapper = fc_wrap.SubroutineWrapper(wrapped=subr, lean=True)
+    ok_(wrapper.arg_man.has_errors)
+    eq_(wrapper.extern_arg_list(),
+        ['n', 'x_d1', 'x', 'fw_iserr__', 'fw_errstr__'])
+    eq_(wrapper.arg_man.arg_wrappers[0].extern_declarations(),
+        ['integer(kind=fwi_integer_t), value, intent(in) :: n'])
+
+def test_strided_wrapper():
+    args = [pyf.Argument('x', pyf.default_real, 'in', (':', ':')),
+            pyf.Argument('y', pyf.default_real, 'inout', (':',)),
+            pyf.Argument('n', pyf.default_integer, 'in', ('3',))]
+    subr = pyf.Subroutine(name='strd', args=args)
+    cfg = Configuration(strided=True)
+    wrapper, = fc_wrap.wrap_pyf_iface([subr], cfg)
+    x, y, n = wrapper.arg_man.arg_wrappers[:3]
+    ok_(x.strided and y.strided and not n.strided)
+    eq_(wrapper.extern_arg_list()[:8],
+        ['x_d1', 'x_d2', 'x_s1', 'x_s2', 'x', 'y_d1', 'y_s1', 'y'])
+    eq_(x.pre_call_code(), ['call c_f_pointer(x, fw_x, (/ x_s2, x_d2 /))'])
+    eq_(y.pre_call_code(),
+        ['call c_f_pointer(y, fw_y, (/ (y_d1 - 1) * y_s1 + 1 /))'])
+    eq_(wrapper.arg_man.call_arg_list(),
+        ['fw_x(1:(x_d1 - 1) * x_s1 + 1:x_s1, 1:x_d2)',
+         'fw_y(1:(y_d1 - 1) * y_s1 + 1:y_s1)', 'n'])
+    arg = pyf.Argument('z', pyf.default_real, 'in', (':', ':', ':'))
+    eq_(fc_wrap.StridedArrayArgWrapper(arg).pre_call_code(),
+        ['call c_f_pointer(z, fw_z, (/ z_s2, z_s3 / z_s2, z_d3 /))'])
+
+def test_strided_per_arg():
+    args = [pyf.Argument('x', pyf.default_real, 'in', (':',)),
+            pyf.Argument('y', pyf.default_real, 'in', (':',))]
+    subr = pyf.Subroutine(name='strd', args=args)
+    cfg = Configuration()
+    cfg.set('strided', True, proc='strd', arg='y')
+    wrapper, = fc_wrap.wrap_pyf_iface([subr], cfg)
+    eq_([argw.strided for argw in wrapper.arg_man.arg_wrappers[:2]],
+        [False, True])
+
+def _c_double():
+    return pyf.RealType(fw_ktp='real_c_double', kind='c_double')
+
+def test_direct_wrapper():
+    args = [pyf.Argument('a', _c_double(), 'in', isvalue=True),
+            pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('x', _c_double(), 'inout', ('n',))]
+    subr = pyf.Subroutine(name='cscale', args=args)
+    subr.bind_c = 'c_scale'
+    wrapper, = fc_wrap.wrap_pyf_iface([subr])
+    ok_(isinstance(wrapper, fc_wrap.DirectProcWrapper))
+    ok_(not wrapper.arg_man.has_errors)
+    eq_(wrapper.name, 'c_scale')
+    eq_(wrapper.c_prototype(),
+        'void c_scale(fwr_real_c_double_t, fwi_integer_t *, '
+        'fwr_real_c_double_t *);')
+    buf = CodeBuffer()
+    wrapper.generate_wrapper(buf)
+    eq_(buf.getvalue(), '')
+
+def test_direct_function():
+    ret = pyf.Argument('cf', _c_double())
+    func = pyf.Function(name='cf', args=[pyf.Argument('a', _c_double(), 'in',
+                                                      isvalue=True)],
+                        return_arg=ret)
+    func.bind_c = 'cf'
+    wrapper, = fc_wrap.wrap_pyf_iface([func])
+    eq_(wrapper.c_prototype(), 'fwr_real_c_double_t cf(fwr_real_c_double_t);')
+
+def test_value_arg():
+    # a VALUE argument of a procedure that still gets a Fortran wrapper.
+    args = [pyf.Argument('a', _c_double(), 'in', isvalue=True),
+            pyf.Argument('c', pyf.default_complex, 'in', isvalue=True)]
+    subr = pyf.Subroutine(name='vals', args=args)
+    wrapper = fc_wrap.SubroutineWrapper(wrapped=subr)
+    eq_(wrapper.c_prototype(),
+        'void vals_c(fwr_real_c_double_t, fwc_complex_t *, fwi_integer_t *, '
+        'fw_character_t *);')
+
+def test_has_checks():
+    n = pyf.Argument('n', pyf.default_integer, 'in')
+    x = pyf.Argument('x', pyf.default_real, 'inout', dimension=['n'])
+    scalars, = fc_wrap.wrap_pyf_iface([pyf.Subroutine('sc', args=[n])])
+    ok_(scalars.arg_man.has_errors)
+    ok_(not scalars.arg_man.has_checks())
+    array, = fc_wrap.wrap_pyf_iface([pyf.Subroutine('arr', args=[n, x])])
+    ok_(array.arg_man.has_checks())
+
+def test_module_procedure():
+    # no interface block: the module supplies it.
+    args = [pyf.Argument('n', pyf.default_integer, 'in')]
+    subr = pyf.Subroutine(name='step', args=args)
+    subr.module = 'solver'
+    wrapper = fc_wrap.SubroutineWrapper(wrapped=subr)
+    buf = CodeBuffer()
+    wrapper.generate_wrapper(buf)
+    good = '''\
+    subroutine step_c(n, fw_iserr__, fw_errstr__) bind(c, name="step_c")
+        use fwrap_ktp_mod
+        use solver, only: step
+        implicit none
+        integer(kind=fwi_integer_t), intent(in) :: n
+        integer(kind=fwi_integer_t), intent(out) :: fw_iserr__
+        character(kind=fw_character_t, len=1), dimension(fw_errstr_len) :: fw_errstr__
+        fw_iserr__ = FW_INIT_ERR__
+        call step(n)
+        fw_iserr__ = FW_NO_ERR__
+    end subroutine step_c
+'''
+    compare(good, buf.getvalue())
+
+def test_derived_type():
+    point = pyf.DerivedType('point', name='point', module='geom',
+                            components=[('x', pyf.default_real, ())])
+    args = [pyf.Argument('n', pyf.default_integer, 'in'),
+            pyf.Argument('pts', point, 'inout', dimension=('n',))]
+    subr = pyf.Subroutine(name='shift', args=args)
+    wrapper = fc_wrap.SubroutineWrapper(wrapped=subr)
+    eq_(wrapper.c_prototype(),
+        'void shift_c(fwi_integer_t *, fwi_npy_intp_t *, fwt_point_t *, '
+        'fwi_integer_t *, fw_character_t *);')
+    buf = CodeBuffer()
+    wrapper.proc_preamble('fwrap_ktp_mod', buf)
+    good = '''\
+    use fwrap_ktp_mod
+    use geom, only: point
+    implicit none
+    integer(kind=fwi_integer_t), intent(in) :: n
+    integer(kind=fwi_npy_intp_t), intent(in) :: pts_d1
+    type(point), dimension(pts_d1), intent(inout) :: pts
+    integer(kind=fwi_integer_t), intent(out) :: fw_iserr__
+    character(kind=fw_character_t, len=1), dimension(fw_errstr_len) :: fw_errstr__
+'''
+    compare(good, buf.getvalue())
+    buf = CodeBuffer()
+    fc_wrap.generate_interface(subr, buf)
+    ok_('        use geom, only: point\n'
+        '        implicit none\n' in buf.getvalue())
+    # a procedure of the type's module uses both from it.
+    subr.module = 'geom'
+    buf = CodeBuffer()
+    wrapper.proc_preamble('fwrap_ktp_mod', buf)
+    ok_('use geom, only: shift, point\n' in buf.getvalue())
+
+def test_module_array():
+    array = pyf.Argument('work', pyf.default_real, dimension=(':', ':'))
+    getter = pyf.ModuleArray(array, 'solver')
+    wrapper, = fc_wrap.wrap_pyf_iface([getter])
+    ok_(isinstance(wrapper, fc_wrap.ModuleArrayWrapper))
+    eq_(wrapper.c_prototype(),
+        'void * solver_work_c(fwi_npy_intp_t *, fwi_npy_intp_t *);')
+    eq_(wrapper.proc_result_name(), 'fw_work_data')
+    buf = CodeBuffer()
+    wrapper.generate_wrapper(buf)
+    good = '''\
+    function solver_work_c(work_d1, work_d2) bind(c, name="solver_work_c")
+        use fwrap_ktp_mod
+        use solver, only: fw_work => work
+        implicit none
+        integer(kind=fwi_npy_intp_t), intent(inout) :: work_d1
+        integer(kind=fwi_npy_intp_t), intent(inout) :: work_d2
+        type(c_ptr) :: solver_work_c
+        solver_work_c = c_null_ptr
+        work_d1 = 0
+        work_d2 = 0
+        if (.not. allocated(fw_work)) return
+        work_d1 = size(fw_work, 1)
+        work_d2 = size(fw_work, 2)
+        if (size(fw_work) .eq. 0) return
+        call fw_loc(fw_work)
+    contains
+        subroutine fw_loc(fw_target)
+            real(kind=fwr_real_t), dimension(work_d1, work_d2), target :: fw_target
+            solver_work_c = c_loc(fw_target)
+        end subroutine fw_loc
+    end function solver_work_c
+'''
+    compare(good, buf.getvalue())
+
 def test_declaration_order():
     args=[
         pyf.Argument('explicit_shape',
@@ -3,6 +3,7 @@
 # All rights reserved. See LICENSE.txt.
 #------------------------------------------------------------------------------
 
+from fwrap import fort_expr
 from fwrap.fort_expr import parse, ExtractNames
 
 from nose.tools import eq_, ok_
@@ -130,3 +131,24 @@ def test_regr_reallitconst():
     for t in tests:
         tstr, res, funcs = t
         yield _tester, tstr, res, funcs
+
+class test_parse_memo(object):
+
+    def setup(self):
+        self.memo_size = fort_expr.PARSE_MEMO_SIZE
+        fort_expr._parse_memo.clear()
+
+    def teardown(self):
+        fort_expr.PARSE_MEMO_SIZE = self.memo_size
+        fort_expr._parse_memo.clear()
+
+    def test_memoized(self):
+        ok_(parse("n+1") is parse("n+1"))
+        ok_(parse("n+1") is not parse("n+2"))
+
+    def test_bounded(self):
+        fort_expr.PARSE_MEMO_SIZE = 4
+        for i in range(10):
+            parse("n+%d" % i)
+            ok_(len(fort_expr._parse_memo) <= 4)
+        _tester("n+9", ['n'])
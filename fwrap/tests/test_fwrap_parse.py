@@ -86,3 +86,258 @@ end function int_args_func
             for arg in func.args],
         ["integer(kind=%d)" % i
             for i in (1,2,4,8)])
+
+def test_parse_parallel():
+    srcs = ['''\
+subroutine subr%d(a, b)
+implicit none
+integer, intent(in) :: a
+real, dimension(a), intent(out) :: b
+b = a
+end subroutine subr%d
+''' % (i, i) for i in range(5)]
+    srcs[2] += '''
+function func2(a)
+implicit none
+integer, intent(in) :: a
+double precision :: func2
+func2 = a
+end function func2
+'''
+    serial = fp.generate_ast(srcs)
+    parallel = fp.generate_ast(srcs, jobs=3)
+    eq_([proc.name for proc in parallel],
+        ['subr0', 'subr1', 'subr2', 'func2', 'subr3', 'subr4'])
+    eq_([proc.name for proc in parallel], [proc.name for proc in serial])
+    for sproc, pproc in zip(serial, parallel):
+        eq_([arg.name for arg in pproc.args], [arg.name for arg in sproc.args])
+        eq_([arg.dtype for arg in pproc.args],
+            [arg.dtype for arg in sproc.args])
+
+def test_shared_state():
+    fcode = '''\
+subroutine pure_subr(a)
+implicit none
+integer, intent(inout) :: a
+a = a + 1
+end subroutine pure_subr
+
+subroutine common_subr(a)
+use iso_c_binding
+implicit none
+integer, intent(inout) :: a
+integer :: b, c
+common /blk/ b, // c
+if (a > 0) then
+    call pure_subr(a)
+end if
+end subroutine common_subr
+
+subroutine caller(a)
+use state_mod
+implicit none
+integer, intent(inout) :: a
+integer :: counter = 0
+call common_subr(a)
+print *, a
+end subroutine caller
+
+subroutine saver(a)
+implicit none
+integer, intent(inout) :: a
+integer, save :: b
+a = b
+end subroutine saver
+'''
+    ast = fp.generate_ast([fcode])
+    eq_([sorted(proc.shared_state) for proc in ast],
+        [[],
+         ['common:_blank', 'common:blk'],
+         ['common:_blank', 'common:blk', 'io', 'module:state_mod',
+          'save:caller'],
+         ['save:saver']])
+    eq_([proc.is_thread_safe() for proc in ast], [True, False, False, False])
+    eq_(ast[2].calls, frozenset(['common_subr']))
+
+BIND_C_SRC = '''\
+subroutine cadd(a, b, n, x) bind(c, name="c_add")
+use iso_c_binding
+implicit none
+real(c_double), value :: a
+real(c_double), intent(in) :: b
+integer(c_int), value :: n
+real(c_double), dimension(n), intent(inout) :: x
+x = x + a + b
+end subroutine cadd
+
+function cf(i) bind(c)
+use iso_c_binding
+implicit none
+integer(c_int), value :: i
+integer(c_int) :: cf
+cf = i
+end function cf
+
+subroutine cshape(m, x) bind(c)
+use iso_c_binding
+implicit none
+integer(c_int), intent(in) :: m
+real(c_float), dimension(m, *) :: x
+end subroutine cshape
+
+subroutine cassumed(x) bind(c)
+use iso_c_binding
+implicit none
+real(c_double), dimension(:) :: x
+end subroutine cassumed
+
+subroutine plain(a)
+implicit none
+integer, intent(in) :: a
+end subroutine plain
+'''
+
+def test_bind_c():
+    cadd, cf, cshape, cassumed, plain = fp.generate_ast([BIND_C_SRC])
+    eq_([proc.bind_c for proc in (cadd, cf, cshape, cassumed, plain)],
+        ['c_add', 'cf', 'cshape', None, None])
+    a, b, n, x = cadd.args
+    eq_((a.isvalue, a.intent), (True, 'in'))
+    eq_((b.isvalue, b.intent), (None, 'in'))
+    eq_(a.dtype.fw_ktp, 'fwr_real_c_double_t')
+    eq_(a.dtype.kind, 'c_double')
+    eq_(n.dtype.fw_ktp, 'fwi_integer_c_int_t')
+    eq_(a.c_declaration(), 'fwr_real_c_double_t a')
+    eq_(cf.return_arg.dtype.fw_ktp, 'fwi_integer_c_int_t')
+
+MODULE_SRC = '''\
+module solver
+implicit none
+integer, parameter :: nmax = 10
+real(kind=8), dimension(3, nmax) :: state
+real(kind=8), allocatable, dimension(:, :) :: work
+real(kind=8), pointer, dimension(:) :: pt
+logical, dimension(2) :: flags
+real(kind=8), dimension(2) :: hidden
+private :: hidden, helper
+contains
+subroutine step(n, x)
+integer, intent(in) :: n
+real(kind=8), dimension(n, nmax), intent(inout) :: x
+x = x * state(1, 1)
+end subroutine step
+function helper(x)
+real(kind=8), intent(in) :: x
+real(kind=8) :: helper
+helper = 2 * x
+end function helper
+end module solver
+
+module consts
+integer, parameter :: nmax = 3
+contains
+subroutine pure_add(a, b)
+integer, intent(in) :: a
+integer, intent(inout) :: b
+b = a + b
+end subroutine pure_add
+end module consts
+'''
+
+def test_module():
+    state, work, step, pure_add = fp.generate_ast([MODULE_SRC])
+    eq_([(proc.name, proc.kind, proc.module) for proc in (state, work)],
+        [('solver_state', 'module_array', 'solver'),
+         ('solver_work', 'module_array', 'solver')])
+    eq_((state.allocatable, work.allocatable), (False, True))
+    eq_(state.array.dimension.attrspec, 'dimension(3, nmax)')
+    eq_(state.shared_state, frozenset(['module:solver']))
+    eq_(step.module, 'solver')
+    eq_(step.shared_state, frozenset(['module:solver']))
+    eq_([param.name for param in step.params], ['nmax'])
+    # a module without variables holds no state.
+    eq_(pure_add.module, 'consts')
+    ok_(pure_add.is_thread_safe())
+
+DERIVED_SRC = '''\
+module geom
+use iso_c_binding
+implicit none
+type, bind(c) :: point
+real(c_double) :: x, y
+integer(c_int) :: id
+real(c_double), dimension(0:2, 2) :: m
+end type point
+type :: plain
+real :: a
+end type plain
+contains
+subroutine shift(n, pts, dx)
+integer, intent(in) :: n
+type(point), dimension(n), intent(inout) :: pts
+real(c_double), intent(in) :: dx
+pts%x = pts%x + dx
+end subroutine shift
+subroutine unwrapped(p)
+type(plain), intent(inout) :: p
+end subroutine unwrapped
+end module geom
+
+subroutine origin(p)
+use geom
+implicit none
+type(point), intent(out) :: p
+p = point(0, 0, 0, 0)
+end subroutine origin
+'''
+
+def test_derived_type():
+    # a derived type that isn't bind(c) can't be passed as a struct.
+    shift, origin = fp.generate_ast([DERIVED_SRC])
+    point = shift.args[1].dtype
+    ok_(isinstance(point, pyf.DerivedType))
+    ok_(origin.args[0].dtype is point)
+    eq_((point.name, point.module, point.fw_ktp),
+        ('point', 'geom', 'fwt_point_t'))
+    eq_([(name, dtype.fw_ktp, extents)
+            for name, dtype, extents in point.components],
+        [('x', 'fwr_real_c_double_t', ()), ('y', 'fwr_real_c_double_t', ()),
+         ('id', 'fwi_integer_c_int_t', ()),
+         ('m', 'fwr_real_c_double_t', (3, 2))])
+    eq_(shift.used_types(), {'geom' : ['point']})
+    eq_(origin.args[0].declaration(), 'type(point), intent(out) :: p')
+
+ELEMENTAL_SRC = '''\
+elemental function hyp(a, b)
+real(8), intent(in) :: a, b
+real(8) :: hyp
+hyp = sqrt(a**2 + b**2)
+end function hyp
+
+pure elemental subroutine polar(x, y, r)
+real(8), intent(in) :: x, y
+real(8), intent(out) :: r
+r = sqrt(x**2 + y**2)
+end subroutine polar
+
+pure real(8) function sq(a)
+real(8), intent(in) :: a
+sq = a * a
+end function sq
+
+impure elemental subroutine count(x, y)
+real(8), intent(in) :: x
+real(8), intent(out) :: y
+integer, save :: ncalls = 0
+ncalls = ncalls + 1
+y = x
+end subroutine count
+'''
+
+def test_elemental():
+    # impure elemental procedures can't be run without the GIL, so they are
+    # wrapped as ordinary ones.
+    hyp, polar, sq, count = fp.generate_ast([ELEMENTAL_SRC])
+    eq_([proc.elemental for proc in (hyp, polar, sq, count)],
+        [True, True, False, False])
+    eq_([arg.name for arg in count.args], ['x', 'y'])
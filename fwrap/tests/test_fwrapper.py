@@ -136,6 +136,137 @@ np.import_array()
 include 'fwrap_ktp.pxi'
 cdef extern from "string.h":
     void *memcpy(void *dest, void *src, size_t n)
+
+class CopyWarning(RuntimeWarning):
+    """Issued when an array argument has to be copied or cast."""
+
+class ParallelMapError(RuntimeError):
+    """Raised by parallel_map() when some of the calls failed.
+
+    errors lists the (index, exception) pairs of the failed calls, and
+    results the results of all the calls, None for those that failed.
+    """
+
+    def __init__(self, errors, results):
+        RuntimeError.__init__(self, "%%d of %%d calls failed, the first "
+                              "(call %%d) with: %%s" %%
+                              (len(errors), len(results),
+                               errors[0][0], errors[0][1]))
+        self.errors = errors
+        self.results = results
+
+import warnings
+
+_copy_stats = {}
+
+def copy_stats():
+    """copy_stats() -> {(procedure, argument) : (copies, bytes)}
+
+    How many times, and how many bytes in all, each array argument was
+    copied or cast on the way in since the module was imported or
+    reset_copy_stats() last called.
+    """
+    return dict(_copy_stats)
+
+def reset_copy_stats():
+    """Forget the copies counted so far."""
+    _copy_stats.clear()
+
+cdef fw_record_copy__(proc, arg, np.npy_intp nbytes, action):
+    copies, total = _copy_stats.get((proc, arg), (0, 0))
+    _copy_stats[proc, arg] = (copies + 1, total + nbytes)
+    if action == 'ignore':
+        return
+    msg = ("array argument '%%s' of '%%s' was copied (%%d bytes)" %%
+           (arg, proc, nbytes))
+    if action == 'error':
+        raise ValueError(msg)
+    warnings.warn(msg, CopyWarning)
+
+import threading
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+cdef fw_prepare_args__(proc, arrays, args):
+    cdef np.ndarray arr
+    args = list(args)
+    for pos, name, dtenum, ndim, action in arrays:
+        if pos >= len(args) or args[pos] is None:
+            continue
+        arr = np.PyArray_FROMANY(args[pos], dtenum, ndim, ndim,
+                                 np.NPY_F_CONTIGUOUS)
+        if arr is not args[pos]:
+            fw_record_copy__(proc, name, np.PyArray_NBYTES(arr), action)
+        args[pos] = arr
+    return args
+
+def _parallel_worker(proc, calls, lock, results, errors):
+    while True:
+        lock.acquire()
+        try:
+            if not calls:
+                return
+            idx, args = calls.pop()
+        finally:
+            lock.release()
+        try:
+            results[idx] = proc(*args)
+        except Exception, e:
+            errors.append((idx, e))
+
+def parallel_map(proc, argtuples, nthreads=None):
+    """parallel_map(proc, argtuples, nthreads=None) -> list
+
+    Call the procedure proc of this module with each tuple of arguments in
+    argtuples, from nthreads threads (by default, one per CPU), and return
+    the list of results.  The array arguments are all converted before the
+    first call.  Procedures that don't release the GIL, or that aren't
+    thread safe, are called one at a time.  If some calls fail, the others
+    still run, and a ParallelMapError is raised.
+    """
+    name = getattr(proc, '__name__', None)
+    if name not in _parallel_specs:
+        raise ValueError("%%r is not a procedure of this module" %% (proc,))
+    arrays, concurrent = _parallel_specs[name]
+    calls = [(idx, fw_prepare_args__(name, arrays, args))
+                for idx, args in enumerate(argtuples)]
+    calls.reverse()
+    results = [None] * len(calls)
+    errors = []
+    lock = threading.Lock()
+    if nthreads is None:
+        nthreads = _cpu_count()
+    if not concurrent:
+        nthreads = 1
+    nthreads = max(1, min(nthreads, len(calls)))
+    if nthreads == 1:
+        _parallel_worker(proc, calls, lock, results, errors)
+    else:
+        threads = [threading.Thread(target=_parallel_worker,
+                                    args=(proc, calls, lock, results, errors))
+                    for idx in range(nthreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if errors:
+        errors.sort()
+        raise ParallelMapError(errors, results)
+    return results
+_parallel_specs = {
+    'empty_func' : ((), False),
+}
+
+cdef inline np.npy_intp fw_idiv__(np.npy_intp a, np.npy_intp b) except? -1:
+    cdef np.npy_intp q = a // b
+    if q < 0 and q * b != a:
+        q += 1
+    return q
 cpdef api object empty_func():
     """
     empty_func() -> fw_ret_arg
@@ -170,3 +301,266 @@ cpdef api object empty_func():
             ok_(isinstance(ctp, dict))
             eq_(sorted(ctp.keys()),
                     ['basetype', 'fwrap_name', 'lang', 'npy_enum', 'odecl'])
+
+class test_write_to_dir(object):
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.pyx')
+
+    def teardown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def set_old_mtime(self):
+        os.utime(self.path, (0, 0))
+
+    def test_write_if_changed(self):
+        buf = CodeBuffer()
+        buf.putln('cimport numpy as np')
+        ok_(fwrapper.write_to_dir(self.dir, 'test.pyx', buf))
+        eq_(open(self.path).read(), 'cimport numpy as np\n')
+        self.set_old_mtime()
+        ok_(not fwrapper.write_to_dir(self.dir, 'test.pyx', buf))
+        eq_(os.path.getmtime(self.path), 0)
+        buf.putln('np.import_array()')
+        ok_(fwrapper.write_to_dir(self.dir, 'test.pyx', buf.getvalue()))
+        eq_(open(self.path).read(),
+                'cimport numpy as np\nnp.import_array()\n')
+        ok_(os.path.getmtime(self.path) > 0)
+        eq_(os.listdir(self.dir), ['test.pyx'])
+
+    def test_mode(self):
+        umask = os.umask(022)
+        try:
+            ok_(fwrapper.write_to_dir(self.dir, 'test.pyx', 'a\n'))
+            eq_(os.stat(self.path).st_mode & 0777, 0644)
+            # a replaced file keeps its mode.
+            os.chmod(self.path, 0600)
+            ok_(fwrapper.write_to_dir(self.dir, 'test.pyx', 'b\n'))
+            eq_(os.stat(self.path).st_mode & 0777, 0600)
+        finally:
+            os.umask(umask)
+
+    def test_generate_unchanged(self):
+        odir = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            ast = fwrapper.parse([test_fwrapper.fsrc])
+            updated, total = fwrapper.generate(ast, 'test')
+            eq_(len(updated), total)
+            for fname in updated:
+                os.utime(fname, (0, 0))
+            updated, total = fwrapper.generate(ast, 'test')
+            eq_(updated, [])
+        finally:
+            os.chdir(odir)
+
+def test_cmdline_over_config():
+    dir = tempfile.mkdtemp()
+    odir = os.getcwd()
+    os.chdir(dir)
+    try:
+        fh = open('src.f90', 'w')
+        fh.write('''\
+subroutine scale(a)
+    implicit none
+    real, dimension(:), intent(inout) :: a
+    a = 2 * a
+end subroutine scale
+''')
+        fh.close()
+        fh = open('test.cfg', 'w')
+        fh.write('[fwrap]\nstrict = false\n')
+        fh.close()
+        fwrapper.fwrapper(False, ['src.f90'], name='test', parse_cache=False,
+                          config='test.cfg', strict=True)
+        ok_('raise ValueError("a must be' in open('test.pyx').read())
+    finally:
+        os.chdir(odir)
+        import shutil
+        shutil.rmtree(dir)
+
+def test_parse_cache_opt_in():
+    # the on-disk parse cache is only used when asked for.
+    dir = tempfile.mkdtemp()
+    odir = os.getcwd()
+    ocache = os.environ.get('FWRAP_CACHE_DIR')
+    os.chdir(dir)
+    os.environ['FWRAP_CACHE_DIR'] = os.path.join(dir, 'cache')
+    try:
+        fh = open('src.f90', 'w')
+        fh.write(test_fwrapper.fsrc)
+        fh.close()
+        fwrapper.fwrapper(False, ['src.f90'], name='test')
+        ok_(not os.path.exists('cache'))
+        fwrapper.fwrapper(False, ['src.f90'], name='test', parse_cache=True)
+        ok_(os.listdir('cache'))
+    finally:
+        os.chdir(odir)
+        if ocache is None:
+            del os.environ['FWRAP_CACHE_DIR']
+        else:
+            os.environ['FWRAP_CACHE_DIR'] = ocache
+        import shutil
+        shutil.rmtree(dir)
+
+class test_shards(object):
+
+    proc_tmpl = '''\
+subroutine subr%d(a)
+    implicit none
+    integer, intent(inout) :: a
+    a = a + %d
+end subroutine subr%d
+'''
+    fsrc = ''.join([proc_tmpl % (i, i, i) for i in range(5)])
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.odir = os.getcwd()
+        os.chdir(self.dir)
+
+    def teardown(self):
+        import shutil
+        os.chdir(self.odir)
+        shutil.rmtree(self.dir)
+
+    def test_shard_ast(self):
+        eq_(cy_wrap.shard_ast(range(5), 3), [[0, 1], [2, 3], [4]])
+        eq_(cy_wrap.shard_ast(range(2), 3), [[0], [1], []])
+        eq_(cy_wrap.shard_ast(range(4), 1), [range(4)])
+
+    def test_generate_shards(self):
+        ast = fwrapper.parse([self.fsrc])
+        updated, total = fwrapper.generate(ast, 'test', shards=2)
+        eq_(sorted(os.listdir(self.dir)),
+            ['fwrap_type_specs.in', 'test.py', 'test_common.py', 'test_fc.f90',
+             'test_fc.h', 'test_fc.pxd', 'test_s0.pxd', 'test_s0.pyx', 'test_s1.pxd',
+             'test_s1.pyx'])
+        eq_(len(updated), total)
+        s0_pxd = open('test_s0.pxd').read()
+        ok_('from test_fc cimport *' in s0_pxd)
+        ok_('subr2(' in s0_pxd)
+        ok_('subr3(' not in s0_pxd)
+        s1_pyx = open('test_s1.pyx').read()
+        ok_("include 'fwrap_ktp.pxi'" in s1_pyx)
+        ok_('cpdef api object subr3(' in s1_pyx)
+        ok_('cpdef api object subr0(' not in s1_pyx)
+        # the shards share one CopyWarning and ParallelMapError.
+        ok_('from test_common import CopyWarning, ParallelMapError\n'
+            in s1_pyx)
+        ok_('class CopyWarning' not in s1_pyx)
+        common = open('test_common.py').read()
+        ok_('class CopyWarning(RuntimeWarning):' in common)
+        ok_('class ParallelMapError(RuntimeError):' in common)
+        compile(common, 'test_common.py', 'exec')
+        mod = open('test.py').read()
+        ok_('from test_s0 import (\n    subr0,\n    subr1,\n    subr2,\n    )'
+                in mod)
+        ok_('from test_s1 import (\n    subr3,\n    subr4,\n    )' in mod)
+        ok_('from test_s0 import (\n    fw_character,\n    fwi_integer,\n'
+            '    )' in mod)
+        ok_('from test_common import (\n    CopyWarning,\n'
+            '    ParallelMapError,\n    )' in mod)
+        ok_('_shard_mods = [test_s0, test_s1]' in mod)
+        compile(mod, 'test.py', 'exec')
+
+    def test_more_shards_than_procs(self):
+        # every shard is written, so a build can depend on all of them, and
+        # those of an earlier run with more shards are removed.
+        ast = fwrapper.parse([self.fsrc])
+        # not written by fwrap.
+        open('test_s9.pyx', 'w').close()
+        fwrapper.generate(ast, 'test', shards=7)
+        ok_('test_s6.pyx' in os.listdir(self.dir))
+        mod = open('test.py').read()
+        ok_('test_s6' in mod and 'from test_s6 import' not in mod)
+        compile(mod, 'test.py', 'exec')
+        open('test_s6.c', 'w').close()
+        fwrapper.generate(ast, 'test', shards=2)
+        eq_(sorted([fname for fname in os.listdir(self.dir)
+                        if fname.startswith('test_s')]),
+            ['test_s0.pxd', 'test_s0.pyx', 'test_s1.pxd', 'test_s1.pyx',
+             'test_s9.pyx'])
+        eq_(fwrapper.read_shard_names(self.dir, 'test'),
+            ['test_s0', 'test_s1'])
+        fwrapper.generate(ast, 'test')
+        eq_(sorted([fname for fname in os.listdir(self.dir)
+                        if fname.startswith('test')]),
+            ['test.pxd', 'test.pyx', 'test_fc.f90', 'test_fc.h',
+             'test_fc.pxd', 'test_s9.pyx'])
+
+    def test_group_ast(self):
+        eq_(cy_wrap.group_ast_by_size(range(5), 2), [[0, 1], [2, 3], [4]])
+        eq_(cy_wrap.group_ast_by_size(range(2), 3), [[0, 1]])
+        srcs = []
+        for idx, procs in enumerate([(0, 1), (2,), (3, 4)]):
+            fname = 'src%d.f90' % idx
+            fh = open(fname, 'w')
+            fh.write(''.join([self.proc_tmpl % (i, i, i) for i in procs]))
+            fh.close()
+            srcs.append(fname)
+        ast = fwrapper.parse(srcs)
+        eq_([proc.source for proc in ast],
+            ['src0.f90', 'src0.f90', 'src1.f90', 'src2.f90', 'src2.f90'])
+        cy_ast = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface(ast))
+        eq_([[proc.name for proc in grp]
+                for grp in cy_wrap.group_ast_by_source(cy_ast)],
+            [['subr0', 'subr1'], ['subr2'], ['subr3', 'subr4']])
+
+    def test_generate_by_size(self):
+        ast = fwrapper.parse([self.fsrc])
+        updated, total = fwrapper.generate(ast, 'test', shards=2,
+                                           shard_by='size')
+        ok_('test_s2.pyx' in os.listdir(self.dir))
+        ok_('test_s3.pyx' not in os.listdir(self.dir))
+        eq_(len(updated), total)
+
+    def test_lazy_import(self):
+        import sys
+        ast = fwrapper.parse([self.fsrc])
+        fwrapper.generate(ast, 'lazytest', shards=2, lazy=True)
+        mod = open('lazytest.py').read()
+        ok_('from lazytest_s0 import' not in mod)
+        # Stand-ins for the compiled shards.
+        for shard, names in [('lazytest_s0', ('subr0', 'subr1', 'subr2',
+                                              'fw_character', 'fwi_integer')),
+                             ('lazytest_s1', ('subr3', 'subr4'))]:
+            fh = open('%s.py' % shard, 'w')
+            for name in names:
+                fh.write('%s = %r\n' % (name, shard))
+            fh.write('def copy_stats():\n'
+                     '    return {(%r, "a") : (1, 4)}\n' % shard)
+            fh.close()
+        modnames = ('lazytest', 'lazytest_common', 'lazytest_s0',
+                    'lazytest_s1')
+        sys.path.insert(0, self.dir)
+        try:
+            import lazytest
+            ok_('lazytest_s0' not in sys.modules)
+            ok_('lazytest_s1' not in sys.modules)
+            eq_(lazytest.subr3, 'lazytest_s1')
+            eq_(lazytest.copy_stats(), {('lazytest_s1', 'a') : (1, 4)})
+            ok_(lazytest.CopyWarning is
+                    sys.modules['lazytest_common'].CopyWarning)
+            ok_('lazytest_s0' not in sys.modules)
+            ok_('lazytest_s1' in sys.modules)
+            ok_('subr0' in dir(lazytest))
+            try:
+                lazytest.subr5
+            except AttributeError:
+                pass
+            else:
+                ok_(False, "no AttributeError for a missing procedure")
+            lazytest.load_all()
+            ok_('lazytest_s0' in sys.modules)
+            eq_(lazytest.fwi_integer, 'lazytest_s0')
+            eq_(sorted(lazytest.__all__),
+                ['CopyWarning', 'ParallelMapError', 'fw_character',
+                 'fwi_integer',
+                 'subr0', 'subr1', 'subr2', 'subr3', 'subr4'])
+        finally:
+            sys.path.remove(self.dir)
+            for modname in modnames:
+                sys.modules.pop(modname, None)
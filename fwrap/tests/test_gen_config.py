@@ -21,6 +21,19 @@ def mock_f2c_types(ctps, *args):
     for ctp in ctps:
         ctp.fc_type = mp[ctp.fwrap_name]
 
+def test_all_dtypes():
+    real8 = pyf_iface.RealType('real_8', kind='8')
+    def subr(name, dtypes):
+        return pyf_iface.Subroutine(name=name,
+                args=[pyf_iface.Argument(name='a%d' % i, dtype=dtype)
+                        for i, dtype in enumerate(dtypes)])
+    ast = [subr('one', [pyf_iface.default_integer, real8]),
+           subr('two', [pyf_iface.RealType('real_8', kind='8'),
+                        pyf_iface.default_integer, pyf_iface.default_real])]
+    eq_(gc.all_dtypes(ast),
+        [pyf_iface.default_integer, real8, pyf_iface.default_real])
+    ok_(gc.all_dtypes(ast)[1] is real8)
+
 class test_genconfig(object):
 
     def setup(self):
@@ -92,3 +105,39 @@ class test_genconfig(object):
         ctps = loads(buf.getvalue())
         for x,y in zip(ctps, self.ctps[2:]):
             _compare(x,y)
+
+def test_derived_type():
+    c_double = pyf_iface.RealType('real_c_double', kind='c_double')
+    point = pyf_iface.DerivedType('point', name='point', module='geom',
+                components=[('x', c_double, ()),
+                            ('m', c_double, (3, 2)),
+                            ('id', pyf_iface.default_integer, ())])
+    subr = pyf_iface.Subroutine(name='one',
+                args=[pyf_iface.Argument(name='p', dtype=point)])
+    eq_(gc.all_dtypes([subr]), [c_double, pyf_iface.default_integer, point])
+    ctp = gc.extract_ctps([subr])[-1]
+    eq_(ctp.fwrap_name, 'fwt_point_t')
+    eq_(ctp.odecl, 'type(point)')
+    eq_(ctp.gen_f_mod(), [])
+    eq_(ctp.gen_c_typedef(),
+        ['typedef struct {',
+         '    fwr_real_c_double_t x;',
+         '    fwr_real_c_double_t m[2][3];',
+         '    fwi_integer_t id;',
+         '} fwt_point_t;'])
+    eq_(ctp.gen_pxd_extern_typedef(),
+        ['ctypedef struct fwt_point_t:',
+         '    fwr_real_c_double_t x',
+         '    fwr_real_c_double_t m[2][3]',
+         '    fwi_integer_t id'])
+    eq_(ctp.gen_pyx_type_obj(),
+        ['fwt_point_t_enum = np.NPY_VOID',
+         "fwt_point = np.dtype([('x', fwr_real_c_double), "
+            "('m', fwr_real_c_double, (2, 3)), ('id', fwi_integer)], "
+            "align=True)"])
+    # the fields survive the type spec file.
+    from cPickle import loads
+    buf = CodeBuffer()
+    gc._generate_type_specs([ctp], buf)
+    spec, = loads(buf.getvalue())
+    eq_(gc.ConfigTypeParam(**spec).fields, ctp.fields)
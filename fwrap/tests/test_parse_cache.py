@@ -0,0 +1,109 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+
+from fwrap import fwrap_parse as fp
+from fwrap.parse_cache import ParseCache, ENTRY_EXT
+
+from nose.tools import ok_, eq_, set_trace
+
+class test_parse_cache(object):
+
+    fsrc = '''\
+subroutine subr%d(a, b)
+implicit none
+integer, intent(in) :: a
+real, dimension(a), intent(out) :: b
+b = a
+end subroutine subr%d
+'''
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ParseCache(cache_dir=self.cache_dir)
+        self.srcs = [self.fsrc % (i, i) for i in range(3)]
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def entries(self):
+        return [fname for fname in os.listdir(self.cache_dir)
+                    if fname.endswith(ENTRY_EXT)]
+
+    def test_roundtrip(self):
+        ast = fp.generate_ast(self.srcs, cache=self.cache)
+        eq_(len(self.entries()), 3)
+        eq_((self.cache.hits, self.cache.misses), (0, 3))
+        cached_ast = fp.generate_ast(self.srcs, cache=self.cache)
+        eq_((self.cache.hits, self.cache.misses), (3, 3))
+        eq_([proc.name for proc in cached_ast], [proc.name for proc in ast])
+        eq_([[arg.dtype for arg in proc.args] for proc in cached_ast],
+            [[arg.dtype for arg in proc.args] for proc in ast])
+
+    def test_only_changed_reparsed(self):
+        fp.generate_ast(self.srcs, cache=self.cache)
+        self.srcs[1] = self.srcs[1].replace('b = a', 'b = 2*a')
+        parsed = []
+        orig_parse_src = fp._parse_src
+        def _parse_src(src):
+            parsed.append(src)
+            return orig_parse_src(src)
+        fp._parse_src = _parse_src
+        try:
+            ast = fp.generate_ast(self.srcs, cache=self.cache)
+        finally:
+            fp._parse_src = orig_parse_src
+        eq_(parsed, [self.srcs[1]])
+        eq_([proc.name for proc in ast], ['subr0', 'subr1', 'subr2'])
+
+    def test_source_file(self):
+        fname = os.path.join(self.cache_dir, 'source.f90')
+        fh = open(fname, 'w')
+        fh.write(self.srcs[0])
+        fh.close()
+        eq_(self.cache.key(fname), self.cache.key(self.srcs[0]))
+
+    def test_source_format(self):
+        # fparser reads the same text as fixed form in a .f90 file and as
+        # pyf (strict free form) in a .pyf one.
+        src = ''.join(['      %s\n' % line
+                            for line in self.srcs[0].splitlines()])
+        keys = []
+        for ext in ('.f90', '.pyf'):
+            fname = os.path.join(self.cache_dir, 'source' + ext)
+            fh = open(fname, 'w')
+            fh.write(src)
+            fh.close()
+            keys.append(self.cache.key(fname))
+        ok_(keys[0] != keys[1])
+
+    def test_corrupt_entry(self):
+        key = self.cache.key(self.srcs[0])
+        fp.generate_ast(self.srcs[:1], cache=self.cache)
+        fh = open(os.path.join(self.cache_dir, key + ENTRY_EXT), 'wb')
+        fh.write('garbage')
+        fh.close()
+        eq_(self.cache.load(key), None)
+        eq_(self.entries(), [])
+
+    def test_lru_eviction(self):
+        fp.generate_ast(self.srcs[:1], cache=self.cache)
+        entry_size = os.path.getsize(
+                os.path.join(self.cache_dir, self.entries()[0]))
+        keys = [self.cache.key(src) for src in self.srcs]
+        fp.generate_ast(self.srcs[1:], cache=self.cache)
+        # make subr0 the oldest entry, then touch it so subr1 is the LRU.
+        for age, key in zip((300, 200, 100), keys):
+            path = os.path.join(self.cache_dir, key + ENTRY_EXT)
+            st = os.stat(path)
+            os.utime(path, (st.st_atime, st.st_mtime - age))
+        ok_(self.cache.load(keys[0]) is not None)
+        self.cache.max_size = 2 * entry_size + entry_size // 2
+        self.cache.prune()
+        eq_(sorted(self.entries()),
+            sorted([keys[0] + ENTRY_EXT, keys[2] + ENTRY_EXT]))
@@ -0,0 +1,128 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from fwrap import fwrapper
+from fwrap.profiling import Profiler, NullProfiler, json
+
+from nose.tools import ok_, eq_, set_trace
+
+class test_profiler(object):
+
+    def test_nested(self):
+        prof = Profiler()
+        prof.start('outer')
+        eq_(prof.call('inner', max, 1, 2), 2)
+        prof.stop('detail')
+        eq_([(phase.name, phase.depth) for phase in prof.phases],
+            [('outer (detail)', 0), ('inner', 1)])
+        for phase in prof.phases:
+            ok_(phase.wall >= 0)
+            ok_(phase.cpu >= 0)
+        ok_(prof.phases[0].wall >= prof.phases[1].wall)
+
+    def test_report(self):
+        prof = Profiler()
+        prof.call('phase', sum, range(10))
+        out = StringIO()
+        prof.report(out)
+        lines = out.getvalue().splitlines()
+        ok_(lines[0].startswith('phase'))
+        ok_('peak rss (MB)' in lines[0])
+        ok_(lines[2].startswith('phase '))
+        eq_(len(lines), 3)
+
+    def test_nested_traced_peak(self):
+        from fwrap import profiling
+
+        class FakeTracemalloc(object):
+            def __init__(self):
+                self.current = self.peak = 0
+            def is_tracing(self):
+                return True
+            def reset_peak(self):
+                self.peak = self.current
+            def get_traced_memory(self):
+                return self.current, self.peak
+            def alloc(self, nbytes):
+                self.current += nbytes
+                self.peak = max(self.peak, self.current)
+
+        fake = FakeTracemalloc()
+        orig = profiling.tracemalloc
+        profiling.tracemalloc = fake
+        try:
+            prof = Profiler()
+            prof.start('outer')
+            fake.alloc(100)
+            fake.alloc(-100)
+            prof.call('inner', fake.alloc, 10)
+            prof.stop()
+        finally:
+            profiling.tracemalloc = orig
+        # the inner phase's reset doesn't hide the outer one's earlier peak.
+        eq_([phase.traced_peak for phase in prof.phases], [100, 10])
+
+    def test_exception(self):
+        prof = Profiler()
+        try:
+            prof.call('fails', int, 'x')
+        except ValueError:
+            pass
+        prof.call('next', max, 1, 2)
+        eq_([(phase.name, phase.depth) for phase in prof.phases],
+            [('fails', 0), ('next', 0)])
+
+    def test_null(self):
+        prof = NullProfiler()
+        eq_(prof.call('phase', max, 1, 2), 2)
+        prof.start('phase')
+        prof.stop()
+        eq_(list(prof.phases), [])
+
+class test_profile_wrap(object):
+
+    fsrc = '''\
+subroutine subr(a, b)
+    implicit none
+    integer, intent(in) :: a
+    real, dimension(a), intent(out) :: b
+    b = a
+end subroutine subr
+'''
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.odir = os.getcwd()
+        os.chdir(self.dir)
+        fh = open('source.f90', 'w')
+        fh.write(self.fsrc)
+        fh.close()
+
+    def teardown(self):
+        os.chdir(self.odir)
+        shutil.rmtree(self.dir)
+
+    def test_phases(self):
+        prof = Profiler()
+        fwrapper.wrap('source.f90', name='test', parse_cache=False,
+                      profiler=prof)
+        names = [phase.name for phase in prof.phases if phase.depth == 1]
+        eq_(names[:3], ['parse', 'wrap_pyf_iface', 'wrap_fc'])
+        ok_('generate_fc_f (test_fc.f90)' in names)
+        ok_('generate_cy_pyx (test.pyx)' in names)
+        eq_(len(names), 9)
+        ok_('reflow_fort' in [phase.name for phase in prof.phases])
+
+    def test_json(self):
+        fwrapper.fwrapper(False, ['source.f90'], name='test',
+                          parse_cache=False, profile_json='prof.json')
+        data = json.load(open('prof.json'))
+        eq_(data['phases'][0]['name'], 'wrap')
+        ok_(data['phases'][0]['wall'] >= 0)
@@ -92,6 +92,32 @@ integer(kind=fwi_integer_t), dimension(d1, d2), intent(in) :: arr
 '''
         eq_(am.arg_declarations(), decls.splitlines())
 
+    def test_pass_order(self):
+        # Declarations whose dependencies come later wait for the next
+        # pass, while those depending on earlier ones stay in this pass.
+        p1 = pyf.Parameter('p1', pyf.default_integer, expr='p2+1')
+        p2 = pyf.Parameter('p2', pyf.default_integer, expr='1')
+        p3 = pyf.Parameter('p3', pyf.default_integer, expr='p2+p1')
+        a = pyf.Argument('a', pyf.default_integer, 'in', dimension=('n',))
+        n = pyf.Argument('n', pyf.default_integer, 'in')
+        m = pyf.Argument('m', pyf.default_integer, 'in', dimension=('p3',))
+        am = pyf.ArgManager([a, n, m], params=[p1, p2, p3])
+        eq_([o.name for o in am.order_declarations()],
+            ['n', 'p2', 'a', 'p1', 'p3', 'm'])
+
+    def test_cycle(self):
+        p1 = pyf.Parameter('p1', pyf.default_integer, expr='p2+1')
+        p2 = pyf.Parameter('p2', pyf.default_integer, expr='p1+1')
+        arg = pyf.Argument('a', pyf.default_integer, 'in',
+                           dimension=('p2',))
+        am = pyf.ArgManager([arg], params=[p1, p2])
+        try:
+            am.order_declarations()
+        except RuntimeError, e:
+            ok_(str(e).endswith('p2 -> p1 -> p2'))
+        else:
+            ok_(False, "no error for circular declarations")
+
 def test_parameter():
     param = pyf.Parameter(name='FOO',
                 dtype=pyf.default_integer, expr='kind(1.0D0)')
@@ -108,6 +134,28 @@ def test_dtype():
     assert_raises(pyf.InvalidNameException,
                         pyf.RealType, 'selected_real_kind(10)')
 
+def test_intern_dtype():
+    from cPickle import dumps, loads
+    int8 = pyf.intern_dtype(pyf.IntegerType('integer_8', kind='8'))
+    ok_(pyf.intern_dtype(pyf.IntegerType('integer_8', kind='8')) is int8)
+    ok_(pyf.intern_dtype(pyf.IntegerType('integer_8', length='8'))
+            is not int8)
+    ok_(pyf.intern_dtype(pyf.IntegerType('integer', kind='kind(0)'))
+            is pyf.default_integer)
+    ok_(loads(dumps(int8, 2)) is int8)
+    ok_(loads(dumps(pyf.c_ptr_type, 2)) is pyf.c_ptr_type)
+    # derived types are only shared if their components are the same.
+    def point(components):
+        return pyf.intern_dtype(pyf.DerivedType('point', name='point',
+                                                module='geom',
+                                                components=components))
+    xy = point([('x', pyf.default_real, ()), ('y', pyf.default_real, ())])
+    ok_(point([('x', pyf.default_real, ()),
+               ('y', pyf.default_real, ())]) is xy)
+    xyz = point([('x', pyf.default_real, (3,))])
+    ok_(xyz is not xy)
+    eq_(xyz.components, [('x', pyf.default_real, (3,))])
+
 def test_valid_fort_name():
     ok_(pyf.valid_fort_name('F12_bar'))
     ok_(pyf.valid_fort_name('a'*63))
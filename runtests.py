@@ -113,13 +113,35 @@ class FwrapCompileTestCase(unittest.TestCase):
         self.projname = os.path.splitext(self.filename)[0] + '_fwrap'
         self.projdir = os.path.join(self.workdir, self.projname)
         fq_fname = os.path.join(os.path.abspath(self.directory), self.filename)
-        argv = ['configure', 'build',
-                '--name=%s' % self.projname,
-                '--outdir=%s' % self.projdir,
-                fq_fname,
-                'install']
+        argv = (['configure', 'build',
+                 '--name=%s' % self.projname,
+                 '--outdir=%s' % self.projdir] +
+                self.fwrapc_options(fq_fname) +
+                [fq_fname,
+                 'install'])
         fwrapc(argv=argv)
 
+    def fwrapc_options(self, fq_fname):
+        # A test can give fwrapc options on its first line, e.g.
+        #   ! fwrapc: --shards=2 --config=name.cfg
+        # where the --config file is relative to the test's directory.
+        fh = open(fq_fname)
+        try:
+            line = fh.readline().strip()
+        finally:
+            fh.close()
+        match = re.match(r'[!cC*]\s*fwrapc:(.*)$', line)
+        if not match:
+            return []
+        opts = []
+        for opt in match.group(1).split():
+            if opt.startswith('--config='):
+                opt = '--config=%s' % os.path.join(
+                        os.path.abspath(self.directory),
+                        opt[len('--config='):])
+            opts.append(opt)
+        return opts
+
     def compile(self, directory, filename, workdir, incdir):
         self.run_wrapper(directory, filename, workdir, incdir)
 
@@ -0,0 +1,9 @@
+        subroutine copy_stats_intents(n, a1, a2)
+            implicit none
+            integer, intent(in) :: n
+            real, dimension(n), intent(in) :: a1
+            real, dimension(n), intent(inout) :: a2
+
+            a2 = a2 + a1
+
+        end subroutine copy_stats_intents
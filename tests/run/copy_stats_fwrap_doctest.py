@@ -0,0 +1,21 @@
+import numpy as np
+from copy_stats_fwrap import *
+
+N = 4
+f32 = np.ones(N, dtype=np.float32)
+f64 = np.ones(N, dtype=np.float64)
+
+__doc__ = u'''
+>>> copy_stats()
+{}
+>>> a2 = copy_stats_intents(N, f32, f32)
+>>> copy_stats()
+{}
+>>> a2 = copy_stats_intents(N, f64, f32)
+>>> a2 = copy_stats_intents(N, f64, f64)
+>>> sorted(copy_stats().items())
+[(('copy_stats_intents', 'a1'), (2, 32)), (('copy_stats_intents', 'a2'), (1, 16))]
+>>> reset_copy_stats()
+>>> copy_stats()
+{}
+'''
@@ -0,0 +1,25 @@
+        module derived_types
+            use iso_c_binding
+            implicit none
+            type, bind(c) :: particle
+                real(c_double) :: x, v
+                integer(c_int) :: id
+            end type particle
+
+        contains
+
+            subroutine advance(n, ps, dt)
+                integer, intent(in) :: n
+                type(particle), dimension(n), intent(inout) :: ps
+                real(c_double), intent(in) :: dt
+                ps%x = ps%x + dt * ps%v
+            end subroutine advance
+
+            subroutine fastest(n, ps, p)
+                integer, intent(in) :: n
+                type(particle), dimension(n), intent(in) :: ps
+                type(particle), intent(out) :: p
+                p = ps(maxloc(abs(ps%v), 1))
+            end subroutine fastest
+
+        end module derived_types
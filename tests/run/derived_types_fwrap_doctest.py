@@ -0,0 +1,21 @@
+import numpy as np
+from derived_types_fwrap import *
+
+ps = np.zeros(3, dtype=fwt_particle)
+ps['v'] = [1.0, -3.0, 2.0]
+ps['id'] = [1, 2, 3]
+
+__doc__ = u'''
+>>> sorted(fwt_particle.names)
+['id', 'v', 'x']
+>>> ps2 = advance(3, ps, 0.5)
+>>> ps2 is ps
+True
+>>> ps['x'].tolist()
+[0.5, -1.5, 1.0]
+>>> p = fastest(3, ps)
+>>> p['id'], p['v']
+(2, -3.0)
+>>> copy_stats()
+{}
+'''
@@ -0,0 +1,14 @@
+elemental function hyp(a, b)
+    implicit none
+    real(kind=8), intent(in) :: a, b
+    real(kind=8) :: hyp
+    hyp = sqrt(a**2 + b**2)
+end function hyp
+
+pure elemental subroutine divmod(n, d, q, r)
+    implicit none
+    integer, intent(in) :: n, d
+    integer, intent(out) :: q, r
+    q = n / d
+    r = n - q * d
+end subroutine divmod
@@ -0,0 +1,31 @@
+from elemental_fwrap import *
+import numpy as np
+
+__doc__ = u'''
+>>> hyp(3, 4)
+5.0
+>>> hyp_ufunc([3, 5], [4, 12]).tolist()
+[5.0, 13.0]
+>>> hyp_ufunc(np.array([[3.], [6.]]), [4, 8]).tolist()
+[[5.0, 8.54400374531753], [7.211102550927978, 10.0]]
+>>> q, r = divmod_ufunc(np.arange(5, dtype=np.int32), 2)
+>>> q.tolist(), r.tolist()
+([0, 0, 1, 1, 2], [0, 1, 0, 1, 0])
+
+There is one loop, for the procedure's own kinds: other argument types
+are cast to them when NumPy's casting rule allows it, and rejected when
+it doesn't.
+
+>>> hyp_ufunc(np.array([3, 5], dtype=np.int16), np.float32(4)).dtype
+dtype('float64')
+>>> try:
+...     divmod_ufunc(np.array([5.5]), 2)
+... except TypeError:
+...     print('TypeError')
+TypeError
+>>> try:
+...     hyp_ufunc(np.array([3+1j]), 4)
+... except TypeError:
+...     print('TypeError')
+TypeError
+'''
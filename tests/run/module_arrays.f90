@@ -0,0 +1,22 @@
+        module module_arrays
+            implicit none
+            integer, parameter :: nmax = 3
+            real(kind=8), dimension(2, nmax) :: state
+            real(kind=8), allocatable, dimension(:) :: work
+            integer, dimension(4), private :: hidden
+
+        contains
+
+            subroutine alloc_work(n)
+                integer, intent(in) :: n
+                if (allocated(work)) deallocate(work)
+                allocate(work(n))
+                work = 0
+            end subroutine alloc_work
+
+            function state_sum()
+                real(kind=8) :: state_sum
+                state_sum = sum(state)
+            end function state_sum
+
+        end module module_arrays
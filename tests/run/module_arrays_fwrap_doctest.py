@@ -0,0 +1,20 @@
+from module_arrays_fwrap import *
+
+__doc__ = u'''
+>>> state = module_arrays_state()
+>>> state.shape
+(2, 3)
+>>> state[:] = 1
+>>> state[1, 2] = 5
+>>> state_sum()
+10.0
+>>> module_arrays_work() is None
+True
+>>> alloc_work(4)
+>>> work = module_arrays_work()
+>>> work.shape
+(4,)
+>>> work[0] = 2
+>>> module_arrays_work()[0]
+2.0
+'''
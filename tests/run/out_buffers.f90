@@ -0,0 +1,12 @@
+        subroutine out_buffers(n, m, a1, a2)
+            implicit none
+            integer, intent(in) :: n, m
+            real, dimension(n), intent(in) :: a1
+            real, dimension(n, 0:m), intent(out) :: a2
+            integer :: j
+
+            do j = 0, m
+                a2(:, j) = a1 * j
+            enddo
+
+        end subroutine out_buffers
@@ -0,0 +1,19 @@
+import numpy as np
+from out_buffers_fwrap import *
+
+a1 = np.arange(3, dtype=np.float32)
+buf = np.empty((3, 2), dtype=np.float32, order='F')
+
+__doc__ = u'''
+>>> a2 = out_buffers(3, 1, a1, None)
+>>> a2.shape, a2.dtype == np.float32, a2.flags.f_contiguous
+((3, 2), True, True)
+>>> a2[:, 1]
+array([ 0.,  1.,  2.], dtype=float32)
+>>> out_buffers(3, 1, a1 + 1, buf) is buf
+True
+>>> buf[:, 1]
+array([ 1.,  2.,  3.], dtype=float32)
+>>> copy_stats()
+{}
+'''
@@ -0,0 +1,19 @@
+! fwrapc: --shards=2 --config=shard_warnings.cfg
+subroutine first(n)
+    implicit none
+    integer, intent(inout) :: n
+    n = n + 1
+end subroutine first
+
+subroutine second(n)
+    implicit none
+    integer, intent(inout) :: n
+    n = n + 2
+end subroutine second
+
+subroutine scale(n, a)
+    implicit none
+    integer, intent(in) :: n
+    real, dimension(n), intent(inout) :: a
+    a = 2 * a
+end subroutine scale
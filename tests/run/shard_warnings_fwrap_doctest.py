@@ -0,0 +1,29 @@
+import warnings
+import numpy as np
+from shard_warnings_fwrap import *
+import shard_warnings_fwrap_s0, shard_warnings_fwrap_s1
+
+a32 = np.ones(3, dtype=np.float32)
+
+__doc__ = u'''
+The shards share the package's CopyWarning and ParallelMapError, so they
+also apply to scale, which isn't in the first shard.
+
+>>> hasattr(shard_warnings_fwrap_s0, 'scale')
+False
+>>> hasattr(shard_warnings_fwrap_s1, 'scale')
+True
+>>> saved = warnings.filters[:]
+>>> warnings.simplefilter('error', CopyWarning)
+>>> try:
+...     scale(3, np.ones(3))
+... except CopyWarning, e:
+...     print e
+array argument 'a' of 'scale' was copied (12 bytes)
+>>> warnings.filters[:] = saved
+>>> try:
+...     parallel_map(scale, [(3, a32), (4, a32)])
+... except ParallelMapError, e:
+...     print [idx for idx, exc in e.errors]
+[1]
+'''